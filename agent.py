@@ -9,28 +9,21 @@ load_dotenv()
 
 print(" Chargement des modules...")
 try:
-    from langchain_mistralai import ChatMistralAI
     from langchain.agents import AgentExecutor, create_react_agent
     from langchain.tools import tool
     from langchain_core.prompts import PromptTemplate
     from mindcare_tools import MindCareTools
+    from mindcare_llm_pool import PooledChatMistral, load_api_keys
     print(" Modules chargés.")
 except ImportError as e:
     print(f" Erreur Import : {e}")
     sys.exit(1)
 
-# --- 1. SYSTÈME DE MULTI-CLÉS (FAILOVER) ---
-print("\n Test des clés API Mistral...")
+# --- 1. SYSTÈME DE MULTI-CLÉS (POOL + FAILOVER) ---
+print("\n Chargement des clés API Mistral...")
 
-# Liste des clés à tester (depuis le .env)
-potential_keys = [
-    os.getenv("MISTRAL_KEY_1"),
-    os.getenv("MISTRAL_KEY_2"),
-    os.getenv("MISTRAL_API_KEY") # Au cas où une clé unique traîne
-]
-
-# On nettoie la liste (enlève les vides)
-valid_keys = [k for k in potential_keys if k and len(k) > 10]
+# Liste des clés (depuis le .env : MISTRAL_KEY_1, MISTRAL_KEY_2, MISTRAL_API_KEY)
+valid_keys = load_api_keys()
 
 # Si aucune clé trouvée dans le .env, on demande manuellement
 if not valid_keys:
@@ -38,31 +31,12 @@ if not valid_keys:
     manual_key = getpass.getpass(" Entrez une clé manuellement : ").strip()
     valid_keys.append(manual_key)
 
-active_llm = None
-
-# BOUCLE DE TEST DES CLÉS
-for index, key in enumerate(valid_keys):
-    print(f"    Tentative avec la Clé #{index + 1}...", end=" ")
-    try:
-        # On tente une connexion simple
-        test_llm = ChatMistralAI(api_key=key, model="mistral-large-latest", temperature=0.2)
-        # On envoie un "ping" (un message vide ou très court) pour vérifier que la clé marche
-        test_llm.invoke("Ping")
-        
-        # Si ça passe sans erreur, on garde cette configuration
-        print(" SUCCÈS !")
-        active_llm = test_llm
-        # On définit la variable globale pour que les autres outils LangChain soient contents
-        os.environ["MISTRAL_API_KEY"] = key 
-        break # On sort de la boucle, on a trouvé une clé qui marche
-    except Exception as e:
-        print(f" ÉCHEC.")
-        # print(f"      Raison : {e}") # Décommenter pour voir l'erreur technique
-
-if active_llm is None:
-    print("\n ERREUR FATALE : Aucune clé API ne fonctionne.")
-    print("   -> Vérifiez votre fichier .env ou vos crédits Mistral.")
-    sys.exit(1)
+# Le pool répartit les requêtes sur toutes les clés et bascule automatiquement
+# sur une autre clé en cas de 429, de timeout ou de clé révoquée.
+active_llm = PooledChatMistral(api_keys=valid_keys, model="mistral-large-latest", temperature=0.2)
+# On définit la variable globale pour que les autres outils LangChain soient contents
+os.environ.setdefault("MISTRAL_API_KEY", valid_keys[0])
+print(f" {len(valid_keys)} clé(s) dans le pool.")
 
 # --- 2. OUTILS ---
 try:
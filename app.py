@@ -1,20 +1,26 @@
 import streamlit as st
-import time
 import pandas as pd
 import altair as alt
 import tiktoken 
-from langchain_core.messages import HumanMessage, AIMessage
+import uuid
+from functools import lru_cache
+from mindcare_startup import phase
 
 # --- IMPORTS BACKEND ---
 try:
-    from final_agent import agent_executor
-    from mindcare_tools import MindCareTools, LOCATIONS 
+    with phase("app:backend"):
+        from final_agent import agent_executor, MINDCARE_TOOLS
+        from mindcare_tools import LOCATIONS, TurnContext, use_turn
+        from mindcare_streaming import FinalAnswerStreamHandler
+        from mindcare_tracing import TRACER
+        from mindcare_sessions import get_session_store
+        from mindcare_crisis import get_crisis_screener
+        from mindcare_events import get_event_log
+        from mindcare_turns import TurnBuffer, pool_stats
 except ImportError:
     st.error(" Fichiers manquants. Assurez-vous d'être dans le bon dossier.")
     st.stop()
 
-tools_instance = MindCareTools()
-
 # --- CONFIGURATION DE LA PAGE ---
 st.set_page_config(
     page_title="MINDCARE AI",
@@ -44,16 +50,51 @@ EMOTION_COLORS = {
 }
 
 # --- INITIALISATION MÉMOIRE ---
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "emotion_log" not in st.session_state:
-    st.session_state.emotion_log = {k: 0 for k in EMOTION_COLORS.keys()}
-if "emotion_timeline" not in st.session_state:
-    st.session_state.emotion_timeline = []
+with phase("app:session_store"):
+    SESSION_STORE = get_session_store()
+with phase("app:crisis_screener"):
+    CRISIS_SCREENER = get_crisis_screener()
+with phase("app:event_log"):
+    EVENT_LOG = get_event_log()  # Agrégats d'émotions de toutes les sessions, tenus à jour en O(1)
+
+
+def restore_session(session_id):
+    """Recharge une session persistée : agrégats + fenêtre des derniers tours (émotions : EVENT_LOG)."""
+    saved = SESSION_STORE.load_session(session_id)
+    st.session_state.session_id = session_id
+    st.session_state.turns = TurnBuffer()  # Historique compact ; messages LangChain construits à l'appel
+    st.session_state.total_co2 = 0.0
+    st.session_state.ttft_log = []
+    st.session_state.turn_count = 0
+    st.session_state.crisis_turns = []
+    if saved is None:
+        return
+    st.session_state.total_co2 = saved["total_co2"]
+    st.session_state.turn_count = saved["turns"]
+    for turn_row in saved["recent_turns"]:
+        st.session_state.turns.append("user", turn_row["user_text"], turn_row["emotion"], turn_row["score"] or 0.0)
+        st.session_state.turns.append("assistant", turn_row["ai_text"])
+        if turn_row["ttft"] is not None:
+            st.session_state.ttft_log.append(turn_row["ttft"])
+        if turn_row["crisis"]:
+            st.session_state.crisis_turns.append({"Step": turn_row["seq"], "Catégorie": turn_row["crisis"]})
+
+
+# Session persistante : l'identifiant voyage dans l'URL (?sid=...) et survit aux rechargements
+if "session_id" not in st.session_state:
+    restore_session(st.query_params.get("sid") or uuid.uuid4().hex)
+st.query_params["sid"] = st.session_state.session_id
+
+if "turns" not in st.session_state:
+    st.session_state.turns = TurnBuffer()
 if "show_kpi" not in st.session_state:
     st.session_state.show_kpi = False
 if "total_co2" not in st.session_state:
     st.session_state.total_co2 = 0.0
+if "ttft_log" not in st.session_state:
+    st.session_state.ttft_log = []
+if "crisis_turns" not in st.session_state:
+    st.session_state.crisis_turns = []
 
 
 def get_emotion_score(emotion_name):
@@ -63,11 +104,18 @@ def get_emotion_score(emotion_name):
     }
     return mapping.get(emotion_name.lower(), 0.0)
 
-def calculate_co2(text_input, text_output):
-    """Calcule l'empreinte carbone EXACTE."""
+@lru_cache(maxsize=1)
+def get_token_encoder():
+    """Encodeur tiktoken construit une seule fois (coûteux à charger)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+def calculate_co2(turn, text_output):
+    """Calcule l'empreinte carbone EXACTE (tokens du message comptés une fois par tour)."""
     try:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        tokens = len(encoding.encode(text_input + text_output))
+        encoding = get_token_encoder()
+        if turn.input_tokens is None:
+            turn.input_tokens = len(encoding.encode(turn.message))
+        tokens = turn.input_tokens + len(encoding.encode(text_output))
         return round(tokens * 0.0002, 5)
     except:
         return 0.0
@@ -81,13 +129,10 @@ st.markdown("##### *Votre compagnon de soutien émotionnel intelligent*")
 st.info("💡 **Info:** Je suis connecté à Mistral Large et j'utilise un modèle de Régression Logistique pour analyser vos émotions.")
 
 # Affichage Historique
-for message in st.session_state.chat_history:
-    if isinstance(message, HumanMessage):
-        with st.chat_message("user", avatar="👤"):
-            st.markdown(message.content)
-    elif isinstance(message, AIMessage):
-        with st.chat_message("assistant", avatar="🤖"):
-            st.markdown(message.content)
+AVATARS = {"user": "👤", "assistant": "🤖"}
+for role, text in st.session_state.turns:
+    with st.chat_message(role, avatar=AVATARS[role]):
+        st.markdown(text)
 
 # Saisie
 user_input = st.chat_input("Exprimez ce que vous ressentez...")
@@ -95,27 +140,32 @@ user_input = st.chat_input("Exprimez ce que vous ressentez...")
 if user_input:
     with st.chat_message("user", avatar="👤"):
         st.markdown(user_input)
-    st.session_state.chat_history.append(HumanMessage(content=user_input))
+    user_index = st.session_state.turns.append("user", user_input)
 
-    # Analyse Technique
+    st.session_state.turn_count += 1
+
+    # Filtre de crise (quelques µs) : réponse d'ancrage immédiate, avant toute analyse ou appel LLM
+    crisis = CRISIS_SCREENER.screen(user_input)
+    if crisis:
+        with st.chat_message("assistant", avatar="🤖"):
+            st.markdown(crisis.response)
+        st.session_state.turns.append("assistant", crisis.response, shared=True)  # Texte commun à toutes les sessions
+        st.session_state.crisis_turns.append({"Step": st.session_state.turn_count, "Catégorie": crisis.category})
+
+    # Analyse Technique : une seule analyse par tour, partagée avec l'agent et ses outils
     try:
-        raw_analysis = tools_instance.classify_emotion(user_input)
+        # Dans le try : un modèle illisible (manifeste invalide, fichier manquant) ne fait pas tomber la page
+        turn = MINDCARE_TOOLS.analyze_turn(user_input)
+        raw_analysis = turn.analysis
         detected_emotion = raw_analysis.get('emotion', 'unknown').lower()
         confidence = raw_analysis.get('confidence', 0)
         # On récupère bien les secondaires ici
         secondary = raw_analysis.get('secondary_emotions', {})
-        
-        cap_emotion = detected_emotion.capitalize()
-        if cap_emotion in st.session_state.emotion_log:
-            st.session_state.emotion_log[cap_emotion] += 1
-        elif "Unknown" in st.session_state.emotion_log:
-             st.session_state.emotion_log["Unknown"] += 1
-            
-        score = get_emotion_score(detected_emotion)
-        st.session_state.emotion_timeline.append(
-            {"Step": len(st.session_state.emotion_timeline) + 1, "Score": score, "Emotion": cap_emotion}
-        )
-    except Exception:
+        st.session_state.turns.set_emotion(user_index, detected_emotion, get_emotion_score(detected_emotion))
+    except Exception as e:
+        # L'agent reçoit une analyse "unknown" : ses outils ne retentent pas le classifieur défaillant
+        turn = TurnContext(user_input, {"error": f"Analyse indisponible ({e})", "emotion": "unknown", "confidence": 0.0})
+        raw_analysis = turn.analysis
         detected_emotion = "unknown"
         confidence = 0
         secondary = {}
@@ -125,31 +175,52 @@ if user_input:
         message_placeholder = st.empty()
         with st.spinner("Analyse en cours..."):
             try:
-                response = agent_executor.invoke({
-                    "input": user_input,
-                    "chat_history": st.session_state.chat_history
-                })
+                # Streaming réel : les tokens de la Final Answer arrivent au fil de l'eau
+                stream_handler = FinalAnswerStreamHandler(
+                    on_text=lambda text: message_placeholder.markdown(text + "▌")
+                )
+                # Traçage structuré du tour (LLM, outils, tokens, cache)
+                trace_handler = TRACER.handler(session_id=st.session_state.session_id)
+                with use_turn(turn):
+                    response = agent_executor.invoke(
+                        {
+                            "input": user_input,
+                            # Seule la fenêtre envoyée au modèle est convertie en messages
+                            "chat_history": st.session_state.turns.window_text()
+                        },
+                        config={"callbacks": [stream_handler, trace_handler]}
+                    )
                 ai_response = response["output"]
+                message_placeholder.markdown(ai_response)
+
+                # TTFT : si rien n'a été streamé (ex: erreur de parsing), on prend la latence totale
+                ttft = stream_handler.ttft if stream_handler.ttft is not None else stream_handler.elapsed
+                st.session_state.ttft_log.append(ttft)
                 
-                # Simulation écriture
-                full_response = ""
-                for chunk in ai_response.split():
-                    full_response += chunk + " "
-                    time.sleep(0.05)
-                    message_placeholder.markdown(full_response + "▌")
-                message_placeholder.markdown(full_response)
-                
-                st.session_state.chat_history.append(AIMessage(content=ai_response))
+                st.session_state.turns.append("assistant", ai_response)
                 
                 # --- CALCUL GREEN AI ---
-                cost = calculate_co2(user_input, ai_response)
+                cost = calculate_co2(turn, ai_response)
                 st.session_state.total_co2 += cost
+
+                # --- PERSISTANCE (écriture asynchrone, regroupée) ---
+                # Journal d'émotions (agrégats O(1)) alimenté au même endroit que la base : un tour
+                # dont l'agent échoue n'est compté nulle part, et le journal rechargé au redémarrage
+                # depuis la base est identique à celui tenu en mémoire
+                EVENT_LOG.append(st.session_state.session_id, detected_emotion.capitalize(),
+                                 get_emotion_score(detected_emotion), float(confidence))
+                SESSION_STORE.append_turn(
+                    st.session_state.session_id, user_input, ai_response,
+                    emotion=detected_emotion.capitalize(), confidence=float(confidence),
+                    score=get_emotion_score(detected_emotion), co2=cost, ttft=ttft,
+                    crisis=crisis.category if crisis else None
+                )
                 
                 # --- ZONE DEBUG AMÉLIORÉE (CORRECTION ICI) ---
                 with st.expander("🔍 Analyse Technique & Impact"):
                     
                     # Ligne 1 : Les indicateurs principaux
-                    c1, c2, c3 = st.columns(3)
+                    c1, c2, c3, c4 = st.columns(4)
                     with c1:
                         st.metric("Émotion ML", f"{detected_emotion.upper()}", f"{confidence:.0%}")
                     with c2:
@@ -157,7 +228,40 @@ if user_input:
                         st.metric("Positivité", f"{get_emotion_score(detected_emotion)}")
                     with c3:
                         st.metric("Coût Carbone", f"{cost} g")
+                    with c4:
+                        st.metric("Premier token", f"{ttft:.2f} s")
                     
+                    # Ligne 1 bis : Où le tour a passé son temps
+                    turn_span = trace_handler.turn or {}
+                    t1, t2, t3, t4 = st.columns(4)
+                    t1.metric("Durée du tour", f"{turn_span.get('wall_ms', 0) / 1000:.2f} s")
+                    t2.metric("Itérations ReAct", turn_span.get("iterations", 0))
+                    t3.metric("Appels LLM / outils", f"{turn_span.get('llm_calls', 0)} / {turn_span.get('tool_calls', 0)}")
+                    t4.metric("Tokens (in/out)", f"{turn_span.get('prompt_tokens', 0)} / {turn_span.get('completion_tokens', 0)}")
+                    st.caption(f"Analyse émotionnelle calculée une fois, réutilisée {turn.reuses} fois par l'agent.")
+                    if raw_analysis.get("fallback"):
+                        st.caption(f"Langue détectée : {raw_analysis['language']}, pas de classifieur dédié : "
+                                   f"analyse par le classifieur {raw_analysis['model_language']}, confiance réduite.")
+                    elif raw_analysis.get("language"):
+                        st.caption(f"Langue détectée : {raw_analysis['language']} "
+                                   f"(classifieur {raw_analysis['model_language']}).")
+                    if crisis:
+                        st.caption(f"Filtre de crise : « {crisis.phrase} » ({crisis.category}) détecté en "
+                                   f"{crisis.elapsed_us:.0f} µs, réponse d'ancrage affichée avant l'agent.")
+                    text_stats = MINDCARE_TOOLS.text_features(user_input)
+                    st.caption(f"Message : {text_stats['word_count']} mots, {text_stats['caps_ratio']:.0%} de majuscules, "
+                               f"{text_stats['punct_count']} ! / ?")
+
+                    # Pourquoi : n-grammes qui tirent vers l'émotion la plus probable
+                    top_label = max(raw_analysis.get("all_scores", {"Unknown": 0}).items(), key=lambda kv: kv[1])[0]
+                    try:
+                        reasons = MINDCARE_TOOLS.explain_emotion(user_input).get(top_label, [])
+                    except Exception:
+                        reasons = []
+                    if reasons:
+                        st.caption(f"Pourquoi {top_label} : " + ", ".join(f"« {ngram} » (+{weight:.2f})"
+                                                                         for ngram, weight in reasons))
+
                     st.divider()
                     
                     # Ligne 2 : Les émotions secondaires avec barres de progression
@@ -185,10 +289,8 @@ with st.sidebar:
     st.title("Tableau de Bord")
     
     if st.button("🗑️ Nouvelle Session", type="primary"):
-        st.session_state.chat_history = []
-        st.session_state.emotion_log = {k: 0 for k in EMOTION_COLORS.keys()}
-        st.session_state.emotion_timeline = []
-        st.session_state.total_co2 = 0.0
+        restore_session(uuid.uuid4().hex)
+        st.query_params["sid"] = st.session_state.session_id
         st.session_state.show_kpi = False
         st.rerun()
         
@@ -200,21 +302,37 @@ with st.sidebar:
     
     st.divider()
 
-    # 2. GRAPHIQUES
-    if sum(st.session_state.emotion_log.values()) > 0:
-        dom_emotion = max(st.session_state.emotion_log, key=st.session_state.emotion_log.get)
-    else:
-        dom_emotion = "-"
-        
+    # 2. GRAPHIQUES (agrégats incrémentaux : rien n'est recalculé sur tout l'historique)
+    dom_emotion = EVENT_LOG.dominant(st.session_state.session_id)
+
     st.subheader("📊 Analyse temps réel")
     col1, col2 = st.columns(2)
-    col1.metric("Messages", len(st.session_state.emotion_timeline))
+    col1.metric("Messages", st.session_state.turn_count)
     col2.metric("Dominante", dom_emotion)
     
+    st.metric("🙂 Humeur lissée", f"{EVENT_LOG.mood(st.session_state.session_id):+.2f}")
     st.metric("🌿 Impact Carbone Total", f"{st.session_state.total_co2:.4f} gCO2")
+    if st.session_state.ttft_log:
+        ttft_median = sorted(st.session_state.ttft_log)[len(st.session_state.ttft_log) // 2]
+        st.metric("⚡ Premier token (médiane)", f"{ttft_median:.2f} s")
+    if st.session_state.crisis_turns:
+        steps = ", ".join(str(c["Step"]) for c in st.session_state.crisis_turns)
+        st.warning(f"🚨 Signaux de crise détectés aux messages : {steps}")
 
-    if len(st.session_state.emotion_timeline) > 0:
-        df_time = pd.DataFrame(st.session_state.emotion_timeline)
+    turn_stats = st.session_state.turns.stats()
+    st.caption(f"🧠 Historique en mémoire : {turn_stats['memory_bytes'] / 1024:.1f} Ko "
+               f"({turn_stats['messages']} messages, {turn_stats['shared_messages']} partagés ; "
+               f"table commune : {pool_stats()['texts']} textes)")
+
+    with st.expander("⏱️ Spans (processus)"):
+        trace_summary = TRACER.summary()
+        if trace_summary:
+            st.dataframe(pd.DataFrame(trace_summary).T[["count", "p50_ms", "p95_ms", "prompt_tokens", "completion_tokens", "cache_hits"]])
+        else:
+            st.caption("Aucun span enregistré.")
+
+    df_time = EVENT_LOG.timeline(st.session_state.session_id)  # Derniers points seulement
+    if len(df_time) > 0:
         line = alt.Chart(df_time).mark_line(interpolate='monotone', color='gray').encode(
             x=alt.X('Step', axis=alt.Axis(tickMinStep=1)),
             y=alt.Y('Score', scale=alt.Scale(domain=[-1.5, 1.5]))
@@ -230,6 +348,14 @@ with st.sidebar:
     else:
         st.info("En attente de données...")
 
+    with st.expander("🌍 Toutes les sessions"):
+        g1, g2 = st.columns(2)
+        g1.metric("Messages analysés", EVENT_LOG.size)
+        g2.metric("Dominante globale", EVENT_LOG.dominant())
+        st.caption(f"Humeur lissée globale : {EVENT_LOG.mood():+.2f}")
+        windows = EVENT_LOG.window_dominants(last=24)
+        st.dataframe(windows[windows["messages"] > 0].iloc[::-1], hide_index=True)
+
     st.divider()
 
     # 3. ANALYSE COMPARATIVE (BILAN)
@@ -0,0 +1,204 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter, RecursiveCharacterTextSplitter
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from mindcare_tools import RAG_TOP_K, HashingEmbeddings
+from mindcare_tracing import percentile
+
+try:
+    from langchain_community.vectorstores import FAISS
+except ImportError:
+    print(" Modules RAG manquants (pip install faiss-cpu langchain-community)")
+    sys.exit(1)
+
+# Qualité et latence de la recherche dans le manuel (query_knowledge_base) : des requêtes
+# annotées avec le passage attendu sont rejouées pour chaque découpage et chaque mode de
+# recherche. Par défaut les embeddings sont calculés localement (hachage de n-grammes de
+# caractères) : le banc tourne hors ligne, sans clé API.
+
+# --- CONFIGURATION ---
+GUIDE_PATH = "psychology_guide.txt"
+QUERIES_PATH = "scenarios/retrieval_queries.jsonl"
+KS = (1, RAG_TOP_K, 5)
+SEARCH_K = 10               # Profondeur de recherche pour le MRR
+MMR_FETCH_K = 10
+RRF_K = 60                  # Constante de la fusion par rang (hybride)
+REPEATS = 5                 # Mesures par requête (la médiane est retenue)
+
+# Découpages comparés ; "production" reprend build_rag.py
+CHUNKINGS = {
+    "production": lambda: CharacterTextSplitter(chunk_size=500, chunk_overlap=50),
+    "lignes": lambda: CharacterTextSplitter(separator="\n", chunk_size=200, chunk_overlap=0),
+    "recursif_300": lambda: RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=50),
+    "large_1000": lambda: CharacterTextSplitter(chunk_size=1000, chunk_overlap=100),
+}
+MODES = ("dense", "mmr", "tfidf", "hybrid")
+
+
+def get_embeddings(backend):
+    if backend == "hashing":
+        return HashingEmbeddings()
+    from langchain_mistralai import MistralAIEmbeddings
+    load_dotenv()
+    api_key = os.getenv("MISTRAL_API_KEY") or os.getenv("MISTRAL_KEY_1")
+    if not api_key:
+        print(" Clé API manquante pour --embeddings mistral. Vérifiez votre fichier .env")
+        sys.exit(1)
+    return MistralAIEmbeddings(api_key=api_key, model="mistral-embed")
+
+
+def load_queries(path=QUERIES_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RetrievalIndex:
+    """Passages d'un découpage, indexés en dense (FAISS) et en lexical (TF-IDF)."""
+
+    def __init__(self, chunks, embeddings):
+        self.chunks = chunks
+        t0 = time.perf_counter()
+        # Position du passage en métadonnée : deux passages au texte identique restent distincts
+        self.vector_db = FAISS.from_documents(
+            [Document(page_content=c, metadata={"chunk": i}) for i, c in enumerate(chunks)], embeddings)
+        self.tfidf = TfidfVectorizer(strip_accents="unicode", sublinear_tf=True)
+        self.tfidf_matrix = self.tfidf.fit_transform(chunks)
+        self.build_s = time.perf_counter() - t0
+
+    def search(self, mode, query, k=SEARCH_K):
+        """Indices des passages, du plus au moins pertinent."""
+        k = min(k, len(self.chunks))
+        if mode == "dense":
+            docs = self.vector_db.similarity_search(query, k=k)
+        elif mode == "mmr":
+            docs = self.vector_db.max_marginal_relevance_search(query, k=k, fetch_k=max(k, MMR_FETCH_K))
+        elif mode == "tfidf":
+            scores = (self.tfidf_matrix @ self.tfidf.transform([query]).T).toarray().ravel()
+            return np.argsort(-scores, kind="stable")[:k].tolist()
+        elif mode == "hybrid":
+            # Fusion par rang réciproque (RRF) : robuste aux échelles de score différentes
+            fused = {}
+            for ranking in (self.search("dense", query, k), self.search("tfidf", query, k)):
+                for rank, i in enumerate(ranking):
+                    fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+            return sorted(fused, key=lambda i: -fused[i])[:k]
+        else:
+            raise ValueError(f"Mode inconnu : {mode}")
+        return [d.metadata["chunk"] for d in docs]
+
+
+def relevant_chunks(chunks, expected):
+    """Passages contenant l'un des extraits attendus (le découpage peut en dupliquer un)."""
+    anchors = [a.lower() for a in expected]
+    return {i for i, c in enumerate(chunks) if any(a in c.lower() for a in anchors)}
+
+
+def random_reciprocal_rank(n_chunks, n_relevant, depth=SEARCH_K):
+    """Espérance de 1/rang du premier passage pertinent si les n_chunks passages sont classés au hasard."""
+    if n_relevant == 0:
+        return 0.0
+    total = math.comb(n_chunks, n_relevant)
+    return sum(math.comb(n_chunks - rank, n_relevant - 1) / total / rank
+               for rank in range(1, min(n_chunks, depth) + 1))
+
+
+def evaluate(index, queries, mode, repeats=REPEATS):
+    """
+    recall@k (passage attendu dans les k premiers), MRR et latence médiane par requête.
+    recall@k vaut None quand k >= nombre de passages (1.0 par construction) ; mrr_random
+    est le MRR d'un classement au hasard, à comparer au MRR mesuré.
+    """
+    rows = []
+    for q in queries:
+        relevant = relevant_chunks(index.chunks, q["expected"])
+        latencies = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            ranking = index.search(mode, q["query"])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        rank = next((r for r, i in enumerate(ranking, 1) if i in relevant), None)
+        rows.append({
+            "query": q["query"], "lang": q.get("lang"), "rank": rank,
+            "latency_ms": round(sorted(latencies)[len(latencies) // 2], 3),
+            "relevant": len(relevant),
+        })
+    latencies = [r["latency_ms"] for r in rows]
+    n_chunks = len(index.chunks)
+    summary = {f"recall@{k}": round(float(np.mean([r["rank"] is not None and r["rank"] <= k for r in rows])), 3)
+               if k < n_chunks else None for k in KS}
+    summary["mrr"] = round(float(np.mean([1.0 / r["rank"] if r["rank"] else 0.0 for r in rows])), 3)
+    summary["mrr_random"] = round(float(np.mean([random_reciprocal_rank(n_chunks, r["relevant"]) for r in rows])), 3)
+    summary["p50_ms"] = round(percentile(latencies, 50), 3)
+    summary["p95_ms"] = round(percentile(latencies, 95), 3)
+    by_lang = {}
+    for lang in sorted({r["lang"] for r in rows if r["lang"]}):
+        ranks = [r["rank"] for r in rows if r["lang"] == lang]
+        by_lang[lang] = round(float(np.mean([1.0 / r if r else 0.0 for r in ranks])), 3)
+    summary["mrr_by_lang"] = by_lang
+    return summary, rows
+
+
+def print_report(report):
+    header = " ".join(f"{'R@' + str(k):>6}" for k in KS)
+    print(f"\n {'découpage':<14} {'passages':>8} {'mode':<7} {header} {'MRR':>6} {'hasard':>6} "
+          f"{'p50 ms':>8} {'p95 ms':>8}  MRR/langue")
+    for config, result in report["configs"].items():
+        for mode, summary in result["modes"].items():
+            # n/a : k >= nombre de passages, le rappel vaut 1 par construction
+            recalls = " ".join(f"{'n/a':>6}" if summary[f"recall@{k}"] is None else f"{summary[f'recall@{k}']:6.2f}"
+                               for k in KS)
+            langs = " ".join(f"{lang}={v:.2f}" for lang, v in summary["mrr_by_lang"].items())
+            print(f" {config:<14} {result['chunks']:>8} {mode:<7} {recalls} {summary['mrr']:6.3f} {summary['mrr_random']:6.3f} "
+                  f"{summary['p50_ms']:8.3f} {summary['p95_ms']:8.3f}  {langs}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Banc de recherche du manuel : recall@k, MRR et latence.")
+    parser.add_argument("--embeddings", choices=["hashing", "mistral"], default="hashing",
+                        help="hashing = local, hors ligne ; mistral = mistral-embed (clé API, réseau)")
+    parser.add_argument("--chunkings", default=",".join(CHUNKINGS), help="Découpages (ex: production,lignes)")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--verbose", action="store_true", help="Détail par requête (rang et latence)")
+    parser.add_argument("--out", default=None, help="Rapport JSON (optionnel)")
+    args = parser.parse_args()
+
+    with open(GUIDE_PATH, encoding="utf-8") as f:
+        guide = f.read()
+    queries = load_queries(args.queries)
+    embeddings = get_embeddings(args.embeddings)
+    print(f" {len(queries)} requêtes annotées, embeddings : {args.embeddings}, "
+          f"production : k={RAG_TOP_K} (query_knowledge_base)")
+
+    report = {"embeddings": args.embeddings, "queries": len(queries), "configs": {}}
+    for config in args.chunkings.split(","):
+        chunks = CHUNKINGS[config]().split_text(guide)
+        index = RetrievalIndex(chunks, embeddings)
+        missing = [q["query"] for q in queries if not relevant_chunks(chunks, q["expected"])]
+        if missing:
+            print(f" [{config}] extrait attendu introuvable pour : {missing}")
+        result = {"chunks": len(chunks), "build_s": round(index.build_s, 3), "modes": {}}
+        for mode in args.modes.split(","):
+            summary, rows = evaluate(index, queries, mode, args.repeats)
+            result["modes"][mode] = dict(summary, per_query=rows)
+            if args.verbose:
+                print(f"\n --- {config} / {mode} ---")
+                for r in rows:
+                    print(f"   rang {str(r['rank'] or '-'):>2}  {r['latency_ms']:7.3f} ms  [{r['lang']}] {r['query']}")
+        report["configs"][config] = result
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n Rapport : {args.out}")
@@ -0,0 +1,241 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import deque
+from multiprocessing import Pool
+
+import pandas as pd
+
+# Version "passage à l'échelle" de prepare_finetuning.py : les sources sont lues en flux,
+# transformées par une chaîne de générateurs, dédupliquées par hash de contenu puis
+# écrites en shards de taille bornée (gzip) par plusieurs processus, avec un manifest.
+
+# --- CONFIGURATION ---
+ADVICE_CSV = "conseils_emotions.csv"
+SESSIONS_DB = "sessions/mindcare_sessions.sqlite"
+OUTPUT_DIR = "finetuning_shards"
+SHARD_MAX_BYTES = 64 * 1024 * 1024   # Taille (non compressée) maximale d'un shard
+CSV_CHUNK_ROWS = 10000
+DB_FETCH_ROWS = 5000
+
+SYSTEM_PROMPT = "You are MindCare, an empathetic mental health assistant."
+
+# Mêmes variations que prepare_finetuning.py (Data Augmentation simple)
+TEMPLATES = [
+    "I feel {emotion}",
+    "I am feeling very {emotion} today",
+    "Why do I feel {emotion}?",
+]
+
+
+# --- SOURCES (LECTURE PARESSEUSE) ---
+def iter_advice_csv(path):
+    """(émotion, réponse idéale) par ligne du CSV de conseils, lu par blocs."""
+    for chunk in pd.read_csv(path, chunksize=CSV_CHUNK_ROWS):
+        for emotion, advice, note in zip(chunk["emotion"], chunk["advice"], chunk["notes"]):
+            yield str(emotion).strip().lower(), f"{advice} {note}"
+
+
+def iter_session_turns(db_path):
+    """(message, réponse) des conversations enregistrées par le SessionStore."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute("SELECT user_text, ai_text FROM turns ORDER BY session_id, seq")
+        while True:
+            rows = cursor.fetchmany(DB_FETCH_ROWS)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+
+def iter_jsonl(path):
+    """Exemples déjà au format chat ({"messages": [...]}), compressés ou non."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# --- TRANSFORMATIONS (GÉNÉRATEURS) ---
+def chat_example(user_message, assistant_response):
+    """Structure JSONL standard (OpenAI/Mistral format)."""
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": assistant_response},
+        ]
+    }
+
+
+def expand_templates(pairs, templates=TEMPLATES):
+    """Chaque (émotion, réponse) devient un exemple par template."""
+    for emotion, response in pairs:
+        for template in templates:
+            yield chat_example(template.format(emotion=emotion), response)
+
+
+def turns_to_examples(turns):
+    for user_text, ai_text in turns:
+        if user_text and ai_text:
+            yield chat_example(user_text.strip(), ai_text.strip())
+
+
+def serialize(examples):
+    """Ligne JSONL canonique (clés triées) : deux exemples identiques donnent les mêmes octets."""
+    for example in examples:
+        yield (json.dumps(example, ensure_ascii=False, sort_keys=True) + "\n").encode("utf-8")
+
+
+def dedupe(lines, stats):
+    """Écarte les doublons exacts ; seul un digest de 16 octets est gardé par ligne."""
+    seen = set()
+    for line in lines:
+        stats["read"] += 1
+        digest = hashlib.blake2b(line, digest_size=16).digest()
+        if digest in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(digest)
+        yield line
+
+
+def chunk_by_size(lines, max_bytes):
+    """Regroupe les lignes en shards d'au plus `max_bytes` (non compressés)."""
+    shard, size = [], 0
+    for line in lines:
+        if shard and size + len(line) > max_bytes:
+            yield shard
+            shard, size = [], 0
+        shard.append(line)
+        size += len(line)
+    if shard:
+        yield shard
+
+
+# --- ÉCRITURE (PROCESSUS DU POOL) ---
+def write_shard(args):
+    """Écrit un shard (compression gzip dans le processus fils) et renvoie son entrée de manifest."""
+    out_dir, index, lines, compress = args
+    name = f"shard-{index:05d}.jsonl" + (".gz" if compress else "")
+    path = os.path.join(out_dir, name)
+    data = b"".join(lines)
+    payload = gzip.compress(data, compresslevel=6, mtime=0) if compress else data
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)  # Jamais de shard à moitié écrit
+    return {
+        "file": name,
+        "records": len(lines),
+        "bytes": len(data),
+        "stored_bytes": len(payload),
+        "sha256": hashlib.sha256(payload).hexdigest(),
+    }
+
+
+def build_dataset(examples, out_dir=OUTPUT_DIR, shard_max_bytes=SHARD_MAX_BYTES, compress=True,
+                  workers=None, sources=None):
+    """
+    Consomme le flux d'exemples et écrit les shards + manifest.json. Retourne le manifest.
+    Le dataset est assemblé dans un dossier temporaire voisin qui remplace ensuite out_dir :
+    aucun shard d'un build précédent (plus gros) ne survit à côté du nouveau manifest.
+    """
+    out_dir = os.path.normpath(out_dir)
+    if os.path.isdir(out_dir) and os.listdir(out_dir) and \
+            not os.path.exists(os.path.join(out_dir, "manifest.json")):
+        raise ValueError(f"{out_dir} n'est pas un dossier de dataset (pas de manifest.json) : refus de le remplacer")
+    staging = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    try:
+        manifest = _build_into(examples, staging, shard_max_bytes, compress, workers, sources)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    previous = f"{out_dir}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, previous)
+    os.replace(staging, out_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def _build_into(examples, out_dir, shard_max_bytes, compress, workers, sources):
+    workers = workers or os.cpu_count() or 1
+    stats = {"read": 0, "duplicates": 0}
+    shards = []
+    t0 = time.perf_counter()
+
+    with Pool(processes=workers) as pool:
+        pending = deque()
+        shard_stream = chunk_by_size(dedupe(serialize(examples), stats), shard_max_bytes)
+        for index, lines in enumerate(shard_stream):
+            pending.append(pool.apply_async(write_shard, ((out_dir, index, lines, compress),)))
+            # Au plus 2 shards en attente par processus : mémoire bornée
+            while len(pending) >= 2 * workers:
+                shards.append(pending.popleft().get())
+        while pending:
+            shards.append(pending.popleft().get())
+
+    manifest = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sources": sources or [],
+        "templates": TEMPLATES,
+        "system_prompt": SYSTEM_PROMPT,
+        "compression": "gzip" if compress else None,
+        "shard_max_bytes": shard_max_bytes,
+        "records_read": stats["read"],
+        "duplicates_removed": stats["duplicates"],
+        "records_written": sum(s["records"] for s in shards),
+        "elapsed_s": round(time.perf_counter() - t0, 2),
+        "shards": shards,
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def iter_sources(csv_path=None, sessions_db=None, jsonl_paths=()):
+    """Chaîne toutes les sources demandées en un seul flux d'exemples."""
+    if csv_path:
+        yield from expand_templates(iter_advice_csv(csv_path))
+    if sessions_db:
+        yield from turns_to_examples(iter_session_turns(sessions_db))
+    for path in jsonl_paths:
+        yield from iter_jsonl(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construction du dataset de fine-tuning (flux, shards, manifest).")
+    parser.add_argument("--csv", default=ADVICE_CSV, help="CSV de conseils (vide pour l'ignorer)")
+    parser.add_argument("--sessions", default=None, help=f"Base de sessions SQLite (ex: {SESSIONS_DB})")
+    parser.add_argument("--jsonl", action="append", default=[], help="Exemples chat JSONL(.gz) supplémentaires")
+    parser.add_argument("--out-dir", default=OUTPUT_DIR)
+    parser.add_argument("--shard-mb", type=float, default=SHARD_MAX_BYTES / 1024 ** 2)
+    parser.add_argument("--no-compress", action="store_true", help="Shards .jsonl bruts au lieu de .jsonl.gz")
+    parser.add_argument("--workers", type=int, default=None, help="Processus d'écriture (défaut : tous les cœurs)")
+    args = parser.parse_args()
+
+    sources = [p for p in [args.csv, args.sessions, *args.jsonl] if p]
+    print(f" Construction du dataset depuis : {', '.join(sources)}")
+    manifest = build_dataset(
+        iter_sources(args.csv or None, args.sessions, args.jsonl),
+        out_dir=args.out_dir,
+        shard_max_bytes=int(args.shard_mb * 1024 ** 2),
+        compress=not args.no_compress,
+        workers=args.workers,
+        sources=sources,
+    )
+    print(f" {manifest['records_written']} exemples écrits en {len(manifest['shards'])} shard(s) "
+          f"({manifest['duplicates_removed']} doublons écartés, {manifest['elapsed_s']}s)")
+    print(f" Manifest : {os.path.join(args.out_dir, 'manifest.json')}")
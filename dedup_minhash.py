@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Détection des quasi-doublons (MinHash + LSH) entre et dans les splits d'entraînement.
+# drop_duplicates() ne voit que les copies exactes ; ici deux messages sont doublons si la
+# similarité de Jaccard de leurs n-grammes de mots dépasse THRESHOLD. Coût ~linéaire :
+# pas de comparaison de toutes les paires, seulement des messages tombés dans un même seau.
+
+# --- CONFIGURATION ---
+SPLITS = {"train": "splits/train.csv", "val": "splits/val.csv", "test": "splits/test.csv"}
+OUTPUT_DIR = "splits_dedup"
+SHINGLE_WORDS = 3
+NUM_PERM = 128
+THRESHOLD = 0.7             # Jaccard estimé minimal pour confirmer un doublon
+# Poids des faux positifs / faux négatifs LSH pour le choix des bandes : chaque candidat est
+# vérifié ensuite, un faux positif ne coûte qu'une comparaison, un faux négatif est un doublon raté
+FP_WEIGHT, FN_WEIGHT = 0.1, 0.9
+BATCH_DOCS = 2000           # Documents signés par bloc (mémoire bornée)
+# Les splits d'évaluation sont prioritaires : en cas de fuite, c'est train qui perd la ligne
+SPLIT_PRIORITY = ["test", "val", "train"]
+
+
+def shingles(text, k=SHINGLE_WORDS):
+    """Hash (uint32) des k-grammes de mots du texte normalisé."""
+    words = re.findall(r"\w+", str(text).lower())
+    if len(words) < k:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + k]) for i in range(len(words) - k + 1)]
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+
+class MinHasher:
+    """Signatures MinHash vectorisées : une passe NumPy par bloc de documents."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=42):
+        rng = np.random.default_rng(seed)
+        # Hachage multiply-shift : ((a*x + b) mod 2^64) >> 32, a impair sur 64 bits.
+        # Pas de modulo premier (lent en uint64) et de bons bits de poids fort.
+        self.a = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, texts):
+        """Matrice (n_docs, num_perm) des minima des permutations."""
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        for start in range(0, len(texts), BATCH_DOCS):
+            batch = [shingles(t) for t in texts[start:start + BATCH_DOCS]]
+            lengths = np.array([len(s) for s in batch])
+            offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+            hashes = (self.a * np.concatenate(batch)[None, :] + self.b) >> np.uint64(32)
+            out[start:start + len(batch)] = np.minimum.reduceat(hashes, offsets, axis=1).T
+        return out
+
+
+def _integrate(f, a, b, steps=200):
+    """Intégrale de f sur [a, b] (règle du point milieu, f vectorisée)."""
+    if b <= a:
+        return 0.0
+    width = (b - a) / steps
+    return float(f(a + width * (np.arange(steps) + 0.5)).sum() * width)
+
+
+def optimal_bands(threshold=THRESHOLD, num_perm=NUM_PERM, fp_weight=FP_WEIGHT, fn_weight=FN_WEIGHT):
+    """
+    (bandes, lignes) minimisant l'aire pondérée des faux positifs (Jaccard < seuil mais
+    candidat) et des faux négatifs (Jaccard >= seuil mais jamais dans un même seau), comme
+    datasketch. P(candidat | s) = 1 - (1 - s^lignes)^bandes.
+    """
+    best, best_error = None, float("inf")
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_pos = _integrate(lambda s: 1 - (1 - s ** rows) ** bands, 0.0, threshold)
+            false_neg = _integrate(lambda s: (1 - s ** rows) ** bands, threshold, 1.0)
+            error = fp_weight * false_pos + fn_weight * false_neg
+            if error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:  # Compression de chemin
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+
+def lsh_clusters(signatures, bands, rows, threshold=THRESHOLD):
+    """
+    Regroupe les documents dont une bande de signature est identique, puis confirme chaque
+    lien par la similarité estimée (part de minima égaux) avec le représentant du seau.
+    Chaque seau est parcouru une fois : coût linéaire même pour un seau très peuplé.
+    """
+    n = len(signatures)
+    uf = UnionFind(n)
+    candidates = confirmed = 0
+    mixer = np.random.default_rng(7).integers(1, 1 << 61, size=rows, dtype=np.uint64)
+    for band in range(bands):
+        band_keys = (signatures[:, band * rows:(band + 1) * rows] * mixer).sum(axis=1)  # Modulo 2^64
+        order = np.argsort(band_keys, kind="stable")
+        sorted_keys = band_keys[order]
+        bucket_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        bucket_ends = np.r_[bucket_starts[1:], n]
+        for start, end in zip(bucket_starts, bucket_ends):
+            if end - start < 2:
+                continue
+            head = order[start]
+            members = order[start + 1:end]
+            similarity = (signatures[members] == signatures[head]).mean(axis=1)
+            candidates += len(members)
+            for member in members[similarity >= threshold]:
+                uf.union(head, member)
+                confirmed += 1
+    roots = np.array([uf.find(i) for i in range(n)])
+    return roots, {"candidate_pairs": int(candidates), "confirmed_links": int(confirmed)}
+
+
+def deduplicate(frames, threshold=THRESHOLD, num_perm=NUM_PERM, bands=None):
+    """
+    frames : {split: DataFrame avec 'text'}. Retourne (splits dédupliqués, rapport).
+    Un seul exemplaire par groupe de quasi-doublons est gardé, dans le split le plus prioritaire.
+    bands=None : découpage de la signature déduit du seuil (optimal_bands).
+    """
+    t0 = time.perf_counter()
+    if bands is None:
+        bands, rows = optimal_bands(threshold, num_perm)
+    else:
+        rows = num_perm // bands
+    all_rows = pd.concat([df.assign(_split=name) for name, df in frames.items()], ignore_index=True)
+    signatures = MinHasher(num_perm).signatures(all_rows["text"].astype(str).tolist())
+    roots, lsh_stats = lsh_clusters(signatures, bands, rows, threshold)
+    all_rows["_cluster"] = roots
+
+    # Le représentant d'un groupe : split le plus prioritaire, puis première occurrence
+    all_rows["_priority"] = all_rows["_split"].map({s: i for i, s in enumerate(SPLIT_PRIORITY)})
+    keep_idx = all_rows.sort_values(["_cluster", "_priority"], kind="stable").drop_duplicates("_cluster").index
+    all_rows["_keep"] = False
+    all_rows.loc[keep_idx, "_keep"] = True
+
+    # Fuites : groupes présents dans plusieurs splits
+    splits_per_cluster = all_rows.groupby("_cluster")["_split"].agg(lambda s: frozenset(s))
+    all_rows["_splits"] = all_rows["_cluster"].map(splits_per_cluster)
+    leakage = {}
+    names = list(frames)
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            shared = splits_per_cluster[splits_per_cluster.map(lambda s: a in s and b in s)]
+            pairs = all_rows[all_rows["_cluster"].isin(shared.index) & all_rows["_split"].isin([a, b])]
+            examples = []
+            for cluster in shared.index[:5]:
+                group = pairs[pairs["_cluster"] == cluster]
+                examples.append({split: group.loc[group["_split"] == split, "text"].iloc[0] for split in (a, b)})
+            leakage[f"{a}/{b}"] = {
+                "clusters": int(len(shared)),
+                f"{a}_rows": int((pairs["_split"] == a).sum()),
+                f"{b}_rows": int((pairs["_split"] == b).sum()),
+                "examples": examples,
+            }
+
+    report = {
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "bands": bands,
+        "rows": rows,
+        # Probabilité qu'une paire au seuil exact devienne candidate
+        "recall_at_threshold": round(1 - (1 - threshold ** rows) ** bands, 3),
+        "shingle_words": SHINGLE_WORDS,
+        **lsh_stats,
+        "splits": {},
+        "leakage": leakage,
+    }
+    deduped = {}
+    for name, df in frames.items():
+        rows = all_rows[all_rows["_split"] == name]
+        kept = rows[rows["_keep"]]
+        internal = rows[~rows["_keep"] & rows["_splits"].map(len).eq(1)]
+        report["splits"][name] = {
+            "rows": int(len(rows)),
+            "kept": int(len(kept)),
+            "removed_internal_duplicates": int(len(internal)),
+            "removed_cross_split": int(len(rows) - len(kept) - len(internal)),
+        }
+        deduped[name] = kept[df.columns.tolist()].reset_index(drop=True)
+    report["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    return deduped, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Déduplication MinHash LSH des splits + rapport de fuite.")
+    parser.add_argument("--out-dir", default=OUTPUT_DIR)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Jaccard minimal (0-1)")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM)
+    parser.add_argument("--bands", type=int, default=None,
+                        help="Bandes LSH (défaut : déduit de --threshold et --num-perm)")
+    args = parser.parse_args()
+
+    frames = {name: pd.read_csv(path) for name, path in SPLITS.items()}
+    deduped, report = deduplicate(frames, args.threshold, args.num_perm, args.bands)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, df in deduped.items():
+        df.to_csv(os.path.join(args.out_dir, f"{name}.csv"), index=False)
+    with open(os.path.join(args.out_dir, "leakage_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f" Déduplication terminée en {report['elapsed_s']}s (seuil Jaccard {args.threshold}, "
+          f"{report['bands']} bandes x {report['rows']} lignes, rappel au seuil {report['recall_at_threshold']:.0%})")
+    for name, stats in report["splits"].items():
+        print(f"   {name:<5} : {stats['rows']} -> {stats['kept']} lignes "
+              f"({stats['removed_internal_duplicates']} doublons internes, {stats['removed_cross_split']} fuites)")
+    print(" Fuites entre splits :")
+    for pair, stats in report["leakage"].items():
+        print(f"   {pair:<10} : {stats['clusters']} groupe(s) de quasi-doublons")
+    print(f" Splits dédupliqués et rapport : {args.out_dir}/")
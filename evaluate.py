@@ -1,65 +1,92 @@
+import argparse
+import hashlib
+import json
+import math
 import os
+import re
 import sys
+import threading
 import pandas as pd
 import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 from langchain_mistralai import ChatMistralAI
 from langchain_core.prompts import ChatPromptTemplate
+from mindcare_cache import get_llm_cache
+from mindcare_fake_llm import ScriptedChatModel
+from mindcare_tracing import TokenCounter
+from mindcare_agent import build_agent_executor
 
-# Import de votre agent MindCare
+# Import de votre agent MindCare (LLM + outils, réassemblés par essai plus bas)
 try:
-    from final_agent import agent_executor as mindcare_agent
+    from final_agent import active_llm, MINDCARE_TOOLS
 except ImportError:
     print(" Erreur : Impossible d'importer 'final_agent.py'.")
     sys.exit(1)
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    print(" pyarrow absent : résultats écrits en CSV (pip install pyarrow pour le Parquet).")
+
+try:
+    from scipy import stats as scipy_stats
+except ImportError:
+    scipy_stats = None
+
 # --- CONFIGURATION ---
 load_dotenv()
+# MINDCARE_LLM_BACKEND=fake : baseline, juge et agent tournent sur un faux LLM local
+LLM_BACKEND = os.getenv("MINDCARE_LLM_BACKEND", "mistral")
+SCENARIOS_PATH = "scenarios/ab_scenarios.jsonl"
+CHECKPOINT_PATH = "evaluation_checkpoint.jsonl"
+RESULTS_PATH = "evaluation_results.parquet"
+SUMMARY_PATH = "evaluation_summary.csv"
+EXPORT_CHUNK_ROWS = 10000
 api_key = os.getenv("MISTRAL_API_KEY") or os.getenv("MISTRAL_KEY_1")
 
-if not api_key:
+if not api_key and LLM_BACKEND != "fake":
     print(" Clé API manquante.")
     sys.exit(1)
 
 print(" INITIALISATION DU TEST A/B (SCÉNARIOS COMPLEXES)...")
 
-# 1. CHALLENGER (IA Standard)
-baseline_llm = ChatMistralAI(api_key=api_key, model="mistral-large-latest", temperature=0.5)
-
-# 2. JUGE (Evaluateur)
-judge_llm = ChatMistralAI(api_key=api_key, model="mistral-large-latest", temperature=0)
-
-# --- DATASET DE TEST "TUEUR DE BASELINE" ---
-test_cases = [
-    {
-        "input": "I feel lazy and sad. What is the '5 minute rule' for depression?",
-        "type": "RAG Savoir (Précis)",
-        "expected": "Doit citer le manuel : 'Dites-vous que vous ne ferez l'activité que 5 minutes'. La Baseline va inventer une autre règle."
-    },
-    {
-        "input": "I am so angry I need to punch something. Give me a specific gym name in Brussels Center.",
-        "type": "RAG Lieu (Local)",
-        "expected": "Doit nommer 'Basic-Fit Gare Centrale'. La Baseline ne connait pas votre base de données locale."
-    },
-    {
-        "input": "I am panic. Tell me exactly how many seconds to inhale according to the 'Box Breathing' technique.",
-        "type": "RAG Technique",
-        "expected": "Doit répondre '4 secondes' (info du fichier texte). La Baseline pourrait donner un autre chiffre."
-    },
-    {
-        "input": "I feel not happy at all today.",
-        "type": "Négation Complexe",
-        "expected": "Doit détecter la Tristesse (Sadness) malgré le mot 'happy'."
-    },
-    {
-        "input": "I want to stimulate my curiosity. Where can I go in Brussels?",
-        "type": "RAG Lieu (Culture)",
-        "expected": "Doit proposer le 'Musée des Sciences' (lié à l'émotion Surprise/Curiosité)."
-    }
-]
+# Cache disque partagé : une relance du test ne repaie pas les appels déjà faits
+llm_cache = get_llm_cache()
+
+if LLM_BACKEND == "fake":
+    baseline_llm = ScriptedChatModel(scripts=[["I understand. Try to rest and talk to someone you trust."]])
+    judge_llm = ScriptedChatModel(scripts=[["3"]], latency={"dist": "fixed", "ms": 200})
+else:
+    # 1. CHALLENGER (IA Standard)
+    baseline_llm = ChatMistralAI(api_key=api_key, model="mistral-large-latest", temperature=0.5, cache=llm_cache)
+
+    # 2. JUGE (Evaluateur) - température 0 : réponse déterministe, servie depuis le disque aux relances
+    judge_llm = ChatMistralAI(api_key=api_key, model="mistral-large-latest", temperature=0, cache=llm_cache)
+
+# --- DATASET DE SCÉNARIOS (JSONL, lu en flux) ---
+def iter_scenarios(path):
+    """
+    Un scénario par ligne : {"type", "input", "expected"} (+ "id" optionnel).
+    Lu paresseusement : la taille du fichier n'a pas d'impact sur la mémoire.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            case = json.loads(line)
+            missing = {"type", "input", "expected"} - case.keys()
+            if missing:
+                raise ValueError(f"{path}:{line_no} : champs manquants {sorted(missing)}")
+            yield case
+
 
 # --- FONCTION DE NOTATION ---
-def run_judge(user_input, ai_response, expected):
+def run_judge(user_input, ai_response, expected, callbacks=None):
     judge_template = """
     Role: Expert AI Auditor.
     Task: Compare the AI response against the Expected Behavior.
@@ -80,62 +107,390 @@ def run_judge(user_input, ai_response, expected):
     """
     prompt = ChatPromptTemplate.from_template(judge_template)
     try:
-        res = (prompt | judge_llm).invoke({"input": user_input, "response": ai_response, "expected": expected})
-        import re
+        res = (prompt | judge_llm).invoke(
+            {"input": user_input, "response": ai_response, "expected": expected},
+            config={"callbacks": callbacks or []}
+        )
         match = re.search(r'\d', res.content)
         return int(match.group()) if match else 3
     except:
         return 3
 
-# --- BOUCLE ---
-results = []
-print(f"\n Démarrage du duel sur {len(test_cases)} rounds...\n")
 
-for i, case in enumerate(test_cases):
+# --- UN ROUND (BASELINE VS MINDCARE) ---
+def case_id(case):
+    """Identifiant stable d'un cas : sert de clé au checkpoint pour la reprise."""
+    if case.get("id"):
+        return str(case["id"])
+    raw = f"{case['type']}\x00{case['input']}\x00{case['expected']}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def get_agent(trial):
+    """
+    Un agent par essai : random_seed=trial rend chaque essai distinct (et distinct dans
+    le cache LLM), tout en restant reproductible d'une relance à l'autre.
+    """
+    with _agents_lock:
+        if trial not in _agents:
+            _agents[trial] = build_agent_executor(active_llm.bind(random_seed=trial), MINDCARE_TOOLS, verbose=False)
+        return _agents[trial]
+
+
+def run_case(case, trial=0):
+    """Baseline + juge, puis MindCare + juge. Retourne la ligne de résultat (scores, latences, tokens)."""
     u_in = case["input"]
-    print(f" Round {i+1}: {u_in[:40]}...")
-    
+    t_case = time.perf_counter()
+
     # Baseline
-    print("   🔹 Baseline...", end="\r")
+    base_usage, judge_usage = TokenCounter(), TokenCounter()
+    t0 = time.perf_counter()
     try:
-        base_resp = baseline_llm.invoke(f"User: {u_in}").content
-    except: base_resp = "Error"
-    s_base = run_judge(u_in, base_resp, case["expected"])
-    print(f"   🔹 Baseline: {s_base}/5")
+        base_resp = baseline_llm.invoke(
+            f"User: {u_in}", config={"callbacks": [base_usage]}, random_seed=trial
+        ).content
+    except Exception:
+        base_resp = "Error"
+    base_latency = time.perf_counter() - t0
+    s_base = run_judge(u_in, base_resp, case["expected"], callbacks=[judge_usage])
 
     # MindCare
-    print("    MindCare...", end="\r")
+    mind_usage = TokenCounter()
+    t0 = time.perf_counter()
     try:
         # On reset l'historique
-        res = mindcare_agent.invoke({"input": u_in, "chat_history": ""})
+        with MINDCARE_TOOLS.turn(u_in):
+            res = get_agent(trial).invoke({"input": u_in, "chat_history": ""}, config={"callbacks": [mind_usage]})
         mind_resp = res['output']
     except Exception as e:
         mind_resp = str(e)
-    s_mind = run_judge(u_in, mind_resp, case["expected"])
-    print(f"    MindCare: {s_mind}/5")
-    print("-" * 30)
+    mind_latency = time.perf_counter() - t0
+    s_mind = run_judge(u_in, mind_resp, case["expected"], callbacks=[judge_usage])
 
-    results.append({
+    cid = case_id(case)
+    return {
+        "Row ID": f"{cid}:{trial}",
+        "Case ID": cid,
+        "Trial": trial,
         "Type": case["type"],
         "Input": u_in,
         "Baseline Score": s_base,
         "MindCare Score": s_mind,
-        "Gain": s_mind - s_base
-    })
+        "Gain": s_mind - s_base,
+        "Baseline Latency (s)": round(base_latency, 3),
+        "MindCare Latency (s)": round(mind_latency, 3),
+        "Case Latency (s)": round(time.perf_counter() - t_case, 3),
+        "Baseline Tokens": base_usage.total_tokens,
+        "MindCare Tokens": mind_usage.total_tokens,
+        "Judge Tokens": judge_usage.total_tokens,
+        "Cache Hits": base_usage.cache_hits + mind_usage.cache_hits + judge_usage.cache_hits,
+    }
+
+
+# --- STATISTIQUES EN FLUX ---
+class RunningStats:
+    """Moyenne / variance incrémentales (Welford) : mémoire constante quel que soit N."""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (x - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def ci95(self):
+        """Intervalle de confiance à 95 % (Student) de la moyenne, None si n < 2 (non défini)."""
+        if self.n < 2:
+            return None
+        t = scipy_stats.t.ppf(0.975, self.n - 1) if scipy_stats else 1.96
+        half = t * self.std / math.sqrt(self.n)
+        return (self.mean - half, self.mean + half)
+
+
+class EvaluationAggregator:
+    """
+    Agrège les essais par cas (moyenne des K essais), puis par type et au global.
+    Les IC portent sur les moyennes par cas : les K essais d'un même cas ne sont pas
+    indépendants. Seuls les cas incomplets restent en mémoire, plus un entier par cas
+    (masque des essais agrégés, qui délimite l'export).
+    """
+
+    METRICS = ["Baseline Score", "MindCare Score", "Gain"]
+    COSTS = ["Baseline Latency (s)", "MindCare Latency (s)", "Baseline Tokens", "MindCare Tokens"]
+
+    def __init__(self, trials):
+        self.trials = trials
+        self.trials_by_case = {}           # Case ID -> masque de bits des essais agrégés
+        self._pending = {}
+        self.by_type = defaultdict(lambda: defaultdict(RunningStats))
+        self.overall = defaultdict(RunningStats)
+        self.trial_noise = RunningStats()  # Écart-type du gain entre essais d'un même cas
+
+    def add(self, row):
+        self.trials_by_case[row["Case ID"]] = self.trials_by_case.get(row["Case ID"], 0) | (1 << row["Trial"])
+        entry = self._pending.setdefault(row["Case ID"], {"type": row["Type"], "rows": []})
+        entry["rows"].append({k: row[k] for k in self.METRICS + self.COSTS})
+        if len(entry["rows"]) >= self.trials:
+            self._close(self._pending.pop(row["Case ID"]))
+
+    def finish(self):
+        """Intègre aussi les cas dont certains essais ont échoué."""
+        for entry in self._pending.values():
+            self._close(entry)
+        self._pending.clear()
+
+    def _close(self, entry):
+        rows = entry["rows"]
+        for key in self.METRICS + self.COSTS:
+            value = sum(r[key] for r in rows) / len(rows)
+            self.by_type[entry["type"]][key].add(value)
+            self.overall[key].add(value)
+        if len(rows) > 1:
+            gains = RunningStats()
+            for r in rows:
+                gains.add(r["Gain"])
+            self.trial_noise.add(gains.std)
+
+    def summary_rows(self):
+        groups = sorted(self.by_type.items()) + [("TOTAL", self.overall)]
+        rows = []
+        for name, group in groups:
+            row = {"Type": name, "Cas": group["Gain"].n}
+            for key in self.METRICS:
+                interval = group[key].ci95()
+                row[f"{key} (moy.)"] = round(group[key].mean, 3)
+                # NaN (affiché "n/a") quand l'intervalle n'est pas défini (moins de 2 cas)
+                row[f"{key} IC95 bas"] = round(interval[0], 3) if interval else math.nan
+                row[f"{key} IC95 haut"] = round(interval[1], 3) if interval else math.nan
+            for key in self.COSTS:
+                row[f"{key} (moy.)"] = round(group[key].mean, 3)
+            rows.append(row)
+        return rows
+
+
+# --- CHECKPOINT (REPRISE APRÈS CRASH) ---
+def iter_checkpoint(path):
+    """Résultats déjà notés (lignes tronquées par un crash ignorées)."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def repair_checkpoint(path):
+    """
+    Tronque la dernière ligne si un crash l'a laissée incomplète : sinon le premier
+    résultat ajouté à la suite y serait collé, illisible, et rejoué à la reprise suivante.
+    Retourne le nombre d'octets retirés.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        keep = end
+        while keep > 0:
+            step = min(4096, keep)
+            f.seek(keep - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                keep = keep - step + newline + 1
+                break
+            keep -= step
+        if keep < end:
+            f.truncate(keep)
+    return end - keep
+
+
+def checkpoint_trials(path):
+    """Essais présents dans le checkpoint : {Case ID: masque de bits des essais}, sans les lignes."""
+    done = {}
+    for row in iter_checkpoint(path):
+        if "Case ID" in row and "Trial" in row:
+            done[row["Case ID"]] = done.get(row["Case ID"], 0) | (1 << row["Trial"])
+    return done
+
+
+def iter_selected_rows(path, selection):
+    """
+    Lignes du checkpoint retenues par selection ({Case ID: masque des essais}), chacune une
+    seule fois (première occurrence). Lecture en flux : seul le masque est en mémoire.
+    """
+    remaining = dict(selection)
+    for row in iter_checkpoint(path):
+        bit = 1 << row.get("Trial", 0)
+        mask = remaining.get(row.get("Case ID"), 0)
+        if mask & bit:
+            remaining[row["Case ID"]] = mask & ~bit
+            yield row
+
+
+def run_evaluation(cases, trials=1, workers=4, checkpoint_path=CHECKPOINT_PATH):
+    """
+    Exécute (cas x essais) en parallèle avec un pool borné et au plus 2 x workers
+    tâches en vol ; chaque résultat est écrit dans le checkpoint dès qu'il est prêt.
+    Seuls les essais du jeu courant (cas présents dans les scénarios, essai < trials)
+    sont agrégés : les autres lignes du checkpoint sont ignorées. Les essais déjà notés
+    ne sont gardés que sous forme de masques et relus du checkpoint en fin de run.
+    """
+    dropped = repair_checkpoint(checkpoint_path)
+    if dropped:
+        print(f" Checkpoint : dernière ligne incomplète retirée ({dropped} octets).")
+    aggregator = EvaluationAggregator(trials)
+    done = checkpoint_trials(checkpoint_path)
+    resumed = {}
+    print(f"\n Démarrage du duel ({trials} essai(s) par cas, {workers} workers, "
+          f"{sum(bin(mask).count('1') for mask in done.values())} essais déjà notés)...\n")
+
+    completed = 0
+    lock = threading.Lock()
+
+    def collect(futures):
+        nonlocal completed
+        for future in futures:
+            try:
+                row = future.result()
+            except Exception as e:
+                print(f"  Essai échoué : {e}")
+                continue
+            with lock:
+                ckpt.write(json.dumps(row, ensure_ascii=False) + "\n")
+                ckpt.flush()
+                os.fsync(ckpt.fileno())
+            aggregator.add(row)
+            completed += 1
+            print(f" [{completed}] {row['Input'][:40]}... (essai {row['Trial'] + 1}) Baseline: {row['Baseline Score']}/5 | "
+                  f"MindCare: {row['MindCare Score']}/5 | {row['Case Latency (s)']}s")
+
+    with open(checkpoint_path, "a", encoding="utf-8") as ckpt, ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        for case in cases:
+            cid = case_id(case)
+            for trial in range(trials):
+                if done.get(cid, 0) & (1 << trial):
+                    resumed[cid] = resumed.get(cid, 0) | (1 << trial)
+                    continue
+                if len(in_flight) >= 2 * workers:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(pool.submit(run_case, case, trial))
+        collect(wait(in_flight).done)
+
+    for row in iter_selected_rows(checkpoint_path, resumed):
+        aggregator.add(row)
+    ignored = sum(bin(mask & ~resumed.get(cid, 0)).count("1") for cid, mask in done.items())
+    if ignored:
+        print(f" {ignored} essai(s) du checkpoint hors du jeu courant (cas retiré ou essai >= {trials}) : ignorés.")
+    aggregator.finish()
+    return aggregator
+
+
+# --- EXPORT COLONNAIRE ---
+def iter_result_chunks(checkpoint_path, selection=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """DataFrames de chunk_rows lignes du checkpoint (lignes tronquées ignorées, une ligne par essai)."""
+    rows = iter_checkpoint(checkpoint_path) if selection is None else iter_selected_rows(checkpoint_path, selection)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_rows:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+def export_results(checkpoint_path, out_path, selection=None):
+    """
+    Convertit le checkpoint (JSONL) en fichier colonnaire, par blocs (mémoire bornée).
+    selection : {Case ID: masque des essais} à exporter (par défaut, tout le checkpoint).
+    """
+    if not os.path.exists(checkpoint_path):
+        return None
+    if pa is None:
+        out_path = os.path.splitext(out_path)[0] + ".csv"
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    writer = None
+    for chunk in iter_result_chunks(checkpoint_path, selection):
+        if pa is None:
+            chunk.to_csv(out_path, mode="a", header=not os.path.exists(out_path), index=False)
+            continue
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(out_path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+    return out_path
+
 
 # --- ANALYSE ---
-df = pd.DataFrame(results)
-avg_base = df["Baseline Score"].mean()
-avg_mind = df["MindCare Score"].mean()
-improvement = ((avg_mind - avg_base) / avg_base) * 100 if avg_base > 0 else 0
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test A/B Baseline vs MindCare (parallèle et reprenable).")
+    parser.add_argument("--scenarios", default=SCENARIOS_PATH, help="Fichier JSONL des scénarios")
+    parser.add_argument("--trials", type=int, default=3, help="Nombre d'essais (K) par scénario")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre d'essais évalués en parallèle")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="Fichier JSONL des résultats déjà notés")
+    parser.add_argument("--out", default=RESULTS_PATH, help="Résultats par essai (Parquet)")
+    parser.add_argument("--summary", default=SUMMARY_PATH, help="Synthèse par type de scénario (CSV)")
+    parser.add_argument("--fresh", action="store_true", help="Ignore le checkpoint existant et repart de zéro")
+    args = parser.parse_args()
+
+    if args.fresh and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    aggregator = run_evaluation(iter_scenarios(args.scenarios), trials=args.trials,
+                                workers=args.workers, checkpoint_path=args.checkpoint)
+    if aggregator.overall["Gain"].n == 0:
+        print(" Aucun résultat.")
+        sys.exit(1)
+
+    summary = pd.DataFrame(aggregator.summary_rows())
+    total = aggregator.overall
+    avg_base = total["Baseline Score"].mean
+    avg_mind = total["MindCare Score"].mean
+    gain_ci = total["Gain"].ci95()
+    improvement = ((avg_mind - avg_base) / avg_base) * 100 if avg_base > 0 else 0
+
+    print("\n" + "="*40)
+    print(" RÉSULTATS DU DUEL")
+    print("="*40)
+    print(summary[["Type", "Cas", "Baseline Score (moy.)", "MindCare Score (moy.)", "Gain (moy.)",
+                   "Gain IC95 bas", "Gain IC95 haut", "MindCare Latency (s) (moy.)", "MindCare Tokens (moy.)"]]
+          .to_string(index=False, na_rep="n/a"))
 
-print("\n" + "="*40)
-print(" RÉSULTATS DU DUEL")
-print("="*40)
-print(df[["Type", "Baseline Score", "MindCare Score", "Gain"]])
+    print(f"\n Moyenne Baseline : {avg_base:.2f}/5")
+    print(f" Moyenne MindCare : {avg_mind:.2f}/5")
+    if gain_ci is None:
+        print(f" AMÉLIORATION : +{improvement:.1f}% (gain {total['Gain'].mean:+.2f} pts, IC95 n/a : un seul cas)")
+    else:
+        gain_low, gain_high = gain_ci
+        print(f" AMÉLIORATION : +{improvement:.1f}% (gain {total['Gain'].mean:+.2f} pts, "
+              f"IC95 [{gain_low:+.2f} ; {gain_high:+.2f}])")
+        if gain_low <= 0 <= gain_high:
+            print("  L'intervalle contient 0 : la différence n'est pas significative sur ce jeu de scénarios.")
+    if aggregator.trial_noise.n:
+        print(f" Bruit du juge entre essais (écart-type moyen du gain) : {aggregator.trial_noise.mean:.2f} pts")
 
-print(f"\n Moyenne Baseline : {avg_base:.2f}/5")
-print(f" Moyenne MindCare : {avg_mind:.2f}/5")
-print(f" AMÉLIORATION : +{improvement:.1f}%")
+    summary.to_csv(args.summary, index=False, na_rep="n/a")
+    out_path = export_results(args.checkpoint, args.out, aggregator.trials_by_case)
+    print(f" Synthèse : {args.summary} | Résultats par essai : {out_path}")
 
-df.to_csv("evaluation_results.csv", index=False)
\ No newline at end of file
+    if llm_cache is not None:
+        print(f" Cache LLM : {llm_cache.stats()}")
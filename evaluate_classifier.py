@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, confusion_matrix, f1_score
+
+from mindcare_models import CANDIDATE_POINTER, DEFAULT_LANGUAGE, MODELS_DIR, ModelRegistry
+from mindcare_tools import LABEL_MAP
+from mindcare_tracing import percentile
+
+# Porte de non-régression du classifieur d'émotions : rejoue les splits de test/validation
+# contre le classifieur servi (models/CURRENT, ou models/ sans versions), le candidat ou une
+# version publiée, et compare la qualité à une référence stockée. La vitesse n'est comparée
+# qu'avec --check-speed : elle dépend de la machine et de sa charge, et les durées sont alors
+# rapportées à une charge fixe intercalée entre les mesures (même machine, même instant).
+
+# --- CONFIGURATION ---
+SPLITS = {"test": "splits/test.csv", "val": "splits/val.csv"}
+BASELINE_PATH = "classifier_baseline.json"
+BATCH_SIZE = 256
+SINGLE_SAMPLE = 500        # Messages scorés un par un (chemin interactif de l'agent)
+WARMUP_BATCHES = 2
+REPEATS = 5                # Passes chronométrées : la médiane est retenue
+REFERENCE_WORDS = 2000     # Taille d'une tranche de la charge de référence (~0.5 ms)
+REFERENCE_EVERY = 50       # Latence unitaire : une tranche de référence tous les N messages
+
+# Seuils de régression (par rapport à la référence)
+MAX_ACCURACY_DROP = 0.01   # Points d'accuracy
+MAX_MACRO_F1_DROP = 0.01   # Points de F1 macro
+MAX_CLASS_F1_DROP = 0.03   # Points de F1 pour une classe donnée
+MAX_SLOWDOWN = 0.25        # +25 % de latence p95 ou -25 % de débit (après normalisation, --check-speed)
+
+
+def load_classifier(version="current", root=MODELS_DIR):
+    """
+    ModelBundle de la langue par défaut, résolu comme en production (empreintes du manifest
+    vérifiées). version : "current" (servie), "candidate" (models/CANDIDATE) ou un nom publié.
+    """
+    if version == "current":
+        registry = ModelRegistry(root)
+    elif version == "candidate":
+        registry = ModelRegistry(root, pointer=CANDIDATE_POINTER, legacy_root=False)
+        if registry.version is None:
+            raise FileNotFoundError(f"Aucun candidat : {os.path.join(root, CANDIDATE_POINTER)} absent")
+    else:
+        registry = ModelRegistry(root, version=version)
+    return registry.get(DEFAULT_LANGUAGE), registry.folder()
+
+
+def reference_text(n_words=REFERENCE_WORDS):
+    rng = np.random.default_rng(0)
+    return " ".join(f"w{i}" for i in rng.integers(0, 5000, size=n_words))
+
+
+def reference_ms(text):
+    """
+    Une tranche de la charge de référence : comptage de mots en Python, comme la tokenisation
+    qui domine le coût de TF-IDF. Intercalée entre les mesures, elle subit la même charge
+    machine qu'elles : leur rapport est comparable d'un run (ou d'une machine) à l'autre.
+    """
+    t0 = time.perf_counter()
+    counts = {}
+    for word in text.split():
+        counts[word] = counts.get(word, 0) + 1
+    return (time.perf_counter() - t0) * 1000
+
+
+def score_split(model, vectorizer, path, batch_size=BATCH_SIZE, repeats=REPEATS, reference=None):
+    """
+    Prédictions par lots vectorisés (TF-IDF + predict_proba sur une matrice creuse par lot).
+    Le split est scoré `repeats` fois ; chaque lot garde sa durée médiane. Retourne aussi le
+    coût relatif : médiane sur les passes de (durée des lots / tranches de référence, une
+    avant chaque lot).
+    """
+    reference = reference or reference_text()
+    batches = [chunk for chunk in pd.read_csv(path, chunksize=batch_size)]
+    texts = [c["text"].astype(str).tolist() for c in batches]
+    timings = np.empty((repeats, len(batches)))
+    relative = []
+    for r in range(repeats):
+        reference_total = 0.0
+        preds = []
+        for i, batch in enumerate(texts):
+            reference_total += reference_ms(reference)
+            t0 = time.perf_counter()
+            probas = model.predict_proba(vectorizer.transform(batch))
+            timings[r, i] = (time.perf_counter() - t0) * 1000
+            preds.append(model.classes_[probas.argmax(axis=1)])
+        relative.append(timings[r].sum() / reference_total)
+    labels = np.concatenate([c["label"].to_numpy() for c in batches])
+    sample = [t for batch in texts for t in batch][:SINGLE_SAMPLE]
+    return labels, np.concatenate(preds), np.median(timings, axis=0).tolist(), sample, float(np.median(relative))
+
+
+def measure_single_latency(model, vectorizer, texts, repeats=REPEATS, reference=None):
+    """
+    Latence message par message, comme classify_emotion() dans l'agent (médiane par message),
+    et p95 relatif : médiane sur les passes de (p95 de la passe / tranche de référence médiane,
+    une tous les REFERENCE_EVERY messages).
+    """
+    reference = reference or reference_text()
+    for text in texts[:WARMUP_BATCHES]:
+        model.predict_proba(vectorizer.transform([text]))
+    timings = np.empty((repeats, len(texts)))
+    relative = []
+    for r in range(repeats):
+        references = []
+        for i, text in enumerate(texts):
+            if i % REFERENCE_EVERY == 0:
+                references.append(reference_ms(reference))
+            t0 = time.perf_counter()
+            model.predict_proba(vectorizer.transform([text]))
+            timings[r, i] = (time.perf_counter() - t0) * 1000
+        relative.append(percentile(timings[r].tolist(), 95) / float(np.median(references)))
+    return np.median(timings, axis=0).tolist(), float(np.median(relative))
+
+
+def quality_report(y_true, y_pred):
+    classes = sorted(LABEL_MAP)
+    per_class = f1_score(y_true, y_pred, labels=classes, average=None, zero_division=0)
+    return {
+        "n": int(len(y_true)),
+        "accuracy": round(float(accuracy_score(y_true, y_pred)), 4),
+        "macro_f1": round(float(f1_score(y_true, y_pred, labels=classes, average="macro", zero_division=0)), 4),
+        "per_class_f1": {LABEL_MAP[c]: round(float(f), 4) for c, f in zip(classes, per_class)},
+        "confusion_matrix": confusion_matrix(y_true, y_pred, labels=classes).tolist(),
+    }
+
+
+def evaluate(splits, batch_size=BATCH_SIZE, version="current", repeats=REPEATS):
+    bundle, folder = load_classifier(version)
+    model, vectorizer = bundle.model, bundle.vectorizer
+    reference = reference_text()
+    report = {"model": folder, "version": bundle.version, "batch_size": batch_size, "repeats": repeats,
+              "reference_words": REFERENCE_WORDS, "splits": {}}
+    single_texts = []
+    for name, path in splits.items():
+        # Lot de chauffe : caches numpy / scipy hors mesure
+        for _ in range(WARMUP_BATCHES):
+            model.predict_proba(vectorizer.transform(pd.read_csv(path, nrows=batch_size)["text"].astype(str)))
+
+        y_true, y_pred, batch_ms, texts, relative_cost = score_split(model, vectorizer, path, batch_size,
+                                                                     repeats, reference)
+        split = quality_report(y_true, y_pred)
+        total_s = sum(batch_ms) / 1000
+        split["throughput_msg_s"] = round(len(y_true) / total_s, 1) if total_s else 0.0
+        split["batch_p50_ms"] = round(percentile(batch_ms, 50), 3)
+        split["batch_p95_ms"] = round(percentile(batch_ms, 95), 3)
+        split["relative_cost"] = round(relative_cost, 4)
+        report["splits"][name] = split
+        single_texts.extend(texts)
+
+    single, single_relative = measure_single_latency(model, vectorizer, single_texts[:SINGLE_SAMPLE],
+                                                     repeats, reference)
+    report["single_p50_ms"] = round(percentile(single, 50), 3)
+    report["single_p95_ms"] = round(percentile(single, 95), 3)
+    report["single_p99_ms"] = round(percentile(single, 99), 3)
+    report["single_relative_p95"] = round(single_relative, 5)
+    return report
+
+
+def compare(report, baseline, max_macro_f1_drop=MAX_MACRO_F1_DROP, max_class_f1_drop=MAX_CLASS_F1_DROP,
+            max_slowdown=MAX_SLOWDOWN, check_speed=False, max_accuracy_drop=MAX_ACCURACY_DROP):
+    """
+    Liste des régressions (vide = OK). Vitesse comparée seulement si check_speed, sur les coûts
+    relatifs à la charge de référence (les durées brutes dépendent de la machine et de sa charge).
+    """
+    failures = []
+    if check_speed and "single_relative_p95" not in baseline:
+        failures.append("Référence sans coûts relatifs (ancien format) : relancez avec --update-baseline")
+        check_speed = False
+    for name, split in report["splits"].items():
+        ref = baseline["splits"].get(name)
+        if ref is None:
+            continue
+        accuracy_drop = ref["accuracy"] - split["accuracy"]
+        if accuracy_drop > max_accuracy_drop:
+            failures.append(f"[{name}] Accuracy {split['accuracy']:.4f} < référence {ref['accuracy']:.4f} "
+                            f"(-{accuracy_drop:.4f})")
+        drop = ref["macro_f1"] - split["macro_f1"]
+        if drop > max_macro_f1_drop:
+            failures.append(f"[{name}] F1 macro {split['macro_f1']:.4f} < référence {ref['macro_f1']:.4f} (-{drop:.4f})")
+        for label, f1 in split["per_class_f1"].items():
+            class_drop = ref["per_class_f1"].get(label, f1) - f1
+            if class_drop > max_class_f1_drop:
+                failures.append(f"[{name}] F1 {label} {f1:.4f} (-{class_drop:.4f})")
+        if check_speed and split["relative_cost"] > ref["relative_cost"] * (1 + max_slowdown):
+            failures.append(f"[{name}] Coût du scoring {split['relative_cost']:.3f} x la charge de référence "
+                            f"> référence {ref['relative_cost']:.3f} ({split['throughput_msg_s']} msg/s)")
+
+    if check_speed and report["single_relative_p95"] > baseline["single_relative_p95"] * (1 + max_slowdown):
+        failures.append(f"Latence p95 unitaire {report['single_relative_p95']:.5f} x la charge de référence "
+                        f"> référence {baseline['single_relative_p95']:.5f} ({report['single_p95_ms']} ms)")
+    return failures
+
+
+def print_report(report):
+    names = [LABEL_MAP[c] for c in sorted(LABEL_MAP)]
+    for name, split in report["splits"].items():
+        print(f"\n --- Split '{name}' ({split['n']} messages) ---")
+        print(f" Accuracy : {split['accuracy']:.4f} | F1 macro : {split['macro_f1']:.4f}")
+        print(" F1 par classe : " + ", ".join(f"{k}={v:.3f}" for k, v in split["per_class_f1"].items()))
+        print(" Matrice de confusion (lignes = vrai, colonnes = prédit) :")
+        print(pd.DataFrame(split["confusion_matrix"], index=names, columns=names).to_string())
+        print(f" Débit : {split['throughput_msg_s']} msg/s | lot p50={split['batch_p50_ms']}ms p95={split['batch_p95_ms']}ms "
+              f"| coût relatif {split['relative_cost']:.3f}")
+    print(f"\n Latence unitaire : p50={report['single_p50_ms']}ms p95={report['single_p95_ms']}ms "
+          f"p99={report['single_p99_ms']}ms (médianes de {report['repeats']} passes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Non-régression du classifieur d'émotions (qualité, vitesse en option).")
+    parser.add_argument("--splits", default="test,val", help="Splits à évaluer (ex: test,val)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--version", default="current",
+                        help="Classifieur évalué : current (servi), candidate (avant activation) ou nom de version")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Référence JSON à comparer")
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre ce run comme nouvelle référence")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Passes chronométrées (médiane)")
+    parser.add_argument("--check-speed", action="store_true",
+                        help="Compare aussi débit et latence, rapportés à une charge de référence du même run")
+    parser.add_argument("--max-accuracy-drop", type=float, default=MAX_ACCURACY_DROP)
+    parser.add_argument("--max-f1-drop", type=float, default=MAX_MACRO_F1_DROP)
+    parser.add_argument("--max-class-f1-drop", type=float, default=MAX_CLASS_F1_DROP)
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN)
+    parser.add_argument("--out", default=None, help="Rapport JSON de ce run (optionnel)")
+    args = parser.parse_args()
+
+    splits = {name: SPLITS[name] for name in args.splits.split(",")}
+    try:
+        report = evaluate(splits, args.batch_size, args.version, args.repeats)
+    except (FileNotFoundError, ValueError) as e:
+        print(f" Classifieur introuvable ou invalide : {e}")
+        sys.exit(1)
+    print(f" Classifieur évalué : {report['model']} (version {report['version'] or 'non versionnée'})")
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n Référence mise à jour : {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\n Pas de référence ({args.baseline}) : relancez avec --update-baseline.")
+        sys.exit(1)
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    failures = compare(report, baseline, args.max_f1_drop, args.max_class_f1_drop, args.max_slowdown,
+                       args.check_speed, args.max_accuracy_drop)
+    if failures:
+        print("\n RÉGRESSION DÉTECTÉE :")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n Aucune régression par rapport à la référence.")
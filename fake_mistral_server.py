@@ -0,0 +1,120 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Faux endpoint /v1/chat/completions compatible Mistral, pour tester le pool de clés
+# (429, timeouts, clés révoquées) sans consommer de quota.
+
+DEFAULT_REPLY = "Thought: I now know the final answer\nFinal Answer: Je suis là pour vous écouter."
+
+
+def make_handler(rate_429, rate_timeout, timeout_s, latency_ms, bad_keys, reply):
+    class FakeMistralHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive : vérifie la réutilisation des connexions
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            try:
+                self._handle_chat()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Le client a abandonné (timeout simulé)
+
+        def _handle_chat(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            api_key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+
+            if api_key in bad_keys:
+                return self._send_json(401, {"message": "Unauthorized"})
+            roll = random.random()
+            if roll < rate_429:
+                return self._send_json(429, {"message": "Requests rate limit exceeded"}, {"Retry-After": "1"})
+            if roll < rate_429 + rate_timeout:
+                time.sleep(timeout_s)  # Le client abandonne avant la réponse
+                return self._send_json(504, {"message": "Gateway timeout"})
+
+            time.sleep(latency_ms / 1000)
+            prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(reply.split()),
+                "total_tokens": prompt_tokens + len(reply.split()),
+            }
+
+            if not request.get("stream"):
+                return self._send_json(200, {
+                    "id": "fake-cmpl",
+                    "object": "chat.completion",
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply},
+                                 "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            # Réponse SSE, mot par mot
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+                chunk = {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                if i == len(words) - 1:
+                    chunk["choices"][0]["finish_reason"] = "stop"
+                    chunk["usage"] = usage
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeMistralHandler
+
+
+def start_fake_server(port=0, rate_429=0.0, rate_timeout=0.0, timeout_s=5.0, latency_ms=20,
+                      bad_keys=(), reply=DEFAULT_REPLY):
+    """Démarre le faux serveur dans un thread. Retourne (serveur, base_url)."""
+    handler = make_handler(rate_429, rate_timeout, timeout_s, latency_ms, set(bad_keys), reply)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux endpoint Mistral (429 / timeouts simulés).")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-429", type=float, default=0.1)
+    parser.add_argument("--rate-timeout", type=float, default=0.05)
+    parser.add_argument("--timeout-s", type=float, default=5.0)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--bad-key", action="append", default=[])
+    args = parser.parse_args()
+
+    server, url = start_fake_server(args.port, args.rate_429, args.rate_timeout, args.timeout_s,
+                                    args.latency_ms, args.bad_key)
+    print(f" Faux serveur Mistral en écoute sur {url} (MISTRAL_BASE_URL={url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
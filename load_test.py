@@ -0,0 +1,172 @@
+import argparse
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from mindcare_agent import build_agent_executor
+from mindcare_fake_llm import ScriptedChatModel
+from mindcare_streaming import FinalAnswerStreamHandler
+from mindcare_tools import MindCareTools
+from mindcare_tracing import Tracer, percentile
+
+# Générateur de charge : N sessions simulées en parallèle à travers les vrais outils
+# (MindCareTools) et le vrai AgentExecutor, avec un faux LLM local (aucun quota consommé).
+
+MESSAGES_CSV = "splits/test.csv"
+
+
+def load_messages(limit=500):
+    """Vrais messages utilisateurs (split de test), pour des entrées réalistes."""
+    try:
+        return pd.read_csv(MESSAGES_CSV, nrows=limit)["text"].astype(str).tolist()
+    except FileNotFoundError:
+        return ["I feel completely lost and alone.", "I am having a panic attack, how do I breathe?"]
+
+
+def read_rss_mb():
+    """RSS courant (Linux) ; sinon pic RSS via getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_session(executor, tools, messages, turns, tracer, rng):
+    """Une session : `turns` tours successifs, historique cumulé comme dans final_agent.py."""
+    latencies, ttfts, errors = [], [], 0
+    chat_history = ""
+    for _ in range(turns):
+        user_input = rng.choice(messages)
+        stream_handler = FinalAnswerStreamHandler(on_text=lambda text: None)
+        t0 = time.perf_counter()
+        try:
+            with tools.turn(user_input):
+                response = executor.invoke(
+                    {"input": user_input, "chat_history": chat_history},
+                    config={"callbacks": [stream_handler, tracer.handler()]},
+                )
+            chat_history += f"\nHuman: {user_input}\nAI: {response['output']}"
+        except Exception:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - t0)
+        if stream_handler.ttft is not None:
+            ttfts.append(stream_handler.ttft)
+    return latencies, ttfts, errors
+
+
+def run_load(tools, concurrency, turns, latency, stream, seed=42):
+    """Lance `concurrency` sessions simultanées et mesure débit, latences et ressources."""
+    llm = ScriptedChatModel(latency=latency, streaming=stream, seed=seed)
+    executor = build_agent_executor(llm, tools, verbose=False)
+    tracer = Tracer(path=None)
+    messages = load_messages()
+
+    rss_peak = [read_rss_mb()]
+    threads_peak = [threading.active_count()]
+    stop = threading.Event()
+
+    def sample_rss():
+        while not stop.wait(0.2):
+            rss_peak[0] = max(rss_peak[0], read_rss_mb())
+            threads_peak[0] = max(threads_peak[0], threading.active_count())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(run_session, executor, tools, messages, turns, tracer, random.Random(seed + i))
+            for i in range(concurrency)
+        ]
+        threads_peak[0] = max(threads_peak[0], threading.active_count())
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - t0
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    stop.set()
+
+    latencies = [x for r in results for x in r[0]]
+    ttfts = [x for r in results for x in r[1]]
+    errors = sum(r[2] for r in results)
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+
+    spans = tracer.summary()
+    tool_p95 = {name.split(":", 1)[1]: s["p95_ms"] for name, s in spans.items() if name.startswith("tool:")}
+    return {
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "errors": errors,
+        "throughput_tps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "ttft_p50_s": round(percentile(ttfts, 50), 3),
+        "cpu_pct": round(100 * cpu / wall, 1) if wall else 0.0,
+        "rss_peak_mb": round(rss_peak[0], 1),
+        "threads_peak": threads_peak[0],
+        "tool_p95_ms": tool_p95,
+    }
+
+
+def find_ceiling(rows, min_gain=0.10):
+    """Premier palier où monter la concurrence n'apporte plus `min_gain` de débit en plus (None si non atteint)."""
+    for prev, cur in zip(rows, rows[1:]):
+        if cur["throughput_tps"] < prev["throughput_tps"] * (1 + min_gain):
+            return prev["concurrency"]
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge MindCare (faux LLM local).")
+    parser.add_argument("--sessions", default="1,2,4,8,16,32",
+                        help="Niveaux de concurrence à tester (ex: 8 ou 1,2,4,8)")
+    parser.add_argument("--turns", type=int, default=5, help="Tours par session")
+    parser.add_argument("--latency-dist", default="lognormal", choices=["fixed", "uniform", "normal", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=800, help="Médiane / moyenne de la latence LLM")
+    parser.add_argument("--latency-spread", type=float, default=0.5,
+                        help="sigma (lognormal), écart-type en ms (normal) ou demi-largeur en ms (uniform)")
+    parser.add_argument("--stream", action="store_true", help="Streaming token par token (mesure le TTFT)")
+    parser.add_argument("--out", default=None, help="CSV de résultats (optionnel)")
+    args = parser.parse_args()
+
+    latency = {
+        "fixed": {"dist": "fixed", "ms": args.latency_ms},
+        "uniform": {"dist": "uniform", "min_ms": max(0, args.latency_ms - args.latency_spread),
+                    "max_ms": args.latency_ms + args.latency_spread},
+        "normal": {"dist": "normal", "mean_ms": args.latency_ms, "std_ms": args.latency_spread},
+        "lognormal": {"dist": "lognormal", "median_ms": args.latency_ms, "sigma": args.latency_spread},
+    }[args.latency_dist]
+
+    print(" Chargement des outils (une seule fois pour tout le processus)...")
+    tools = MindCareTools()
+
+    rows = []
+    for level in [int(x) for x in args.sessions.split(",")]:
+        print(f"\n Palier : {level} session(s) x {args.turns} tours...")
+        row = run_load(tools, level, args.turns, latency, args.stream)
+        rows.append(row)
+        print(f"   débit={row['throughput_tps']} tours/s  p50={row['p50_s']}s  p95={row['p95_s']}s  "
+              f"p99={row['p99_s']}s  CPU={row['cpu_pct']}%  RSS={row['rss_peak_mb']} Mo  erreurs={row['errors']}")
+
+    df = pd.DataFrame(rows)
+    print("\n" + "=" * 40)
+    print(" RÉSULTATS DU TEST DE CHARGE")
+    print("=" * 40)
+    print(df.drop(columns=["tool_p95_ms"]).to_string(index=False))
+    if len(rows) > 1:
+        ceiling = find_ceiling(rows)
+        if ceiling is None:
+            print(f"\n Plafond non atteint jusqu'à {rows[-1]['concurrency']} sessions : augmentez --sessions.")
+        else:
+            print(f"\n Plafond de concurrence estimé : ~{ceiling} sessions par processus")
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f" Résultats sauvegardés : {args.out}")
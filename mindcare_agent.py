@@ -0,0 +1,134 @@
+# Bloc de secours : AgentExecutor a quitté `langchain.agents` avec LangChain 1.x
+try:
+    from langchain.agents import AgentExecutor, create_react_agent
+except ImportError:
+    from langchain_classic.agents import AgentExecutor, create_react_agent
+from langchain.tools import tool
+from langchain_core.prompts import PromptTemplate
+
+# Assemblage de l'agent ReAct MindCare, indépendant du LLM utilisé :
+# final_agent.py y branche le pool Mistral, load_test.py un faux LLM local.
+
+
+def build_tools(mindcare_tools):
+    """Les 4 piliers de l'agent, branchés sur une instance de MindCareTools."""
+
+    @tool
+    def emotion_classifier(text: str) -> str:
+        """Useful to identify the user's emotion. Returns emotion name and confidence."""
+        try:
+            return str(mindcare_tools.classify_emotion(text))
+        except Exception as e:
+            return f"Error: {e}"
+
+    @tool
+    def advice_lookup(emotion: str) -> str:
+        """Useful to get a quick supportive tip based on an emotion (e.g., 'sadness', 'joy')."""
+        try:
+            return str(mindcare_tools.get_advice(emotion))
+        except Exception as e:
+            return f"Error: {e}"
+
+    @tool
+    def activity_recommendation(emotion: str) -> str:
+        """Useful to suggest a specific real-world place in Brussels (Park, Gym...) based on emotion."""
+        try:
+            return str(mindcare_tools.get_activity(emotion))
+        except Exception as e:
+            return f"Error: {e}"
+
+    @tool
+    def knowledge_retriever(query: str) -> str:
+        """
+        Useful for deep psychological questions or "How-to" questions (e.g. "How to breathe?", "Why am I angry?").
+        It searches in a Clinical Psychology Manual using Vector RAG.
+        """
+        try:
+            return str(mindcare_tools.query_knowledge_base(query))
+        except Exception as e:
+            return f"Error: {e}"
+
+    # Liste complète des 4 outils
+    return [emotion_classifier, advice_lookup, activity_recommendation, knowledge_retriever]
+
+
+AGENT_TEMPLATE = """
+You are MINDCARE, an advanced mental health assistant.
+Your tone must be warm, professional, and deeply empathetic.
+
+TOOLS AVAILABLE:
+----------------
+{tools}
+
+FORMAT INSTRUCTIONS (ReAct):
+----------------------------
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final response to the human
+
+FEW-SHOT EXAMPLES (How you should behave):
+------------------------------------------
+Question: "I feel completely lost and alone."
+Thought: The user expresses deep sadness. I must first identify the emotion.
+Action: emotion_classifier
+Action Input: "I feel completely lost and alone"
+Observation: {{'emotion': 'Sadness', 'confidence': 0.85}}
+Thought: Emotion is Sadness. I will get advice and suggest an activity.
+Action: advice_lookup
+Action Input: "sadness"
+Observation: "Reach out to a friend..."
+Thought: I will also check for a local place.
+Action: activity_recommendation
+Action Input: "sadness"
+Observation: "Suggestion: Parc de Bruxelles..."
+Final Answer: I hear how heavy things feel right now. You are not alone. It is important to reach out... [Advice]. If you feel up to it, a walk in the Parc de Bruxelles might offer a moment of peace.
+
+Question: "I am having a panic attack, how do I breathe?"
+Thought: The user is in acute distress and asks for a specific technique. I need deep clinical knowledge.
+Action: knowledge_retriever
+Action Input: "how to breathe during a panic attack"
+Observation: "Technique de la respiration carrée (Box Breathing): Inspirer 4s..."
+Thought: I have the specific technique. I will guide the user through it step-by-step.
+Final Answer: I am here with you. Let's try the Box Breathing technique together. 1. Inhale for 4 seconds... [Instructions].
+
+Question: "I ate a sandwich."
+Thought: This statement is neutral. I will check for hidden emotions just in case.
+Action: emotion_classifier
+Action Input: "I ate a sandwich"
+Observation: {{'emotion': 'unknown', 'confidence': 0.15}}
+Thought: Confidence is too low. No advice needed. I should ask for clarification.
+Final Answer: That sounds like a nice lunch! How are you feeling otherwise today?
+
+------------------------------------------
+Begin!
+
+Previous conversation history:
+{chat_history}
+
+Question: {input}
+Thought:{agent_scratchpad}
+"""
+
+
+def build_agent_executor(llm, mindcare_tools, verbose=True):
+    """Agent ReAct + exécuteur, prêts à recevoir {"input", "chat_history"}."""
+    tools = build_tools(mindcare_tools)
+    prompt = PromptTemplate.from_template(AGENT_TEMPLATE)
+    agent = create_react_agent(llm, tools, prompt)
+    return AgentExecutor(
+        agent=agent,
+        tools=tools,
+        verbose=verbose,
+        handle_parsing_errors=True,
+        max_iterations=6,
+        # invoke() (et non stream()) pour passer par le cache LLM ; les tokens
+        # restent diffusés aux callbacks grâce à streaming=True
+        stream_runnable=False
+    )
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import deque
+
+from mindcare_tracing import percentile
+
+# --- CONFIGURATION ---
+MAX_BATCH = 64          # Taille maximale d'un lot
+MAX_WAIT_MS = 5.0       # Attente maximale ajoutée au premier message d'un lot
+MAX_QUEUE = 1024        # Au-delà : QueueFull (503 côté serveur)
+LATENCY_WINDOW = 1000   # Mesures gardées pour les percentiles
+
+
+class MicroBatcher:
+    """
+    Regroupe les requêtes concurrentes (ex: /classify) en lots : le lot part dès qu'il
+    atteint `max_batch` éléments ou que son premier élément a attendu `max_wait_ms`.
+    `batch_fn(liste) -> liste` est exécutée dans `executor`, au plus `workers` lots à la fois ;
+    chaque appelant récupère son résultat via un future asyncio.
+    """
+
+    def __init__(self, batch_fn, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE,
+                 workers=1, executor=None):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self.executor = executor
+        self.rejected = 0
+        self.batches = 0
+        self.items = 0
+        self.max_depth = 0
+        self.size_histogram = {}
+        self._wait_ms = deque(maxlen=LATENCY_WINDOW)    # Latence ajoutée par le regroupement
+        self._batch_ms = deque(maxlen=LATENCY_WINDOW)   # Temps de calcul d'un lot
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._arrival = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        # Un seul collecteur : plusieurs collecteurs se disputeraient chaque arrivée et ne
+        # formeraient que des lots de 1. Le parallélisme vient des `workers` créneaux d'exécution.
+        self._slots = asyncio.Semaphore(self.workers)
+        self._tasks = [asyncio.create_task(self._run())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, item):
+        """Future du résultat de `item` ; asyncio.QueueFull si la file est pleine."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        self._arrival.set()
+        return future
+
+    async def _collect(self):
+        """Attend un premier élément puis complète le lot jusqu'à la taille ou au délai maximal."""
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch:
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.perf_counter()
+            if len(batch) >= self.max_batch or remaining <= 0:
+                break
+            self._arrival.clear()
+            try:
+                await asyncio.wait_for(self._arrival.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Créneau réservé AVANT de collecter : quand tous les workers calculent, les messages
+            # s'accumulent dans la file et le lot suivant n'en est que plus gros
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # Appelants partis entre-temps : inutile de les scorer
+            batch = [entry for entry in batch if not entry[1].cancelled()]
+            if not batch:
+                self._slots.release()
+                continue
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self._wait_ms.append((started - enqueued) * 1000)
+            # Lot lancé sans l'attendre : le collecteur prépare aussitôt le suivant
+            pending = loop.run_in_executor(self.executor, self.batch_fn, [entry[0] for entry in batch])
+            pending.add_done_callback(lambda done, batch=batch, started=started: self._finish(done, batch, started))
+
+    def _finish(self, done, batch, started):
+        """Rappel (boucle asyncio) à la fin d'un lot : résultats aux appelants, créneau libéré."""
+        self._slots.release()
+        if done.cancelled():
+            for _, future, _ in batch:
+                future.cancel()
+            return
+        error = done.exception()
+        for index, (_, future, _) in enumerate(batch):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(done.result()[index])
+        self._batch_ms.append((time.perf_counter() - started) * 1000)
+        self._record_batch(len(batch))
+
+    def _record_batch(self, size):
+        self.batches += 1
+        self.items += size
+        # Seaux en puissances de 2 : "1", "2-3", "4-7", ...
+        low = 1 << (size.bit_length() - 1)
+        bucket = str(low) if low == 1 else f"{low}-{2 * low - 1}"
+        self.size_histogram[bucket] = self.size_histogram.get(bucket, 0) + 1
+
+    def snapshot(self):
+        wait_ms, batch_ms = list(self._wait_ms), list(self._batch_ms)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.size_histogram.items(), key=lambda kv: int(kv[0].split("-")[0]))),
+            "added_latency_p50_ms": round(percentile(wait_ms, 50), 3),
+            "added_latency_p95_ms": round(percentile(wait_ms, 95), 3),
+            "added_latency_p99_ms": round(percentile(wait_ms, 99), 3),
+            "batch_compute_p50_ms": round(percentile(batch_ms, 50), 3),
+            "batch_compute_p95_ms": round(percentile(batch_ms, 95), 3),
+        }
@@ -0,0 +1,148 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import warnings
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+# `loads` est marqué "beta" par LangChain : l'avertissement s'afficherait à chaque hit
+warnings.filterwarnings("ignore", message=".*`loads` is in beta.*", category=LangChainBetaWarning)
+
+# --- CONFIGURATION ---
+CACHE_PATH = os.getenv("MINDCARE_LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+CACHE_TTL_SECONDS = 7 * 24 * 3600   # Une réponse vieille d'une semaine est recalculée
+CACHE_MAX_ENTRIES = 20000
+CACHE_MAX_BYTES = 200 * 1024 * 1024  # 200 Mo sur disque au maximum
+EVICTION_EVERY_N_WRITES = 100        # L'éviction est amortie, pas faite à chaque écriture
+
+
+def make_cache_key(prompt, llm_string):
+    """
+    Clé = hash(modèle + température + paramètres, prompt complet).
+    `llm_string` est fourni par LangChain (modèle, température, stop...) et `prompt`
+    contient le texte final envoyé au LLM, scratchpad ReAct inclus.
+    """
+    h = hashlib.sha256()
+    h.update(llm_string.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(prompt.encode("utf-8"))
+    return h.hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Cache persistant des réponses LLM (SQLite local), avec TTL et éviction LRU
+    par nombre d'entrées et par taille totale.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Une seule connexion partagée (Streamlit et l'évaluation sont multi-threads)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt, llm_string):
+        key = make_cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+
+        generations = loads(row[0])
+        for gen in generations:
+            # Marqueur lisible par l'UI et l'instrumentation
+            if hasattr(gen, "message"):
+                gen.message.response_metadata["cache_hit"] = True
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = make_cache_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % EVICTION_EVERY_N_WRITES == 0:
+                self._evict(now)
+
+    def _evict(self, now):
+        """Supprime les entrées expirées puis les moins récemment utilisées au-delà des limites."""
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        if count > self.max_entries or total > self.max_bytes:
+            # On parcourt du plus ancien au plus récent jusqu'à repasser sous les deux limites
+            to_delete = []
+            for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at ASC"):
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                to_delete.append((key,))
+                count -= 1
+                total -= size
+            self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", to_delete)
+        self._conn.commit()
+
+    def evict(self):
+        with self._lock:
+            self._evict(time.time())
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+
+_LLM_CACHE = None
+
+
+def get_llm_cache():
+    """Instance partagée du cache (None si désactivé via MINDCARE_LLM_CACHE=0)."""
+    global _LLM_CACHE
+    if os.getenv("MINDCARE_LLM_CACHE", "1") == "0":
+        return None
+    if _LLM_CACHE is None:
+        _LLM_CACHE = SQLiteLLMCache()
+    return _LLM_CACHE
@@ -0,0 +1,250 @@
+import os
+import time
+import unicodedata
+from collections import deque
+
+from mindcare_models import detect_language
+
+# Filtre de crise exécuté AVANT l'agent : un automate d'Aho-Corasick parcourt le message
+# une seule fois, quelle que soit la taille du lexique (coût linéaire en la longueur du
+# message, qui est donc analysé en entier). En cas de détection, une réponse
+# d'ancrage pré-calculée est affichée immédiatement, sans attendre la boucle ReAct.
+
+# --- CONFIGURATION ---
+LEXICON_PATH = os.getenv("MINDCARE_CRISIS_LEXICON", "crisis_lexicon.txt")
+GUIDE_PATH = "psychology_guide.txt"
+BUDGET_US = 200             # Budget par message (mesuré et exposé dans stats())
+SEVERITY = {"suicide": 3, "self_harm": 2, "panic": 1}
+
+# Numéros d'urgence (Belgique)
+EMERGENCY_NUMBER = "112"
+SUICIDE_LINE = "1813"
+
+BOX_BREATHING_FALLBACK = ("Technique de la respiration carrée (Box Breathing) : Inspirer 4s, Retenir 4s, "
+                          "Expirer 4s, Retenir 4s. Répéter 4 fois.")
+BOX_BREATHING_EN = ("Box Breathing: breathe in for 4 seconds, hold for 4, breathe out for 4, hold for 4. "
+                    "Repeat 4 times. This activates the parasympathetic system and slows your heart.")
+
+RESPONSES = {
+    ("panic", "fr"): "Je suis là avec vous. Essayons ensemble, tout de suite :\n\n> {breathing}\n\n"
+                     "Concentrez-vous seulement sur le compte. Si la sensation devient insupportable "
+                     "ou s'accompagne d'une douleur thoracique, appelez le {emergency}.",
+    ("panic", "en"): "I am here with you. Let's do this together, right now:\n\n> {breathing_en}\n\n"
+                     "Focus only on the count. If it becomes unbearable or comes with chest pain, "
+                     "call {emergency}.",
+    ("distress", "fr"): "Je suis vraiment désolé que vous traversiez cela, et je suis content que vous en parliez. "
+                        "Vous n'êtes pas seul(e). **Si vous êtes en danger immédiat, appelez le {emergency}.** "
+                        "Vous pouvez parler à quelqu'un maintenant, 24h/24, gratuitement et anonymement : "
+                        "**Centre de Prévention du Suicide, {suicide_line}**.\n\n"
+                        "En attendant, respirons ensemble :\n\n> {breathing}",
+    ("distress", "en"): "I am really sorry you are going through this, and I am glad you told me. "
+                        "You are not alone. **If you are in immediate danger, call {emergency}.** "
+                        "You can talk to someone right now, 24/7, free and anonymous: "
+                        "**Suicide Prevention Centre (Belgium), {suicide_line}**.\n\n"
+                        "Meanwhile, let's breathe together:\n\n> {breathing_en}",
+}
+
+# Accents retirés, tout ce qui n'est pas lettre/chiffre devient un espace (table C, sans boucle Python)
+_NORMALIZE = {}
+for _code in range(0x250):
+    _char = chr(_code)
+    _base = unicodedata.normalize("NFKD", _char)[0].lower()
+    _NORMALIZE[_code] = _base if _base.isalnum() else " "
+_NORMALIZE.update({ord("’"): " ", ord("‘"): " ", ord("«"): " ", ord("»"): " "})
+
+
+def normalize(text):
+    return " " + text.lower().translate(_NORMALIZE) + " "
+
+
+class CrisisMatch:
+    """Résultat d'une détection : catégorie, expression, réponse d'ancrage prête à afficher."""
+
+    def __init__(self, category, lang, phrase, response, elapsed_us):
+        self.category = category
+        self.lang = lang
+        self.phrase = phrase
+        self.response = response
+        self.elapsed_us = elapsed_us
+
+    def to_dict(self):
+        return {"category": self.category, "lang": self.lang, "phrase": self.phrase,
+                "elapsed_us": round(self.elapsed_us, 1)}
+
+
+class CrisisScreener:
+    """Automate d'Aho-Corasick sur le lexique FR/EN (mots entiers, espaces multiples ignorés)."""
+
+    def __init__(self, lexicon_path=LEXICON_PATH, guide_path=GUIDE_PATH):
+        self.entries = load_lexicon(lexicon_path)
+        self.responses = build_responses(load_breathing_passage(guide_path))
+        self.screened = 0
+        self.matches = 0
+        self.over_budget = 0
+        self.max_us = 0.0
+        self._build([normalized for normalized, *_ in self.entries])
+
+    def _build(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]   # Index (dans self.entries) du motif le plus grave terminant ici
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state] = self._worst(self._out[state], index)
+
+        # Liens d'échec en largeur ; les sorties héritent de celles du suffixe
+        queue = deque(self._goto[0].values())  # Profondeur 1 : lien d'échec vers la racine
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] = self._worst(self._out[nxt], self._out[self._fail[nxt]])
+
+    def _worst(self, a, b):
+        if a is None:
+            return b
+        if b is None:
+            return a
+        return a if SEVERITY[self.entries[a][1]] >= SEVERITY[self.entries[b][1]] else b
+
+    def screen(self, text):
+        """CrisisMatch si le message contient une expression du lexique, sinon None."""
+        t0 = time.perf_counter()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        found = None
+        previous = ""
+        for char in normalize(text):
+            if char == " " and previous == " ":
+                continue
+            previous = char
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state] is not None:
+                found = self._worst(found, out[state])
+        elapsed_us = (time.perf_counter() - t0) * 1e6
+
+        self.screened += 1
+        self.max_us = max(self.max_us, elapsed_us)
+        if elapsed_us > BUDGET_US:
+            self.over_budget += 1
+        if found is None:
+            return None
+        self.matches += 1
+        _, category, languages, phrase = self.entries[found]
+        # Expression commune aux deux langues (ex : "suicide") : la langue vient du message
+        lang = languages[0] if len(languages) == 1 else detect_language(text)
+        kind = "panic" if category == "panic" else "distress"
+        return CrisisMatch(category, lang, phrase, self.responses[(kind, lang)], elapsed_us)
+
+    def stats(self):
+        return {"screened": self.screened, "matches": self.matches, "over_budget": self.over_budget,
+                "max_us": round(self.max_us, 1), "budget_us": BUDGET_US, "patterns": len(self.entries)}
+
+
+def load_lexicon(path):
+    """
+    [(motif normalisé, catégorie, langues, expression)] ; motif entouré d'espaces = mots entiers.
+    Un motif présent dans plusieurs langues n'a qu'une entrée (la plus grave) avec toutes ses langues.
+    """
+    entries = []
+    by_pattern = {}
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) != 3 or parts[0] not in SEVERITY:
+                raise ValueError(f"{path}:{line_no} : ligne invalide ({line})")
+            category, lang, phrase = parts
+            pattern = " " + " ".join(normalize(phrase).split()) + " "
+            index = by_pattern.get(pattern)
+            if index is None:
+                by_pattern[pattern] = len(entries)
+                entries.append((pattern, category, (lang,), phrase))
+                continue
+            _, known_category, languages, known_phrase = entries[index]
+            if SEVERITY[category] > SEVERITY[known_category]:
+                known_category, known_phrase = category, phrase
+            if lang not in languages:
+                languages += (lang,)
+            entries[index] = (pattern, known_category, languages, known_phrase)
+    return entries
+
+
+def load_breathing_passage(path):
+    """La ligne 'Box Breathing' du manuel clinique (celui indexé par le RAG)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if "Box Breathing" in line:
+                    return line.strip()
+    except FileNotFoundError:
+        pass
+    return BOX_BREATHING_FALLBACK
+
+
+def build_responses(breathing):
+    """Réponses pré-calculées au chargement : rien n'est formaté pendant le filtrage."""
+    return {key: template.format(breathing=breathing, breathing_en=BOX_BREATHING_EN,
+                                 emergency=EMERGENCY_NUMBER, suicide_line=SUICIDE_LINE)
+            for key, template in RESPONSES.items()}
+
+
+_SCREENER = None
+
+
+def get_crisis_screener():
+    """Instance partagée (lexique compilé une seule fois par processus)."""
+    global _SCREENER
+    if _SCREENER is None:
+        _SCREENER = CrisisScreener()
+    return _SCREENER
+
+
+# --- TEST RAPIDE (latence par message) ---
+if __name__ == "__main__":
+    screener = CrisisScreener()
+    samples = [
+        "I am having a panic attack, how do I breathe?",
+        "Je fais une crise d'angoisse, j'étouffe",
+        "Sometimes I think everyone would be better off dead... I want to die",
+        "J'ai envie de mourir",
+        "I ate a sandwich.",
+        "I feel completely lost and alone.",
+    ]
+    for sample in samples:
+        match = screener.screen(sample)
+        print(f" {sample[:45]:<47} -> {match.to_dict() if match else '-'}")
+
+    # Non-régression : une expression commune FR/EN ne doit pas imposer la réponse anglaise
+    for sample, expected_lang in [("Je pense au suicide", "fr"), ("I keep thinking about suicide", "en"),
+                                  ("J'ai envie de mourir", "fr"), ("I want to die", "en"),
+                                  ("x " * 600 + "I want to die", "en")]:  # Expression en fin de long message
+        match = screener.screen(sample)
+        assert match is not None and match.lang == expected_lang, (sample, match and match.to_dict())
+        assert match.response == screener.responses[("distress", expected_lang)], sample
+    print(" Langue des réponses : OK")
+
+    durations = []
+    for _ in range(2000):
+        for sample in samples:
+            t0 = time.perf_counter()
+            screener.screen(sample)
+            durations.append((time.perf_counter() - t0) * 1e6)
+    durations.sort()
+    print(f"\n p50={durations[len(durations) // 2]:.1f}µs  p99={durations[int(len(durations) * 0.99)]:.1f}µs  "
+          f"budget={BUDGET_US}µs  ({len(screener.entries)} expressions)")
@@ -0,0 +1,318 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+# Journal des émotions classifiées (toutes sessions), en colonnes NumPy ajoutées en fin de
+# tableau. Les agrégats du tableau de bord (comptes, humeur EWMA, dominante par fenêtre)
+# sont tenus à jour à chaque événement : une requête ne relit jamais l'historique.
+
+# --- CONFIGURATION ---
+EMOTIONS = ["Sadness", "Joy", "Love", "Anger", "Fear", "Surprise", "Unknown"]
+EMOTION_CODES = {name: code for code, name in enumerate(EMOTIONS)}
+UNKNOWN_CODE = EMOTION_CODES["Unknown"]
+EWMA_ALPHA = 0.3            # Poids du dernier message dans l'humeur lissée
+WINDOW_S = 3600             # Fenêtres d'une heure pour les dominantes
+MAX_WINDOWS = 24 * 30       # Fenêtres gardées (30 jours)
+TIMELINE_POINTS = 200       # Derniers points par session pour la courbe du dashboard
+INITIAL_CAPACITY = 1024
+STORE_FETCH_ROWS = 50000
+
+
+def emotion_code(emotion):
+    return EMOTION_CODES.get(str(emotion).capitalize(), UNKNOWN_CODE) if emotion else UNKNOWN_CODE
+
+
+class SessionRollup:
+    """Agrégats d'une session : comptes par émotion, humeur lissée, derniers points."""
+
+    __slots__ = ("counts", "mood", "events", "timeline")
+
+    def __init__(self):
+        self.counts = np.zeros(len(EMOTIONS), dtype=np.int64)
+        self.mood = 0.0
+        self.events = 0
+        self.timeline = deque(maxlen=TIMELINE_POINTS)  # (step, index de l'événement)
+
+
+class EventLog:
+    """
+    Colonnes : session (code interné, uint32), ts (float64), emotion (uint8), score et
+    confidence (float32) ; ~21 octets par événement, capacité doublée quand c'est plein.
+    Toutes les requêtes de lecture du dashboard sont en O(1) par rapport à la longueur
+    de l'historique (au pire O(fenêtres demandées) ou O(points affichés)).
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.size = 0
+        self._session = np.empty(capacity, dtype=np.uint32)
+        self._ts = np.empty(capacity, dtype=np.float64)
+        self._emotion = np.empty(capacity, dtype=np.uint8)
+        self._score = np.empty(capacity, dtype=np.float32)
+        self._confidence = np.empty(capacity, dtype=np.float32)
+        self._session_codes = {}
+        self._session_ids = []
+        self._sessions = []                  # SessionRollup par code de session
+        self._counts = np.zeros(len(EMOTIONS), dtype=np.int64)
+        self._mood = 0.0
+        self._windows = OrderedDict()        # Début de fenêtre -> comptes par émotion
+        self._lock = threading.Lock()
+
+    # --- ÉCRITURE ---
+    def _reserve(self, extra):
+        needed = self.size + extra
+        capacity = len(self._ts)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_session", "_ts", "_emotion", "_score", "_confidence"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _intern(self, session_id):
+        code = self._session_codes.get(session_id)
+        if code is None:
+            code = self._session_codes[session_id] = len(self._session_ids)
+            self._session_ids.append(session_id)
+            self._sessions.append(SessionRollup())
+        return code
+
+    def _window(self, start):
+        counts = self._windows.get(start)
+        if counts is None:
+            counts = self._windows[start] = np.zeros(len(EMOTIONS), dtype=np.int64)
+            while len(self._windows) > MAX_WINDOWS:
+                self._windows.popitem(last=False)
+        return counts
+
+    def append(self, session_id, emotion, score, confidence=0.0, ts=None):
+        """Ajoute un message classifié et met à jour tous les agrégats (O(1) amorti)."""
+        ts = time.time() if ts is None else ts
+        code = emotion_code(emotion)
+        with self._lock:
+            self._reserve(1)
+            session = self._intern(session_id)
+            i = self.size
+            self._session[i], self._ts[i], self._emotion[i] = session, ts, code
+            self._score[i], self._confidence[i] = score, confidence
+            self.size += 1
+
+            rollup = self._sessions[session]
+            rollup.counts[code] += 1
+            rollup.events += 1
+            rollup.mood += EWMA_ALPHA * (score - rollup.mood)
+            rollup.timeline.append((rollup.events, i))
+            self._counts[code] += 1
+            self._mood += EWMA_ALPHA * (score - self._mood)
+            self._window(int(ts // WINDOW_S) * WINDOW_S)[code] += 1
+
+    def extend(self, session_ids, emotions, scores, confidences, timestamps):
+        """Ajout en bloc (rechargement d'historique) : agrégats calculés de façon vectorisée."""
+        n = len(session_ids)
+        if n == 0:
+            return
+        order = np.argsort(np.asarray(timestamps, dtype=np.float64), kind="stable")
+        ts = np.asarray(timestamps, dtype=np.float64)[order]
+        # factorize : une conversion par valeur distincte, pas par ligne (-1 = None -> Unknown)
+        emotion_index, emotion_values = pd.factorize(pd.Series(emotions, dtype=object))
+        codes = np.array([emotion_code(e) for e in emotion_values] + [UNKNOWN_CODE], dtype=np.uint8)[emotion_index][order]
+        scores = np.nan_to_num(np.asarray(scores, dtype=np.float64)[order])
+        confidences = np.nan_to_num(np.asarray(confidences, dtype=np.float64)[order])
+        with self._lock:
+            session_index, session_values = pd.factorize(pd.Series(session_ids, dtype=object))
+            sessions = np.array([self._intern(s) for s in session_values], dtype=np.uint32)[session_index][order]
+            self._reserve(n)
+            start = self.size
+            stop = start + n
+            self._session[start:stop], self._ts[start:stop], self._emotion[start:stop] = sessions, ts, codes
+            self._score[start:stop], self._confidence[start:stop] = scores, confidences
+            self.size = stop
+
+            k = len(EMOTIONS)
+            self._counts += np.bincount(codes, minlength=k)
+            # EWMA en forme close : m_n = (1-a)^n m_0 + somme a (1-a)^(n-1-i) x_i
+            decay = 1.0 - EWMA_ALPHA
+            self._mood = decay ** n * self._mood + float(np.sum(EWMA_ALPHA * decay ** np.arange(n - 1, -1, -1) * scores))
+
+            # Par session : événements regroupés (ordre chronologique conservé), rang depuis la fin
+            by_session = np.lexsort((np.arange(n), sessions))
+            grouped = sessions[by_session]
+            bounds = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1], True])
+            sizes = np.diff(bounds)
+            group_of = np.repeat(np.arange(len(sizes)), sizes)
+            rank_from_end = bounds[1:][group_of] - 1 - np.arange(n)
+            mood_added = np.bincount(group_of, weights=EWMA_ALPHA * decay ** rank_from_end * scores[by_session],
+                                     minlength=len(sizes))
+            counts_added = np.bincount(group_of * k + codes[by_session], minlength=len(sizes) * k).reshape(-1, k)
+            for g, (lo, hi) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+                rollup = self._sessions[int(grouped[lo])]
+                rollup.mood = decay ** (hi - lo) * rollup.mood + mood_added[g]
+                rollup.counts += counts_added[g]
+                tail = max(lo, hi - TIMELINE_POINTS)
+                first_step = rollup.events + 1 + (tail - lo)
+                rollup.events += hi - lo
+                rollup.timeline.extend(zip(range(first_step, first_step + hi - tail),
+                                           (by_session[tail:hi] + start).tolist()))
+
+            window_starts = (ts // WINDOW_S).astype(np.int64) * WINDOW_S
+            uniques, inverse = np.unique(window_starts, return_inverse=True)
+            per_window = np.zeros((len(uniques), k), dtype=np.int64)
+            np.add.at(per_window, (inverse, codes), 1)
+            for window_start, counts in zip(uniques, per_window):
+                self._window(int(window_start))[:] += counts
+
+    # --- LECTURE (O(1) par rapport à l'historique) ---
+    def _rollup(self, session_id):
+        code = self._session_codes.get(session_id)
+        return None if code is None else self._sessions[code]
+
+    def counts(self, session_id=None):
+        """{émotion: nombre} pour une session, ou toutes sessions confondues."""
+        if session_id is None:
+            counts = self._counts
+        else:
+            rollup = self._rollup(session_id)
+            counts = rollup.counts if rollup else np.zeros(len(EMOTIONS), dtype=np.int64)
+        return dict(zip(EMOTIONS, counts.tolist()))
+
+    def dominant(self, session_id=None):
+        """Émotion la plus fréquente ('-' si aucun message)."""
+        rollup = self._rollup(session_id) if session_id is not None else None
+        counts = self._counts if session_id is None else (rollup.counts if rollup else None)
+        if counts is None or counts.sum() == 0:
+            return "-"
+        return EMOTIONS[int(np.argmax(counts))]
+
+    def mood(self, session_id=None):
+        """Humeur lissée (EWMA des scores de positivité, entre -1 et 1)."""
+        if session_id is None:
+            return self._mood
+        rollup = self._rollup(session_id)
+        return rollup.mood if rollup else 0.0
+
+    def session_events(self, session_id):
+        rollup = self._rollup(session_id)
+        return rollup.events if rollup else 0
+
+    def window_dominants(self, last=24, now=None):
+        """Dominante des `last` dernières fenêtres (les plus récentes en dernier)."""
+        now = time.time() if now is None else now
+        current = int(now // WINDOW_S) * WINDOW_S
+        rows = []
+        for start in range(current - (last - 1) * WINDOW_S, current + 1, WINDOW_S):
+            counts = self._windows.get(start)
+            total = int(counts.sum()) if counts is not None else 0
+            rows.append({
+                "window": pd.Timestamp(start, unit="s"),
+                "messages": total,
+                "dominant": EMOTIONS[int(np.argmax(counts))] if total else "-",
+            })
+        return pd.DataFrame(rows)
+
+    def timeline(self, session_id):
+        """Derniers points de la session (Step, Score, Emotion) pour la courbe, bornés à TIMELINE_POINTS."""
+        rollup = self._rollup(session_id)
+        if rollup is None or not rollup.timeline:
+            return pd.DataFrame(columns=["Step", "Score", "Emotion"])
+        steps, indices = zip(*rollup.timeline)
+        indices = np.fromiter(indices, dtype=np.int64, count=len(indices))
+        return pd.DataFrame({
+            "Step": steps,
+            "Score": self._score[indices].astype(float),
+            "Emotion": [EMOTIONS[c] for c in self._emotion[indices]],
+        })
+
+    # --- ANALYSE HORS LIGNE ---
+    def to_frame(self):
+        """Tout le journal en DataFrame (analyses inter-sessions, pas pour le dashboard)."""
+        n = self.size
+        return pd.DataFrame({
+            "session_id": np.asarray(self._session_ids, dtype=object)[self._session[:n]] if n else [],
+            "ts": self._ts[:n],
+            "emotion": pd.Categorical.from_codes(self._emotion[:n], EMOTIONS),
+            "score": self._score[:n],
+            "confidence": self._confidence[:n],
+        })
+
+    def memory_bytes(self):
+        return sum(getattr(self, name).nbytes for name in ("_session", "_ts", "_emotion", "_score", "_confidence"))
+
+    def stats(self):
+        return {"events": self.size, "sessions": len(self._session_ids), "windows": len(self._windows),
+                "memory_mb": round(self.memory_bytes() / 1024 ** 2, 2)}
+
+
+def load_from_session_store(store, log=None):
+    """Reconstruit le journal depuis la table `turns` du SessionStore (lecture par blocs)."""
+    log = log or EventLog()
+    cursor = store._reader().execute(
+        "SELECT session_id, created_at, emotion, score, confidence FROM turns ORDER BY created_at"
+    )
+    while True:
+        rows = cursor.fetchmany(STORE_FETCH_ROWS)
+        if not rows:
+            break
+        session_ids, timestamps, emotions, scores, confidences = zip(*rows)
+        log.extend(session_ids, emotions, [s if s is not None else 0.0 for s in scores],
+                   [c if c is not None else 0.0 for c in confidences], timestamps)
+    return log
+
+
+_EVENT_LOG = None
+_EVENT_LOG_LOCK = threading.Lock()
+
+
+def get_event_log():
+    """Journal partagé du processus, rechargé une fois depuis les sessions persistées."""
+    global _EVENT_LOG
+    with _EVENT_LOG_LOCK:
+        if _EVENT_LOG is None:
+            from mindcare_sessions import get_session_store
+            t0 = time.perf_counter()
+            _EVENT_LOG = load_from_session_store(get_session_store())
+            if _EVENT_LOG.size:
+                print(f" Journal d'émotions : {_EVENT_LOG.size} événements rechargés "
+                      f"en {time.perf_counter() - t0:.2f}s")
+        return _EVENT_LOG
+
+
+# --- TEST RAPIDE (coût des requêtes sur un gros historique) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark du journal d'émotions (ajout et requêtes O(1)).")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    scores_by_code = np.array([-1.0, 1.0, 1.0, -1.0, -0.5, 0.5, 0.0])
+    codes = rng.integers(0, len(EMOTIONS), args.events)
+    now = time.time()
+    log = EventLog()
+    t0 = time.perf_counter()
+    log.extend([f"s{i}" for i in rng.integers(0, args.sessions, args.events)], [EMOTIONS[c] for c in codes],
+               scores_by_code[codes], rng.random(args.events), now - rng.random(args.events) * 7 * 86400)
+    print(f" Chargement en bloc : {args.events} événements en {time.perf_counter() - t0:.2f}s  {log.stats()}")
+
+    t0 = time.perf_counter()
+    for i in range(10000):
+        log.append("s1", "Joy", 1.0, 0.9)
+    print(f" append : {(time.perf_counter() - t0) / 10000 * 1e6:.1f} µs")
+
+    for label, query in [
+        ("dominant(session)", lambda: log.dominant("s1")),
+        ("mood(session)", lambda: log.mood("s1")),
+        ("counts()", lambda: log.counts()),
+        ("window_dominants(24)", lambda: log.window_dominants(24)),
+        ("timeline(session)", lambda: log.timeline("s1")),
+    ]:
+        t0 = time.perf_counter()
+        for _ in range(200):
+            query()
+        print(f" {label:<22} : {(time.perf_counter() - t0) / 200 * 1e6:8.1f} µs")
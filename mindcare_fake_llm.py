@@ -0,0 +1,118 @@
+import random
+import time
+import zlib
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field, PrivateAttr
+
+# Faux LLM local : rejoue des sorties ReAct scriptées avec une latence réaliste,
+# pour tester la charge de l'agent sans consommer de quota Mistral.
+
+# Un script = les sorties successives du LLM pour un tour (une par étape ReAct).
+# "{input}" est remplacé par la question de l'utilisateur.
+DEFAULT_SCRIPTS = [
+    [
+        'Thought: I must first identify the emotion.\nAction: emotion_classifier\nAction Input: "{input}"',
+        'Thought: I will get advice for this emotion.\nAction: advice_lookup\nAction Input: "sadness"',
+        'Thought: I will also check for a local place.\nAction: activity_recommendation\nAction Input: "sadness"',
+        "Thought: I now know the final answer\nFinal Answer: I hear how heavy things feel right now. "
+        "You are not alone. A walk in the Parc de Bruxelles might offer a moment of peace.",
+    ],
+    [
+        'Thought: The user asks for a technique. I need clinical knowledge.\nAction: knowledge_retriever\n'
+        'Action Input: "how to breathe during a panic attack"',
+        "Thought: I now know the final answer\nFinal Answer: I am here with you. Let's try Box Breathing "
+        "together: inhale for 4 seconds, hold for 4, exhale for 4, hold for 4.",
+    ],
+    [
+        'Thought: I will check for hidden emotions just in case.\nAction: emotion_classifier\nAction Input: "{input}"',
+        "Thought: I now know the final answer\nFinal Answer: Thank you for sharing. How are you feeling otherwise today?",
+    ],
+]
+
+# Latence par défaut ~ Mistral Large : log-normale, médiane autour de 800 ms
+DEFAULT_LATENCY = {"dist": "lognormal", "median_ms": 800, "sigma": 0.5}
+
+
+def sample_latency_ms(spec, rng):
+    """Tire une latence (ms) selon une distribution : fixed, uniform, normal ou lognormal."""
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        value = spec.get("ms", spec.get("median_ms", 0))
+    elif dist == "uniform":
+        value = rng.uniform(spec["min_ms"], spec["max_ms"])
+    elif dist == "normal":
+        value = rng.gauss(spec["mean_ms"], spec.get("std_ms", 0))
+    elif dist == "lognormal":
+        # median_ms = exp(mu) : plus intuitif à régler que mu
+        value = spec["median_ms"] * rng.lognormvariate(0.0, spec.get("sigma", 0.5))
+    else:
+        raise ValueError(f"Distribution de latence inconnue : {dist}")
+    return max(0.0, min(value, spec.get("max_ms", float("inf"))))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model local qui rejoue des sorties ReAct.
+    Sans état entre appels : le script est choisi par hash de la question et l'étape
+    par le nombre d'Observations déjà présentes dans le scratchpad. Des centaines de
+    sessions concurrentes peuvent donc partager la même instance.
+    """
+
+    scripts: list[list[str]] = Field(default_factory=lambda: DEFAULT_SCRIPTS)
+    latency: dict = Field(default_factory=lambda: dict(DEFAULT_LATENCY))
+    # Débit de génération simulé en streaming (le premier token arrive après `latency`)
+    tokens_per_second: float = 60.0
+    streaming: bool = False
+    seed: int | None = None
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "mindcare-scripted"
+
+    @property
+    def _identifying_params(self):
+        return {"model": "scripted", "latency": self.latency}
+
+    def _next_output(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        # Tout ce qui suit la dernière "Question:" = la question + le scratchpad ReAct
+        tail = prompt.rsplit("\nQuestion:", 1)[-1]
+        question = tail.split("\nThought:", 1)[0].strip()
+        step = tail.count("\nObservation:")
+
+        script = self.scripts[zlib.crc32(question.encode("utf-8")) % len(self.scripts)]
+        output = script[min(step, len(script) - 1)]
+        return output.replace("{input}", question.strip('"').replace('"', "'"))
+
+    @staticmethod
+    def _usage(messages, output):
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(output.split())
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        output = self._next_output(messages)
+        time.sleep(sample_latency_ms(self.latency, self._rng) / 1000)
+        message = AIMessage(content=output, usage_metadata=self._usage(messages, output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        output = self._next_output(messages)
+        time.sleep(sample_latency_ms(self.latency, self._rng) / 1000)
+        words = output.split(" ")
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(delay)
+            text = word if i == 0 else " " + word
+            usage = self._usage(messages, output) if i == len(words) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
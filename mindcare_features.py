@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (moteur Parquet de pandas)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Features textuelles du notebook 1_analysis_EDA_features.ipynb (text_len, word_count,
+# caps_ratio, punct_count), calculées sans apply() : les textes d'un bloc sont concaténés
+# en un seul tableau de points de code, puis réduits segment par segment avec NumPy.
+
+# --- CONFIGURATION ---
+FEATURE_COLUMNS = ["text_len", "word_count", "caps_ratio", "punct_count"]
+CHUNK_ROWS = 100_000
+CACHE_DIR = os.getenv("MINDCARE_FEATURES_CACHE", ".cache/features")
+
+
+# Une classe par caractère (bits) : une seule indirection dans une table pour tout le bloc
+UPPER, SPACE, PUNCT = 1, 2, 4
+_ASCII_CLASSES = np.array(
+    [(UPPER if chr(c).isupper() else 0) | (SPACE if chr(c).isspace() else 0) | (PUNCT if chr(c) in "!?" else 0)
+     for c in range(128)] + [0],  # Index 128 : tout caractère non ASCII, traité à part
+    dtype=np.uint8,
+)
+
+
+def _char_classes(codes):
+    classes = _ASCII_CLASSES.take(np.minimum(codes, 128))
+    non_ascii = np.flatnonzero(codes >= 128)
+    if len(non_ascii):
+        # Rare (accents, emojis) : str.isupper / str.isspace sur les points de code distincts
+        uniques, inverse = np.unique(codes[non_ascii], return_inverse=True)
+        table = np.array([(UPPER if chr(c).isupper() else 0) | (SPACE if chr(c).isspace() else 0)
+                          for c in uniques], dtype=np.uint8)
+        classes[non_ascii] = table[inverse]
+    return classes
+
+
+def _segment_sums(mask, starts, lengths):
+    """Nombre de True de `mask` dans chaque segment [start, start + length) (masques creux)."""
+    positions = np.flatnonzero(mask)
+    return np.searchsorted(positions, starts + lengths) - np.searchsorted(positions, starts)
+
+
+def compute_features(texts):
+    """DataFrame des 4 features pour une liste / Series de textes (même sémantique que le notebook)."""
+    texts = [str(t) for t in texts]
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(texts) else lengths
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+
+    classes = _char_classes(codes)
+    upper = (classes & UPPER).astype(bool)
+    space = (classes & SPACE).astype(bool)
+    punct = (classes & PUNCT).astype(bool)
+
+    # Début de mot = caractère non blanc précédé d'un blanc ou en début de texte (= len(text.split()))
+    prev_space = np.empty_like(space)
+    if len(space):
+        prev_space[0] = True
+        prev_space[1:] = space[:-1]
+        prev_space[starts[lengths > 0]] = True
+    word_starts = ~space & prev_space
+
+    caps_ratio = _segment_sums(upper, starts, lengths) / np.maximum(lengths, 1)
+
+    return pd.DataFrame({
+        "text_len": lengths,
+        "word_count": _segment_sums(word_starts, starts, lengths),
+        "caps_ratio": caps_ratio,
+        "punct_count": _segment_sums(punct, starts, lengths),
+    })
+
+
+def compute_features_chunked(texts, chunk_rows=CHUNK_ROWS):
+    """Même résultat que compute_features, par blocs (mémoire bornée sur de gros volumes)."""
+    texts = pd.Series(texts, dtype=object)
+    parts = [compute_features(texts.iloc[i:i + chunk_rows]) for i in range(0, len(texts), chunk_rows)]
+    return pd.concat(parts, ignore_index=True) if parts else compute_features([])
+
+
+# --- CACHE (CLÉ = HASH DE L'ENTRÉE) ---
+def hash_texts(texts):
+    h = hashlib.sha256()
+    for text in texts:
+        h.update(str(text).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+def cached_features(texts, cache_dir=CACHE_DIR, chunk_rows=CHUNK_ROWS):
+    """Features lues depuis le cache (Parquet, sinon .npy) si cette entrée a déjà été traitée."""
+    texts = pd.Series(texts, dtype=object).astype(str)
+    key = hash_texts(texts)
+    os.makedirs(cache_dir, exist_ok=True)
+    parquet_path = os.path.join(cache_dir, f"features-{key}.parquet")
+    npy_path = os.path.join(cache_dir, f"features-{key}.npy")
+
+    if HAS_PARQUET and os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    if os.path.exists(npy_path):
+        return pd.DataFrame(np.load(npy_path), columns=FEATURE_COLUMNS).astype(
+            {"text_len": "int64", "word_count": "int64", "punct_count": "int64"})
+
+    features = compute_features_chunked(texts, chunk_rows)
+    if HAS_PARQUET:
+        features.to_parquet(parquet_path, index=False)
+    else:
+        np.save(npy_path, features[FEATURE_COLUMNS].to_numpy(dtype=np.float64))
+    return features
+
+
+# --- CLI : remplace la cellule du notebook ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Features textuelles vectorisées (text_len, word_count, ...).")
+    parser.add_argument("input", help="CSV avec une colonne 'text' (ex: splits/train.csv)")
+    parser.add_argument("--out", default="emotions_cleaned_features.csv", help="CSV (ou .parquet) de sortie")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input)
+    df["text"] = df["text"].astype(str)
+    features = cached_features(df["text"], chunk_rows=args.chunk_rows)
+    df[FEATURE_COLUMNS] = features[FEATURE_COLUMNS].to_numpy()
+    for col in ("text_len", "word_count", "punct_count"):
+        df[col] = df[col].astype("int64")
+
+    if args.out.endswith(".parquet"):
+        df.to_parquet(args.out, index=False)
+    else:
+        df.to_csv(args.out, index=False)
+    print(f" {len(df)} lignes -> {args.out}")
+    print(df[FEATURE_COLUMNS].describe().round(3))
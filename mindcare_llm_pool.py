@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+from collections import deque
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_mistralai import ChatMistralAI
+from pydantic import Field, PrivateAttr
+
+# --- CONFIGURATION ---
+KEY_ENV_VARS = ["MISTRAL_KEY_1", "MISTRAL_KEY_2", "MISTRAL_API_KEY"]
+FAILURE_THRESHOLD = 3           # Échecs consécutifs avant d'ouvrir le circuit
+ERROR_RATE_THRESHOLD = 0.5      # ... ou taux d'erreur sur la fenêtre glissante
+ERROR_WINDOW = 20               # Nombre de derniers appels pris en compte
+MIN_CALLS_FOR_RATE = 5
+OPEN_COOLDOWN_S = 30.0          # Durée d'ouverture du circuit (doublée à chaque rechute)
+MAX_OPEN_COOLDOWN_S = 600.0
+AUTH_COOLDOWN_S = 600.0         # Clé révoquée / invalide : on l'écarte longtemps
+RATE_LIMIT_BACKOFF_S = 2.0      # Pause après un 429 sans en-tête Retry-After
+MAX_RATE_LIMIT_BACKOFF_S = 60.0
+MAX_PACING_WAIT_S = 5.0         # Attente maximale pour respecter le débit d'une clé
+MAX_EXTRA_ATTEMPTS = 2          # Tentatives au-delà d'une par clé
+
+
+def load_api_keys():
+    """Toutes les clés Mistral configurées dans le .env (sans doublons)."""
+    keys = []
+    for var in KEY_ENV_VARS:
+        key = os.getenv(var)
+        if key and len(key) > 10 and key not in keys:
+            keys.append(key)
+    return keys
+
+
+class KeyState:
+    """État d'une clé : client HTTP dédié (connexions réutilisées), débit, erreurs, circuit."""
+
+    def __init__(self, index, api_key, client, max_rps):
+        self.index = index
+        self.label = f"#{index + 1} ({api_key[:4]}...)"
+        self.client = client
+        self.min_interval = 1.0 / max_rps if max_rps else 0.0
+        self.next_allowed_at = 0.0      # Pacing local (limite de débit par clé)
+        self.rate_limited_until = 0.0   # Pause imposée par un 429
+        self.rate_limit_hits = 0
+        self.rate_limit_streak = 0      # 429 consécutifs (backoff exponentiel)
+        self.circuit = "closed"         # closed -> open -> half_open -> closed
+        self.opened_at = 0.0
+        self.open_cooldown = OPEN_COOLDOWN_S
+        self.consecutive_failures = 0
+        self.outcomes = deque(maxlen=ERROR_WINDOW)
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def available(self, now):
+        if self.circuit == "open":
+            if now - self.opened_at < self.open_cooldown:
+                return False
+            # Fin de la pause : une seule requête de test passe (half-open)
+            self.circuit = "half_open"
+        if self.circuit == "half_open" and self.in_flight > 0:
+            return False
+        return now >= self.rate_limited_until
+
+    def snapshot(self):
+        return {
+            "key": self.label,
+            "circuit": self.circuit,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 3),
+            "rate_limit_hits": self.rate_limit_hits,
+        }
+
+
+class PooledChatMistral(BaseChatModel):
+    """
+    ChatMistralAI réparti sur toutes les clés configurées.
+    Chaque requête part sur la clé saine la moins chargée ; un 429, un timeout ou une
+    erreur serveur bascule la requête sur une autre clé et alimente le circuit breaker.
+    """
+
+    api_keys: list[str] = Field(default_factory=load_api_keys, exclude=True)
+    model: str = "mistral-large-latest"
+    temperature: float = 0.2
+    endpoint: str | None = None
+    timeout: int = 60
+    streaming: bool = False
+    max_rps_per_key: float | None = None
+
+    _states: list = PrivateAttr(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context):
+        if not self.api_keys:
+            raise ValueError("Aucune clé Mistral fournie au pool.")
+        for i, key in enumerate(self.api_keys):
+            client = ChatMistralAI(
+                api_key=key, model=self.model, temperature=self.temperature,
+                endpoint=self.endpoint, timeout=self.timeout,
+                max_retries=1,  # Les reprises sont faites par le pool, sur une autre clé
+            )
+            self._states.append(KeyState(i, key, client, self.max_rps_per_key))
+
+    @property
+    def _llm_type(self):
+        return "mistral-pool"
+
+    @property
+    def _identifying_params(self):
+        # Indépendant des clés : le cache LLM est partagé par tout le pool
+        return {"model": self.model, "temperature": self.temperature}
+
+    # --- SÉLECTION DES CLÉS ---
+    def _acquire(self, exclude):
+        """Réserve la meilleure clé disponible, en attendant si besoin la fin d'un 429 ou du pacing."""
+        deadline = time.monotonic() + MAX_PACING_WAIT_S
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [s for s in self._states if s is not exclude and s.available(now)]
+                if not candidates and exclude is not None and exclude.available(now):
+                    candidates = [exclude]  # Dernier recours : la seule clé encore utilisable
+                if candidates:
+                    # La clé dont le créneau arrive le plus tôt, puis la moins occupée
+                    best = min(candidates, key=lambda s: (max(s.next_allowed_at, now), s.in_flight))
+                    wait = best.next_allowed_at - now
+                    if wait <= 0 or now + wait > deadline:
+                        best.next_allowed_at = max(best.next_allowed_at, now) + best.min_interval
+                        best.in_flight += 1
+                        best.requests += 1
+                        return best
+                else:
+                    # Aucune clé prête : on attend la première fin de pause 429, si elle est proche
+                    resumes = [s.rate_limited_until for s in self._states if s.circuit != "open"]
+                    if not resumes or min(resumes) > deadline:
+                        return None
+                    wait = min(resumes) - now
+            time.sleep(min(max(wait, 0.001), 0.05))
+
+    def _release(self, state, error=None):
+        with self._lock:
+            state.in_flight -= 1
+            now = time.monotonic()
+            if error is None:
+                state.outcomes.append(1)
+                state.consecutive_failures = 0
+                state.rate_limit_streak = 0
+                if state.circuit != "closed":
+                    state.circuit = "closed"
+                    state.open_cooldown = OPEN_COOLDOWN_S
+                return
+
+            state.errors += 1
+            status = _status_code(error)
+            if status == 429:
+                state.rate_limit_hits += 1
+                state.rate_limit_streak += 1
+                retry_after = _retry_after(error)
+                backoff = retry_after if retry_after is not None else min(
+                    RATE_LIMIT_BACKOFF_S * 2 ** (state.rate_limit_streak - 1), MAX_RATE_LIMIT_BACKOFF_S
+                )
+                state.rate_limited_until = now + backoff
+                # Un 429 signale une clé saine mais saturée : pas d'impact sur le circuit
+                return
+
+            state.outcomes.append(0)
+            state.consecutive_failures += 1
+            if status in (401, 403):
+                self._open(state, now, AUTH_COOLDOWN_S)
+            elif state.circuit == "half_open":
+                self._open(state, now, min(state.open_cooldown * 2, MAX_OPEN_COOLDOWN_S))
+            elif state.consecutive_failures >= FAILURE_THRESHOLD or (
+                len(state.outcomes) >= MIN_CALLS_FOR_RATE and state.error_rate() >= ERROR_RATE_THRESHOLD
+            ):
+                self._open(state, now, state.open_cooldown)
+
+    @staticmethod
+    def _open(state, now, cooldown):
+        if state.circuit == "open":
+            return
+        state.circuit = "open"
+        state.opened_at = now
+        state.open_cooldown = cooldown
+        print(f" Circuit ouvert pour la clé {state.label} ({cooldown:.0f}s).")
+
+    def _call_with_failover(self, fn):
+        last_state = None
+        last_error = None
+        for _ in range(len(self._states) + MAX_EXTRA_ATTEMPTS):
+            state = self._acquire(exclude=last_state)
+            if state is None:
+                break
+            try:
+                result = fn(state.client)
+            except Exception as e:
+                self._release(state, e)
+                if not _is_retryable(e):
+                    raise
+                last_state, last_error = state, e
+                continue
+            self._release(state)
+            return result
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("Aucune clé Mistral disponible (circuits ouverts ou quota atteint).")
+
+    # --- INTERFACE LANGCHAIN ---
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return self._call_with_failover(
+            lambda client: client._generate(messages, stop=stop, **kwargs)
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        last_state = None
+        last_error = None
+        for _ in range(len(self._states) + MAX_EXTRA_ATTEMPTS):
+            state = self._acquire(exclude=last_state)
+            if state is None:
+                break
+            started = False
+            try:
+                for chunk in state.client._stream(messages, stop=stop, **kwargs):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._release(state, e)
+                # Impossible de rejouer sur une autre clé une réponse déjà entamée
+                if started or not _is_retryable(e):
+                    raise
+                last_state, last_error = state, e
+                continue
+            self._release(state)
+            return
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("Aucune clé Mistral disponible (circuits ouverts ou quota atteint).")
+
+    def stats(self):
+        with self._lock:
+            return [s.snapshot() for s in self._states]
+
+
+def _status_code(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def _retry_after(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        value = error.response.headers.get("retry-after")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+    return None
+
+
+def _is_retryable(error):
+    """429, 401/403 (clé en cause), 5xx et erreurs réseau : une autre clé peut réussir."""
+    status = _status_code(error)
+    if status is not None:
+        return status in (401, 403, 429) or status >= 500
+    return isinstance(error, (httpx.TransportError, httpx.StreamError))
+
+
+# --- TEST RAPIDE (contre le faux serveur local, sans quota) ---
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+    from fake_mistral_server import start_fake_server
+
+    server, url = start_fake_server(rate_429=0.2, rate_timeout=0.1, bad_keys=["fake-key-revoked-0003"])
+    pool = PooledChatMistral(
+        api_keys=["fake-key-healthy-0001", "fake-key-healthy-0002", "fake-key-revoked-0003"],
+        endpoint=url, timeout=2,
+    )
+
+    def ask(i):
+        try:
+            return pool.invoke(f"Bonjour {i}").content
+        except Exception as e:
+            return f"ÉCHEC : {type(e).__name__}"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        answers = list(executor.map(ask, range(40)))
+
+    print(f" Réponses OK : {sum(not a.startswith('ÉCHEC') for a in answers)}/{len(answers)}")
+    for row in pool.stats():
+        print(f"   {row}")
+    server.shutdown()
@@ -0,0 +1,487 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+
+from mindcare_startup import phase
+
+# Registre des classifieurs d'émotions par langue. Le TF-IDF d'origine est entraîné sur de
+# l'anglais (stop_words='english') : un message français doit passer par un modèle français
+# s'il existe. Chaque langue est chargée au premier message qui la demande, et les moins
+# récemment utilisées sont déchargées quand le plafond mémoire est atteint.
+#
+# Disposition des artefacts (dans une version, ou directement dans models/ sans versions) :
+#   LogisticRegression.pkl, tfidf_vectorizer.pkl            -> langue par défaut (en)
+#   <langue>/LogisticRegression.pkl, .../tfidf_vectorizer.pkl -> autres langues (ex: fr/)
+#
+# Versions : models/versions/<version>/ (artefacts + manifest.json, jamais modifiés une fois
+# publiés). Le fichier models/CURRENT contient la version active, models/CANDIDATE celle
+# évaluée en mode shadow ; ils sont remplacés atomiquement (os.replace). Les processus
+# relisent le pointeur entre deux requêtes et basculent sans redémarrage.
+
+# --- CONFIGURATION ---
+MODELS_DIR = os.getenv("MINDCARE_MODELS_DIR", "models")
+VERSIONS_DIR = "versions"
+ACTIVE_POINTER = "CURRENT"
+CANDIDATE_POINTER = "CANDIDATE"
+MANIFEST_FILE = "manifest.json"
+DEFAULT_LANGUAGE = "en"
+MODEL_FILE = "LogisticRegression.pkl"
+VECTORIZER_FILE = "tfidf_vectorizer.pkl"
+MAX_MEMORY_MB = float(os.getenv("MINDCARE_MODEL_CACHE_MB", "256"))
+POINTER_CHECK_S = 2.0       # Relecture du pointeur au plus toutes les 2s (un stat par requête sinon)
+
+SHADOW_RATE = float(os.getenv("MINDCARE_SHADOW_RATE", "0.1"))   # Part du trafic rejouée sur le candidat
+SHADOW_LOG_PATH = os.getenv("MINDCARE_SHADOW_LOG", "logs/shadow_scoring.jsonl")
+SHADOW_MAX_PENDING = 32     # Lots en attente au-delà desquels l'échantillon est abandonné
+
+# Mots-outils très fréquents : quelques-uns suffisent à trancher sur un message court
+STOPWORDS = {
+    "en": {"i", "you", "the", "and", "to", "a", "of", "is", "it", "my", "me", "am", "feel", "feeling", "not",
+           "so", "that", "this", "with", "have", "im", "was", "but", "for", "be", "do", "dont", "what", "just",
+           "very", "really", "today", "at", "on", "in", "are", "can", "cant", "about", "like", "want"},
+    "fr": {"je", "tu", "le", "la", "les", "et", "de", "des", "du", "un", "une", "est", "suis", "me", "moi",
+           "mon", "ma", "mes", "ne", "pas", "plus", "que", "qui", "pour", "avec", "sur", "dans", "ce", "cette",
+           "j", "c", "n", "m", "t", "l", "d", "qu", "tres", "vraiment", "aujourd", "hui", "sens", "veux", "rien"},
+}
+FRENCH_CHARS = re.compile(r"[éèêàùâîôûçœë]")
+WORD_RE = re.compile(r"[a-zà-ÿœ]+")
+_ASCII_FOLD = str.maketrans("éèêëàâîïôûùüç", "eeeeaaiiouuuc")
+
+
+def detect_language(text, default=DEFAULT_LANGUAGE):
+    """
+    Langue probable du message ('en' ou 'fr') : vote des mots-outils + indice des accents.
+    Limite : un message d'un ou deux mots sans mot-outil ni accent ("merci", "bonjour",
+    "triste") ne vote pour aucune langue et reçoit `default`. Le résultat n'est fiable
+    qu'à partir de quelques mots.
+    """
+    text = str(text).lower()
+    words = WORD_RE.findall(text)
+    scores = {lang: 0 for lang in STOPWORDS}
+    for word in words:
+        word = word.translate(_ASCII_FOLD)
+        for lang, vocabulary in STOPWORDS.items():
+            if word in vocabulary:
+                scores[lang] += 1
+    scores["fr"] += len(FRENCH_CHARS.findall(text))
+    best = max(scores, key=scores.get)
+    if scores[best] == 0 or list(scores.values()).count(scores[best]) > 1:
+        return default
+    return best
+
+
+class ModelBundle:
+    """Artefacts d'une langue : modèle, vectoriseur et table index -> n-gramme."""
+
+    def __init__(self, language, model, vectorizer, size_bytes, version=None):
+        self.language = language
+        self.version = version
+        self.model = model
+        self.vectorizer = vectorizer
+        self.size_bytes = size_bytes
+        # Construite une seule fois (get_feature_names_out est coûteux)
+        self.feature_names = np.asarray(vectorizer.get_feature_names_out(), dtype=object)
+
+
+class ModelRegistry:
+    """
+    Cache LRU des ModelBundle, borné en mémoire. La taille d'une langue est estimée par
+    celle de ses fichiers pickle. La langue qui vient d'être chargée n'est jamais évincée,
+    même si elle dépasse seule le plafond.
+
+    Le registre suit un pointeur de version (CURRENT par défaut) : refresh() détecte un
+    changement et vide le cache, les requêtes en cours gardent les bundles qu'elles tiennent.
+    Sans pointeur, les artefacts sont lus directement dans `root` si `legacy_root` est vrai.
+    Avec `version`, le registre est figé sur cette version publiée (pointeur ignoré).
+    """
+
+    def __init__(self, root=MODELS_DIR, max_memory_mb=MAX_MEMORY_MB, default_language=DEFAULT_LANGUAGE,
+                 pointer=ACTIVE_POINTER, legacy_root=True, version=None):
+        self.root = root
+        self.max_bytes = int(max_memory_mb * 1024 * 1024)
+        self.default_language = default_language
+        self.pointer = pointer
+        self.legacy_root = legacy_root
+        self.pinned = version is not None
+        self.version = version if self.pinned else read_pointer(root, pointer)
+        self.manifest = load_manifest(root, self.version)
+        if self.pinned and self.manifest is None:
+            raise FileNotFoundError(f"Version inconnue : {version} (pas de {VERSIONS_DIR}/{version}/{MANIFEST_FILE})")
+        self.loads = 0
+        self.evictions = 0
+        self.fallbacks = 0
+        self.swaps = 0
+        self._checked_at = time.monotonic()
+        self._bundles = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- VERSION ACTIVE ---
+    def refresh(self, force=False):
+        """Relit le pointeur (au plus toutes les POINTER_CHECK_S) ; True si la version a changé."""
+        if self.pinned:
+            return False
+        now = time.monotonic()
+        if not force and now - self._checked_at < POINTER_CHECK_S:
+            return False
+        self._checked_at = now
+        version = read_pointer(self.root, self.pointer)
+        if version == self.version:
+            return False
+        manifest = load_manifest(self.root, version)
+        if version is not None and manifest is None:
+            print(f" Version '{version}' sans manifest : bascule ignorée.")
+            return False
+        with self._lock:
+            print(f" Modèles : bascule {self.version or '-'} -> {version or '-'} ({self.pointer})")
+            self.version, self.manifest = version, manifest
+            self._bundles.clear()
+            self.swaps += 1
+        return True
+
+    def folder(self):
+        """Dossier des artefacts servis (None si aucun : pointeur absent et pas de repli)."""
+        if self.version is not None:
+            return os.path.join(self.root, VERSIONS_DIR, self.version)
+        return self.root if self.legacy_root else None
+
+    def _paths(self, language, folder=None):
+        folder = folder or self.folder()
+        if language != self.default_language:
+            folder = os.path.join(folder, language)
+        return os.path.join(folder, MODEL_FILE), os.path.join(folder, VECTORIZER_FILE)
+
+    def has(self, language):
+        folder = self.folder()
+        return folder is not None and all(os.path.exists(p) for p in self._paths(language, folder))
+
+    def available(self):
+        """Langues dont les artefacts sont présents sur disque (chargées ou non)."""
+        folder = self.folder()
+        languages = [self.default_language] if self.has(self.default_language) else []
+        if folder is not None and os.path.isdir(folder):
+            for name in sorted(os.listdir(folder)):
+                if name not in (self.default_language, VERSIONS_DIR) and \
+                        os.path.isdir(os.path.join(folder, name)) and self.has(name):
+                    languages.append(name)
+        return languages
+
+    def resolve(self, language):
+        """Langue effectivement servie : celle demandée si disponible, sinon la langue par défaut."""
+        if language == self.default_language or self.has(language):
+            return language
+        self.fallbacks += 1
+        return self.default_language
+
+    def get(self, language):
+        """ModelBundle de la langue (chargé au premier appel). FileNotFoundError si rien n'est disponible."""
+        language = self.resolve(language)
+        with self._lock:
+            bundle = self._bundles.get(language)
+            if bundle is not None:
+                self._bundles.move_to_end(language)
+                return bundle
+            bundle = self._load(language)
+            self._bundles[language] = bundle
+            self._evict(keep=language)
+            return bundle
+
+    def _load(self, language):
+        model_path, vectorizer_path = self._paths(language)
+        t0 = time.perf_counter()
+        with phase(f"model_load:{language}"):
+            if self.manifest:
+                verify_files(self.folder(), self.manifest, [model_path, vectorizer_path])
+            bundle = ModelBundle(language, joblib.load(model_path), joblib.load(vectorizer_path),
+                                 os.path.getsize(model_path) + os.path.getsize(vectorizer_path), self.version)
+        self.loads += 1
+        print(f" Modèle '{language}' ({self.version or 'non versionné'}) chargé en "
+              f"{time.perf_counter() - t0:.2f}s ({bundle.size_bytes / 1024 ** 2:.1f} Mo)")
+        return bundle
+
+    def _evict(self, keep):
+        while self.memory_bytes() > self.max_bytes and len(self._bundles) > 1:
+            language = next(iter(self._bundles))
+            if language == keep:
+                self._bundles.move_to_end(language)
+                continue
+            del self._bundles[language]
+            self.evictions += 1
+
+    def memory_bytes(self):
+        return sum(b.size_bytes for b in self._bundles.values())
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "swaps": self.swaps,
+            "available": self.available(),
+            "loaded": list(self._bundles),
+            "memory_mb": round(self.memory_bytes() / 1024 ** 2, 2),
+            "max_memory_mb": round(self.max_bytes / 1024 ** 2, 2),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "fallbacks": self.fallbacks,
+        }
+
+
+# --- VERSIONS : POINTEURS ET MANIFEST ---
+def read_pointer(root, pointer):
+    """Version désignée par le pointeur (None si absent ou vide)."""
+    try:
+        with open(os.path.join(root, pointer), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_pointer(root, pointer, version):
+    """Remplacement atomique : un lecteur voit l'ancienne ou la nouvelle version, jamais un fichier partiel."""
+    path = os.path.join(root, pointer)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if load_manifest(root, version) is None:
+        raise FileNotFoundError(f"Version inconnue : {version} (pas de {VERSIONS_DIR}/{version}/{MANIFEST_FILE})")
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_manifest(root, version):
+    if version is None:
+        return None
+    try:
+        with open(os.path.join(root, VERSIONS_DIR, version, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def verify_files(folder, manifest, paths):
+    """Vérifie les empreintes des fichiers avant de les désérialiser."""
+    for path in paths:
+        expected = manifest.get("files", {}).get(os.path.relpath(path, folder).replace(os.sep, "/"))
+        if expected and file_sha256(path) != expected["sha256"]:
+            raise ValueError(f"Empreinte invalide pour {path} (version {manifest.get('version')})")
+
+
+def publish_version(version, source, root=MODELS_DIR, notes=""):
+    """
+    Copie les artefacts de `source` dans models/versions/<version>/ avec un manifest.
+    La version est assemblée dans un dossier temporaire puis renommée : elle n'apparaît
+    qu'une fois complète. Une version publiée n'est jamais réécrite.
+    """
+    target = os.path.join(root, VERSIONS_DIR, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"La version {version} existe déjà")
+    staging = os.path.join(root, VERSIONS_DIR, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(staging)
+
+    files, languages = {}, []
+    for language_dir, language in [("", DEFAULT_LANGUAGE)] + [
+            (name, name) for name in sorted(os.listdir(source))
+            if os.path.isdir(os.path.join(source, name)) and name != VERSIONS_DIR]:
+        names = [os.path.join(language_dir, f) if language_dir else f for f in (MODEL_FILE, VECTORIZER_FILE)]
+        if not all(os.path.exists(os.path.join(source, n)) for n in names):
+            continue
+        languages.append(language)
+        for name in names:
+            os.makedirs(os.path.dirname(os.path.join(staging, name)) or staging, exist_ok=True)
+            shutil.copy2(os.path.join(source, name), os.path.join(staging, name))
+            files[name.replace(os.sep, "/")] = {
+                "bytes": os.path.getsize(os.path.join(staging, name)),
+                "sha256": file_sha256(os.path.join(staging, name)),
+            }
+    if DEFAULT_LANGUAGE not in languages:
+        shutil.rmtree(staging)
+        raise FileNotFoundError(f"{source} ne contient pas {MODEL_FILE} / {VECTORIZER_FILE}")
+
+    manifest = {
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": source,
+        "languages": languages,
+        "files": files,
+        "notes": notes,
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(staging, target)
+    return manifest
+
+
+def list_versions(root=MODELS_DIR):
+    folder = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(folder):
+        return []
+    return [m for m in (load_manifest(root, v) for v in sorted(os.listdir(folder)) if not v.startswith("."))
+            if m is not None]
+
+
+# --- MODE SHADOW ---
+class ShadowScorer:
+    """
+    Rejoue un échantillon du trafic sur la version candidate (pointeur CANDIDATE), dans un
+    thread à part : la réponse servie n'attend jamais le candidat. Chaque message échantillonné
+    donne une ligne JSONL (émotions active / candidate, accord, latences par message).
+    """
+
+    def __init__(self, labels, root=MODELS_DIR, rate=SHADOW_RATE, log_path=SHADOW_LOG_PATH):
+        self.registry = ModelRegistry(root, pointer=CANDIDATE_POINTER, legacy_root=False)
+        self.labels = labels   # Index de classe -> émotion (LABEL_MAP de mindcare_tools)
+        self.rate = rate
+        self.log_path = log_path
+        self.sampled = 0
+        self.agreements = 0
+        self.dropped = 0
+        self.errors = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mindcare-shadow")
+
+    @property
+    def active(self):
+        self.registry.refresh()
+        return self.registry.version is not None and self.rate > 0
+
+    def submit(self, texts, languages, active_version, active_labels, active_ms):
+        """Échantillonne le lot servi ; active_ms = latence du modèle actif par message."""
+        if not self.active:
+            return
+        picked = [i for i in range(len(texts)) if random.random() < self.rate]
+        if not picked:
+            return
+        with self._lock:
+            if self._pending >= SHADOW_MAX_PENDING:
+                self.dropped += len(picked)
+                return
+            self._pending += 1
+        self._pool.submit(self._score, [texts[i] for i in picked], [languages[i] for i in picked],
+                          active_version, [active_labels[i] for i in picked], active_ms)
+
+    def _score(self, texts, languages, active_version, active_labels, active_ms):
+        try:
+            records = []
+            groups = {}
+            for i, language in enumerate(languages):
+                groups.setdefault(self.registry.resolve(language), []).append(i)
+            for served, indices in groups.items():
+                bundle = self.registry.get(served)
+                t0 = time.perf_counter()
+                probas = bundle.model.predict_proba(bundle.vectorizer.transform([texts[i] for i in indices]))
+                candidate_ms = (time.perf_counter() - t0) * 1000 / len(indices)
+                for i, row in zip(indices, probas):
+                    candidate_label = self.labels.get(int(np.argmax(row)), "unknown")
+                    agree = candidate_label == active_labels[i]
+                    records.append({
+                        "ts": round(time.time(), 3),
+                        "language": languages[i],
+                        "active_version": active_version,
+                        "candidate_version": bundle.version,
+                        "active_emotion": active_labels[i],
+                        "candidate_emotion": candidate_label,
+                        "agree": agree,
+                        "active_ms": round(active_ms, 4),
+                        "candidate_ms": round(candidate_ms, 4),
+                    })
+                    self.sampled += 1
+                    self.agreements += agree
+            if self.log_path:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        except Exception as e:
+            self.errors += 1
+            print(f" Erreur shadow : {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self):
+        return {
+            "candidate_version": self.registry.version,
+            "rate": self.rate,
+            "sampled": self.sampled,
+            "agreement": round(self.agreements / self.sampled, 4) if self.sampled else None,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+# --- CLI : publication et bascule des versions ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Versions des classifieurs MindCare (publication, bascule, shadow).")
+    parser.add_argument("--root", default=MODELS_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    publish = commands.add_parser("publish", help="Publie les artefacts d'un dossier comme nouvelle version")
+    publish.add_argument("version")
+    publish.add_argument("--from", dest="source", default=MODELS_DIR, help="Dossier des .pkl (défaut : models/)")
+    publish.add_argument("--notes", default="")
+    publish.add_argument("--activate", action="store_true", help="Bascule CURRENT sur cette version")
+    activate = commands.add_parser("activate", help="Bascule la version active (CURRENT)")
+    activate.add_argument("version")
+    candidate = commands.add_parser("candidate", help="Désigne la version évaluée en shadow (CANDIDATE)")
+    candidate.add_argument("version", nargs="?", default=None, help="Omise : arrête le mode shadow")
+    commands.add_parser("list", help="Versions publiées et pointeurs")
+    commands.add_parser("detect", help="Test rapide de la détection de langue")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        manifest = publish_version(args.version, args.source, args.root, args.notes)
+        print(f" Version {args.version} publiée ({', '.join(manifest['languages'])}, {len(manifest['files'])} fichiers)")
+        if args.activate:
+            write_pointer(args.root, ACTIVE_POINTER, args.version)
+            print(f" {ACTIVE_POINTER} -> {args.version}")
+    elif args.command == "activate":
+        write_pointer(args.root, ACTIVE_POINTER, args.version)
+        print(f" {ACTIVE_POINTER} -> {args.version}")
+    elif args.command == "candidate":
+        write_pointer(args.root, CANDIDATE_POINTER, args.version)
+        print(f" {CANDIDATE_POINTER} -> {args.version or '(aucune, shadow arrêté)'}")
+    elif args.command == "list":
+        current = read_pointer(args.root, ACTIVE_POINTER)
+        shadow = read_pointer(args.root, CANDIDATE_POINTER)
+        for manifest in list_versions(args.root):
+            flags = (" [active]" if manifest["version"] == current else "") + \
+                    (" [candidate]" if manifest["version"] == shadow else "")
+            print(f" {manifest['version']:<12} {manifest['created_at']}  {','.join(manifest['languages'])}{flags}"
+                  f"  {manifest['notes']}")
+        if current is None:
+            print(f" Aucune version active : artefacts lus directement dans {args.root}/")
+    elif args.command == "detect":
+        samples = [
+            "I feel so lonely tonight",
+            "Je me sens vraiment seul ce soir",
+            "J'ai peur de l'examen de demain",
+            "What a wonderful surprise!",
+            "Merci, ça va mieux",
+        ]
+        for sample in samples:
+            print(f" {sample:<40} -> {detect_language(sample)}")
+        t0 = time.perf_counter()
+        for _ in range(10000):
+            detect_language(samples[1])
+        print(f" Détection : {(time.perf_counter() - t0) / 10000 * 1e6:.1f} µs / message")
@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+# Les modèles (TF-IDF, régression logistique, RAG) et le LLM sont chargés une seule fois ici
+from final_agent import active_llm, MINDCARE_TOOLS
+from mindcare_agent import build_agent_executor
+from mindcare_batching import MicroBatcher, MAX_BATCH, MAX_WAIT_MS
+from mindcare_crisis import get_crisis_screener
+from mindcare_sessions import get_session_store
+from mindcare_tracing import TRACER, Tracer
+
+# --- CONFIGURATION ---
+HOST = os.getenv("MINDCARE_HOST", "127.0.0.1")
+PORT = int(os.getenv("MINDCARE_PORT", "8080"))
+CPU_WORKERS = os.cpu_count() or 2   # Scoring ML (classify, advice, activity, knowledge)
+AGENT_WORKERS = 8                   # Tours d'agent : surtout de l'attente réseau (LLM)
+QUEUE_SIZE = 64                     # Au-delà : 503 immédiat plutôt qu'une latence qui explose
+RETRY_AFTER_S = 1
+
+# Servi pendant toute la vie du processus, sans export fichier (les spans agent vont dans TRACER)
+HTTP_TRACER = Tracer(path=None)
+# Exécuteur propre au serveur : sans verbose, chaque tour imprimerait toute sa trace ReAct sur stdout
+SERVER_AGENT = build_agent_executor(active_llm, MINDCARE_TOOLS, verbose=False)
+
+
+class WorkQueue:
+    """
+    File bornée devant un pool de threads : les requêtes en excès sont refusées
+    tout de suite (backpressure) au lieu de s'empiler en mémoire.
+    """
+
+    def __init__(self, name, workers, maxsize):
+        self.name = name
+        self.workers = workers
+        self.rejected = 0
+        self.busy = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"mindcare-{name}")
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args):
+        """Future du résultat, ou asyncio.QueueFull si la file est pleine."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((fn, args, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        return future
+
+    @property
+    def executor(self):
+        return self._pool
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            fn, args, future = await self._queue.get()
+            if future.cancelled():  # Client parti pendant l'attente
+                continue
+            self.busy += 1
+            try:
+                result = await loop.run_in_executor(self._pool, fn, *args)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.busy -= 1
+
+    def snapshot(self):
+        return {"workers": self.workers, "busy": self.busy, "queued": self._queue.qsize(),
+                "capacity": self._queue.maxsize, "rejected": self.rejected}
+
+
+# --- TRAITEMENTS (exécutés dans les threads du pool) ---
+def do_advice(emotion):
+    advice, notes = MINDCARE_TOOLS.get_advice(emotion)
+    return {"emotion": emotion, "advice": advice, "notes": notes}
+
+
+def do_activity(emotion):
+    return {"emotion": emotion, "activity": MINDCARE_TOOLS.get_activity(emotion)}
+
+
+def do_knowledge(query):
+    return {"query": query, "knowledge": MINDCARE_TOOLS.query_knowledge_base(query)}
+
+
+def do_chat(user_input, session_id):
+    """
+    Un tour d'agent complet : historique récent de la session, analyse partagée, persistance.
+    load_session relit aussi les tours encore en file d'écriture : le tour précédent de la
+    session est toujours dans l'historique, même s'il n'est pas encore sur disque.
+    """
+    crisis = get_crisis_screener().screen(user_input)
+    store = get_session_store()
+    saved = store.load_session(session_id) if session_id else None
+    chat_history = ""
+    for turn_row in (saved or {}).get("recent_turns", []):
+        chat_history += f"\nHuman: {turn_row['user_text']}\nAI: {turn_row['ai_text']}"
+
+    if crisis:
+        chat_history += f"\nHuman: {user_input}\nAI: {crisis.response}"
+
+    trace_handler = TRACER.handler(session_id=session_id)
+    with MINDCARE_TOOLS.turn(user_input) as turn:
+        response = SERVER_AGENT.invoke(
+            {"input": user_input, "chat_history": chat_history},
+            config={"callbacks": [trace_handler]},
+        )
+    output = response["output"]
+    emotion = str(turn.analysis.get("emotion", "unknown")).capitalize()
+    if session_id:
+        store.append_turn(session_id, user_input, output, emotion=emotion,
+                          confidence=float(turn.analysis.get("confidence", 0.0)),
+                          crisis=crisis.category if crisis else None)
+    return {"session_id": session_id, "output": output, "emotion": emotion, "turn": trace_handler.turn,
+            "crisis": {**crisis.to_dict(), "response": crisis.response} if crisis else None}
+
+
+# --- HTTP ---
+def via_queue(queue_key, handler_fn, *extra_fields):
+    """Exécute handler_fn(valeur, *champs) dans le pool derrière la file `queue_key`."""
+    def dispatch(app, value, payload):
+        return app[queue_key].submit(handler_fn, value, *(payload.get(f) for f in extra_fields))
+    return dispatch
+
+
+def via_batcher(app, value, payload):
+    """Le texte rejoint le prochain lot de classification."""
+    return app[CLASSIFY_BATCHER].submit(value)
+
+
+def json_endpoint(name, field, dispatch):
+    """Endpoint POST {field: ...} -> résultat de dispatch (file bornée ou micro-batch)."""
+
+    async def endpoint(request):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            try:
+                payload = await request.json()
+            except ValueError:
+                raise web.HTTPBadRequest(reason="JSON invalide")
+            value = payload.get(field) if isinstance(payload, dict) else None
+            if not isinstance(value, str) or not value.strip():
+                raise web.HTTPBadRequest(reason=f"Champ '{field}' manquant")
+
+            try:
+                future = dispatch(request.app, value, payload)
+            except asyncio.QueueFull:
+                raise web.HTTPServiceUnavailable(reason="Serveur saturé",
+                                                 headers={"Retry-After": str(RETRY_AFTER_S)})
+            return web.json_response(await future)
+        except web.HTTPException as e:
+            error = e.reason
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            return web.json_response({"error": error}, status=500)
+        finally:
+            HTTP_TRACER.record({"kind": "http", "name": name, "error": error,
+                                "wall_ms": (time.perf_counter() - t0) * 1000})
+
+    return endpoint
+
+
+async def health(request):
+    return web.json_response({
+        "status": "ok" if MINDCARE_TOOLS.classifier_ready else "degraded",
+        "classifier": MINDCARE_TOOLS.classifier_ready,
+        "knowledge_base": MINDCARE_TOOLS.vector_db is not None,
+    })
+
+
+async def metrics(request):
+    return web.json_response({
+        "queues": {queue.name: queue.snapshot() for queue in (request.app[CPU_QUEUE], request.app[AGENT_QUEUE])},
+        "classify_batcher": request.app[CLASSIFY_BATCHER].snapshot(),
+        "http": HTTP_TRACER.summary(),
+        "agent": TRACER.summary(),
+        "sessions": get_session_store().stats(),
+        "crisis_screener": get_crisis_screener().stats(),
+        "models": MINDCARE_TOOLS.models.stats(),
+        "shadow": MINDCARE_TOOLS.shadow.stats(),
+    })
+
+
+CPU_QUEUE = web.AppKey("cpu_queue", WorkQueue)
+AGENT_QUEUE = web.AppKey("agent_queue", WorkQueue)
+CLASSIFY_BATCHER = web.AppKey("classify_batcher", MicroBatcher)
+
+
+def create_app(cpu_workers=CPU_WORKERS, agent_workers=AGENT_WORKERS, queue_size=QUEUE_SIZE,
+               batch_max=MAX_BATCH, batch_wait_ms=MAX_WAIT_MS):
+    app = web.Application()
+
+    async def on_startup(app):
+        app[CPU_QUEUE] = WorkQueue("cpu", cpu_workers, queue_size)
+        app[AGENT_QUEUE] = WorkQueue("agent", agent_workers, queue_size)
+        # Les lots de classification partagent les threads CPU (un lot = une tâche)
+        app[CLASSIFY_BATCHER] = MicroBatcher(
+            MINDCARE_TOOLS.classify_emotions, max_batch=batch_max, max_wait_ms=batch_wait_ms,
+            max_queue=queue_size * batch_max, workers=cpu_workers, executor=app[CPU_QUEUE].executor,
+        )
+        app[CPU_QUEUE].start()
+        app[AGENT_QUEUE].start()
+        app[CLASSIFY_BATCHER].start()
+
+    async def on_cleanup(app):
+        await app[CLASSIFY_BATCHER].stop()
+        await app[CPU_QUEUE].stop()
+        await app[AGENT_QUEUE].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post("/classify", json_endpoint("classify", "text", via_batcher))
+    app.router.add_post("/advice", json_endpoint("advice", "emotion", via_queue(CPU_QUEUE, do_advice)))
+    app.router.add_post("/activity", json_endpoint("activity", "emotion", via_queue(CPU_QUEUE, do_activity)))
+    app.router.add_post("/knowledge", json_endpoint("knowledge", "query", via_queue(CPU_QUEUE, do_knowledge)))
+    app.router.add_post("/chat", json_endpoint("chat", "input", via_queue(AGENT_QUEUE, do_chat, "session_id")))
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API HTTP MindCare (outils + agent).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cpu-workers", type=int, default=CPU_WORKERS)
+    parser.add_argument("--agent-workers", type=int, default=AGENT_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--batch-max", type=int, default=MAX_BATCH, help="Taille maximale d'un lot /classify")
+    parser.add_argument("--batch-wait-ms", type=float, default=MAX_WAIT_MS, help="Attente maximale d'un lot /classify")
+    args = parser.parse_args()
+
+    print(f" API MindCare en écoute sur http://{args.host}:{args.port}")
+    web.run_app(create_app(args.cpu_workers, args.agent_workers, args.queue_size,
+                           args.batch_max, args.batch_wait_ms),
+                host=args.host, port=args.port, print=None)
@@ -0,0 +1,268 @@
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# --- CONFIGURATION ---
+SESSIONS_PATH = os.getenv("MINDCARE_SESSIONS_PATH", "sessions/mindcare_sessions.sqlite")
+RESUME_WINDOW = 20          # Tours rechargés à la reprise (le reste est résumé par les agrégats)
+MAX_GROUP_COMMIT = 256      # Tours écrits au plus par transaction
+GROUP_COMMIT_WAIT_S = 0.005  # Petite attente pour regrouper les écritures concurrentes
+
+SCHEMA = [
+    # Un enregistrement par tour, jamais modifié ; la clé primaire sert d'index par session
+    """CREATE TABLE IF NOT EXISTS turns (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        user_text TEXT NOT NULL,
+        ai_text TEXT NOT NULL,
+        emotion TEXT,
+        confidence REAL,
+        score REAL,
+        co2 REAL,
+        ttft REAL,
+        crisis TEXT,
+        PRIMARY KEY (session_id, seq)
+    ) WITHOUT ROWID""",
+    # Agrégats tenus à jour à chaque tour : la reprise ne relit pas tout l'historique
+    """CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        turns INTEGER NOT NULL DEFAULT 0,
+        total_co2 REAL NOT NULL DEFAULT 0
+    )""",
+    """CREATE TABLE IF NOT EXISTS session_emotions (
+        session_id TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (session_id, emotion)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)",
+]
+
+# Colonnes ajoutées après coup : (table, colonne, type), appliquées aux bases existantes
+MIGRATIONS = [
+    ("turns", "crisis", "TEXT"),   # Catégorie signalée par le filtre de crise (mindcare_crisis.py)
+]
+
+
+class SessionStore:
+    """
+    Stockage persistant des sessions MindCare (SQLite en mode WAL).
+    Toutes les écritures passent par un unique thread écrivain qui regroupe les tours
+    de toutes les sessions dans une même transaction (group commit) : les sessions
+    concurrentes ne se disputent jamais le verrou d'écriture. Les lectures utilisent
+    une connexion par thread et ne bloquent pas l'écrivain ; les tours encore en file sont
+    fusionnés à la lecture (une session relit toujours ses propres tours).
+    """
+
+    def __init__(self, path=SESSIONS_PATH):
+        self.path = path
+        self.writes = 0
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._pending = {}  # session_id -> tours en file, pas encore validés sur disque
+        self._pending_lock = threading.Lock()
+        self._local = threading.local()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._writer_conn = self._connect()
+        self._writer_conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._writer_conn.execute(statement)
+        for table, column, sql_type in MIGRATIONS:
+            columns = {row[1] for row in self._writer_conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._writer_conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+        self._writer_conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="mindcare-session-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # --- ÉCRITURE (asynchrone, regroupée) ---
+    def append_turn(self, session_id, user_text, ai_text, emotion=None, confidence=None,
+                    score=None, co2=0.0, ttft=None, crisis=None):
+        """Ajoute un tour à la session (retour immédiat, écrit par le thread écrivain)."""
+        record = (session_id, time.time(), user_text, ai_text, emotion, confidence, score, co2 or 0.0, ttft, crisis)
+        with self._pending_lock:
+            self._pending.setdefault(session_id, []).append(record)
+        self._queue.put(record)
+
+    def flush(self):
+        """Attend que tous les tours en file soient écrits sur disque."""
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(GROUP_COMMIT_WAIT_S)
+            while len(batch) < MAX_GROUP_COMMIT:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Validation et retrait des tours en attente sous le même verrou : un lecteur
+            # voit chaque tour soit sur disque, soit en attente, jamais les deux ni aucun
+            with self._pending_lock:
+                try:
+                    with self._writer_conn:
+                        for record in batch:
+                            self._apply(record)
+                    self.writes += len(batch)
+                    self.commits += 1
+                except sqlite3.Error as e:
+                    print(f" Erreur écriture session : {e}")
+                finally:
+                    for record in batch:
+                        pending = self._pending[record[0]]
+                        pending.remove(record)
+                        if not pending:
+                            del self._pending[record[0]]
+            for _ in batch:
+                self._queue.task_done()
+
+    def _apply(self, record):
+        session_id, now, user_text, ai_text, emotion, confidence, score, co2, ttft, crisis = record
+        conn = self._writer_conn
+        conn.execute(
+            "INSERT INTO sessions (session_id, created_at, updated_at, turns, total_co2) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET turns = turns + 1, total_co2 = total_co2 + excluded.total_co2, "
+            "updated_at = excluded.updated_at",
+            (session_id, now, now, co2),
+        )
+        seq = conn.execute("SELECT turns FROM sessions WHERE session_id = ?", (session_id,)).fetchone()[0]
+        conn.execute(
+            "INSERT INTO turns (session_id, seq, created_at, user_text, ai_text, emotion, confidence, score, co2, ttft, "
+            "crisis) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, seq, now, user_text, ai_text, emotion, confidence, score, co2, ttft, crisis),
+        )
+        if emotion:
+            conn.execute(
+                "INSERT INTO session_emotions (session_id, emotion, count) VALUES (?, ?, 1) "
+                "ON CONFLICT(session_id, emotion) DO UPDATE SET count = count + 1",
+                (session_id, emotion),
+            )
+
+    # --- LECTURE ---
+    def load_session(self, session_id, window=RESUME_WINDOW):
+        """Agrégats de la session + ses `window` derniers tours (None si inconnue), tours en file compris."""
+        if session_id not in self._pending:
+            return self._load_committed(session_id, window)
+        with self._pending_lock:
+            session = self._load_committed(session_id, window)
+            pending = list(self._pending.get(session_id, ()))
+        if not pending:
+            return session
+        if session is None:
+            session = {"session_id": session_id, "created_at": pending[0][1], "updated_at": pending[0][1],
+                       "turns": 0, "total_co2": 0.0, "emotion_counts": {}, "recent_turns": []}
+        for record in pending:
+            _, now, user_text, ai_text, emotion, confidence, score, co2, ttft, crisis = record
+            session["turns"] += 1
+            session["updated_at"] = now
+            session["total_co2"] += co2
+            if emotion:
+                session["emotion_counts"][emotion] = session["emotion_counts"].get(emotion, 0) + 1
+            session["recent_turns"].append({
+                "seq": session["turns"], "created_at": now, "user_text": user_text, "ai_text": ai_text,
+                "emotion": emotion, "confidence": confidence, "score": score, "co2": co2, "ttft": ttft,
+                "crisis": crisis,
+            })
+        session["recent_turns"] = session["recent_turns"][-window:] if window else []
+        return session
+
+    def _load_committed(self, session_id, window):
+        conn = self._reader()
+        row = conn.execute(
+            "SELECT created_at, updated_at, turns, total_co2 FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        emotions = dict(conn.execute(
+            "SELECT emotion, count FROM session_emotions WHERE session_id = ?", (session_id,)
+        ).fetchall())
+        # Parcours de l'index (session_id, seq) à rebours : coût proportionnel à la fenêtre
+        recent = conn.execute(
+            "SELECT seq, created_at, user_text, ai_text, emotion, confidence, score, co2, ttft, crisis FROM turns "
+            "WHERE session_id = ? ORDER BY seq DESC LIMIT ?", (session_id, window)
+        ).fetchall()
+        keys = ["seq", "created_at", "user_text", "ai_text", "emotion", "confidence", "score", "co2", "ttft", "crisis"]
+        return {
+            "session_id": session_id,
+            "created_at": row[0],
+            "updated_at": row[1],
+            "turns": row[2],
+            "total_co2": row[3],
+            "emotion_counts": emotions,
+            "recent_turns": [dict(zip(keys, r)) for r in reversed(recent)],
+        }
+
+    def list_sessions(self, limit=20):
+        """Sessions les plus récemment actives."""
+        rows = self._reader().execute(
+            "SELECT session_id, updated_at, turns, total_co2 FROM sessions ORDER BY updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [{"session_id": r[0], "updated_at": r[1], "turns": r[2], "total_co2": r[3]} for r in rows]
+
+    def stats(self):
+        return {"writes": self.writes, "commits": self.commits, "pending": self._queue.qsize(),
+                "pending_sessions": len(self._pending)}
+
+
+_SESSION_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_session_store():
+    """Instance partagée du stockage de sessions (une par processus)."""
+    global _SESSION_STORE
+    with _STORE_LOCK:
+        if _SESSION_STORE is None:
+            _SESSION_STORE = SessionStore()
+        return _SESSION_STORE
+
+
+# --- TEST RAPIDE (écritures concurrentes de plusieurs sessions) ---
+if __name__ == "__main__":
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    store = SessionStore(os.path.join(tempfile.mkdtemp(), "sessions.sqlite"))
+
+    def simulate(i):
+        for turn in range(50):
+            store.append_turn(f"session-{i}", f"message {turn}", "réponse", emotion="Joy", score=1.0, co2=0.001)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        list(executor.map(simulate, range(32)))
+    store.flush()
+    elapsed = time.perf_counter() - t0
+    print(f" {store.writes} tours écrits en {elapsed:.2f}s ({store.commits} transactions)")
+    session = store.load_session("session-0", window=5)
+    print(json.dumps({k: v for k, v in session.items() if k != "recent_turns"}, ensure_ascii=False))
+    print(f" Fenêtre rechargée : tours {[t['seq'] for t in session['recent_turns']]}")
+
+    # Lecture de ses propres écritures : le tour est visible avant même d'être sur disque
+    store.append_turn("session-0", "dernier message", "dernière réponse", emotion="Sadness")
+    session = store.load_session("session-0", window=2)
+    assert session["turns"] == 51 and session["recent_turns"][-1]["user_text"] == "dernier message"
+    print(f" Tour en file relu : seq {session['recent_turns'][-1]['seq']} ({store.stats()['pending_sessions']} session en attente)")
@@ -0,0 +1,52 @@
+import atexit
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Chronométrage des phases de démarrage (chargement des modèles, CSV, base vectorielle,
+# assemblage de l'agent...). Toujours actif (un perf_counter par phase) ; avec
+# MINDCARE_STARTUP_PROFILE=<fichier.json>, les phases sont écrites à la sortie du processus
+# pour profile_startup.py.
+
+# --- CONFIGURATION ---
+PROFILE_PATH = os.getenv("MINDCARE_STARTUP_PROFILE")
+PROCESS_START = time.perf_counter()
+
+# [{"phase", "start_s", "duration_s"}] dans l'ordre d'exécution ; borné car app.py est
+# ré-exécuté par Streamlit à chaque interaction
+PHASES = deque(maxlen=512)
+
+
+@contextmanager
+def phase(name):
+    """Mesure la durée d'une phase d'initialisation (imbrication possible, noms uniques)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASES.append({
+            "phase": name,
+            "start_s": round(t0 - PROCESS_START, 4),
+            "duration_s": round(time.perf_counter() - t0, 4),
+        })
+
+
+def phase_durations():
+    """{phase: secondes} (une phase répétée est cumulée)."""
+    durations = {}
+    for record in PHASES:
+        durations[record["phase"]] = round(durations.get(record["phase"], 0.0) + record["duration_s"], 4)
+    return durations
+
+
+def dump(path=PROFILE_PATH):
+    if not path:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"phases": list(PHASES), "uptime_s": round(time.perf_counter() - PROCESS_START, 4)}, f, indent=2)
+
+
+if PROFILE_PATH:
+    atexit.register(dump)
@@ -0,0 +1,55 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Marqueur ReAct qui précède la réponse destinée à l'utilisateur
+FINAL_ANSWER_PREFIX = "Final Answer:"
+
+
+class FinalAnswerStreamHandler(BaseCallbackHandler):
+    """
+    Relaie en direct les tokens de la "Final Answer" de l'agent ReAct.
+    Les étapes intermédiaires (Thought / Action / Observation) ne sont jamais affichées :
+    on bufferise chaque appel LLM jusqu'à voir le marqueur, puis on transmet la suite.
+    """
+
+    def __init__(self, on_text):
+        # on_text(texte_cumulé) est appelé à chaque nouveau token visible
+        self.on_text = on_text
+        self.t_start = time.perf_counter()
+        self.ttft = None  # Time-To-First-Token (secondes) côté utilisateur
+        self.text = ""
+        self._buffer = ""
+        self._answering = False
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        # Chaque étape ReAct est un nouvel appel LLM : on repart d'un buffer vide
+        self._buffer = ""
+        self._answering = False
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self._answering:
+            self._emit(token)
+            return
+
+        self._buffer += token
+        idx = self._buffer.find(FINAL_ANSWER_PREFIX)
+        if idx != -1:
+            self._answering = True
+            self.text = ""
+            self._emit(self._buffer[idx + len(FINAL_ANSWER_PREFIX):].lstrip())
+
+    def _emit(self, chunk):
+        if not self.text:
+            # Pas d'espace parasite juste après "Final Answer:"
+            chunk = chunk.lstrip()
+        if not chunk:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.t_start
+        self.text += chunk
+        self.on_text(self.text)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.t_start
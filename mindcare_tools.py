@@ -1,8 +1,16 @@
 import pandas as pd
-import joblib
 import numpy as np
 import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from mindcare_features import FEATURE_COLUMNS, compute_features
+from mindcare_models import DEFAULT_LANGUAGE, ModelRegistry, ShadowScorer, detect_language
+from mindcare_startup import phase
 
 # Imports pour le RAG Vectoriel (Expert)
 try:
@@ -12,13 +20,24 @@ except ImportError:
     print(" Modules RAG manquants (pip install faiss-cpu langchain-mistralai)")
 
 # --- CONFIGURATION ---
+# Artefacts de la langue par défaut ; les autres langues sont dans models/<langue>/ (mindcare_models.py)
 MODEL_PATH = 'models/LogisticRegression.pkl'
 VECTORIZER_PATH = 'models/tfidf_vectorizer.pkl'
 ADVICE_DB_PATH = 'conseils_emotions.csv'
-VECTORSTORE_PATH = 'vectorstore_psychology' # Dossier créé par build_rag.py
+VECTORSTORE_PATH = os.getenv("MINDCARE_VECTORSTORE_PATH", 'vectorstore_psychology') # Dossier créé par build_rag.py
+# Embeddings de la base : "mistral" (mistral-embed, clé API) ou "hashing" (local, hors ligne ;
+# l'index doit avoir été construit avec les mêmes embeddings)
+EMBEDDINGS_BACKEND = os.getenv("MINDCARE_EMBEDDINGS", "mistral")
+HASHING_FEATURES = 2 ** 12
 
 # Seuil pour considérer une émotion comme "secondaire"
 SECONDARY_THRESHOLD = 0.10
+# N-grammes renvoyés par classe par explain_emotion
+EXPLAIN_TOP_N = 5
+# Passages renvoyés par query_knowledge_base (mesuré par benchmark_retrieval.py)
+RAG_TOP_K = 2
+# Message classé par le modèle d'une autre langue (langue détectée non servie) : confiance réduite
+FALLBACK_CONFIDENCE_FACTOR = 0.5
 
 LABEL_MAP = {
     0: 'Sadness', 1: 'Joy', 2: 'Love',
@@ -35,46 +54,168 @@ LOCATIONS = {
     "surprise":{"name": "Musée des Sciences", "desc": "de quoi nourrir votre curiosité", "lat": 50.8367, "lon": 4.3766}
 }
 
+# --- EMBEDDINGS LOCAUX (HORS LIGNE) ---
+class HashingEmbeddings(Embeddings):
+    """Embeddings locaux : n-grammes de caractères hachés (sans accents), normalisés L2."""
+
+    def __init__(self, n_features=HASHING_FEATURES):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        self.vectorizer = HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=n_features,
+                                            strip_accents="unicode", alternate_sign=False, norm="l2")
+
+    def embed_documents(self, texts):
+        return self.vectorizer.transform(texts).toarray().astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+# --- CONTEXTE DU TOUR (ANALYSE PARTAGÉE) ---
+class TurnContext:
+    """
+    Analyse d'un message utilisateur, calculée une seule fois par tour et partagée
+    entre le tableau de bord, l'agent et ses outils.
+    """
+
+    def __init__(self, message, analysis):
+        self.message = message
+        self.analysis = analysis
+        self.input_tokens = None  # Rempli à la demande (calcul CO2)
+        self.reuses = 0           # Appels d'outil servis sans recalcul
+        self._key = _normalize_text(message)
+
+    def matches(self, text):
+        return _normalize_text(text) == self._key
+
+
+def _normalize_text(text):
+    """L'agent recopie le message avec ou sans guillemets / ponctuation finale."""
+    return " ".join(re.findall(r"\w+", str(text).lower()))
+
+
+# Tour en cours (propagé aux outils, y compris quand LangChain copie le contexte)
+CURRENT_TURN = ContextVar("mindcare_turn", default=None)
+
+
+@contextmanager
+def use_turn(turn):
+    """Rend l'analyse du tour visible des outils de l'agent le temps du bloc."""
+    token = CURRENT_TURN.set(turn)
+    try:
+        yield turn
+    finally:
+        CURRENT_TURN.reset(token)
+
+
 class MindCareTools:
     def __init__(self):
         print(" Chargement des outils MindCare...")
         load_dotenv() # Pour charger la clé API si besoin ici
         
-        # 1. Modèles ML
+        # 1. Modèles ML : un classifieur par langue, chargé au premier message qui la demande
+        # Version suivie via models/CURRENT (bascule à chaud) ; candidat éventuel évalué en shadow
+        with phase("tools:model_registry"):
+            self.models = ModelRegistry()
+            self.shadow = ShadowScorer(LABEL_MAP)
+            self.classifier_ready = self.models.has(DEFAULT_LANGUAGE)
+        if self.classifier_ready:
+            print(f" Classifieurs disponibles : {', '.join(self.models.available())} "
+                  f"(version {self.models.version or 'non versionnée'}, chargement à la demande).")
+        else:
+            print(f" ERREUR CRITIQUE : modèle introuvable ({MODEL_PATH}, {VECTORIZER_PATH})")
         try:
-            self.model = joblib.load(MODEL_PATH)
-            self.vectorizer = joblib.load(VECTORIZER_PATH)
-            self.advice_df = pd.read_csv(ADVICE_DB_PATH)
-            self.advice_df['emotion'] = self.advice_df['emotion'].str.strip().str.lower()
-            print(" Modèles ML et CSV chargés.")
+            with phase("tools:advice_csv"):
+                self.advice_df = pd.read_csv(ADVICE_DB_PATH)
+                self.advice_df['emotion'] = self.advice_df['emotion'].str.strip().str.lower()
+            print(" CSV de conseils chargé.")
         except FileNotFoundError as e:
             print(f" ERREUR CRITIQUE : {e}")
-            self.model = None
             self.advice_df = pd.DataFrame()
 
         # 2. RAG Vectoriel (Mémoire Longue)
         self.vector_db = None
         api_key = os.getenv("MISTRAL_API_KEY") or os.getenv("MISTRAL_KEY_1")
         
-        if os.path.exists(VECTORSTORE_PATH) and api_key:
+        local_embeddings = EMBEDDINGS_BACKEND == "hashing"
+        
+        if os.path.exists(VECTORSTORE_PATH) and (api_key or local_embeddings):
             try:
                 print(" Chargement de la Base Vectorielle (Manuel Psy)...")
-                embeddings = MistralAIEmbeddings(api_key=api_key, model="mistral-embed")
-                # allow_dangerous_deserialization=True est requis en local pour FAISS
-                self.vector_db = FAISS.load_local(VECTORSTORE_PATH, embeddings, allow_dangerous_deserialization=True)
+                with phase("tools:vector_store"):
+                    if local_embeddings:
+                        embeddings = HashingEmbeddings()
+                    else:
+                        embeddings = MistralAIEmbeddings(api_key=api_key, model="mistral-embed")
+                    # allow_dangerous_deserialization=True est requis en local pour FAISS
+                    self.vector_db = FAISS.load_local(VECTORSTORE_PATH, embeddings, allow_dangerous_deserialization=True)
                 print(f" Base Vectorielle chargée.")
             except Exception as e:
                 print(f" Erreur chargement RAG : {e}")
         else:
             print(f" RAG non chargé (Dossier '{VECTORSTORE_PATH}' manquant ou pas de clé API).")
 
+    def analyze_turn(self, message):
+        """Analyse le message du tour une seule fois (à activer ensuite avec use_turn)."""
+        return TurnContext(message, self._analyze(message))
+
+    @contextmanager
+    def turn(self, message):
+        """Raccourci : analyse le message puis l'active pour l'agent le temps du bloc."""
+        turn = self.analyze_turn(message)
+        with use_turn(turn):
+            yield turn
+
     def classify_emotion(self, text):
         """TOOL A: Analyse l'émotion (Principale + Secondaires)."""
-        if self.model is None: return {"error": "Modèle non chargé"}
+        turn = CURRENT_TURN.get()
+        if turn is not None and turn.matches(text):
+            turn.reuses += 1
+            return turn.analysis
+        return self._analyze(text)
 
-        vec_text = self.vectorizer.transform([text])
-        probas = self.model.predict_proba(vec_text)[0]
-        
+    def _analyze(self, text):
+        return self.classify_emotions([text])[0]
+
+    def classify_emotions(self, texts):
+        """Version par lot : une matrice creuse TF-IDF et un predict_proba par langue présente dans le lot."""
+        if not self.classifier_ready: return [{"error": "Modèle non chargé"} for _ in texts]
+        if not texts: return []
+
+        results = [None] * len(texts)
+        for bundle, indices, languages in self._by_language(texts):
+            group = [texts[i] for i in indices]
+            t0 = time.perf_counter()
+            probas_matrix = bundle.model.predict_proba(bundle.vectorizer.transform(group))
+            elapsed_ms = (time.perf_counter() - t0) * 1000 / len(group)
+            for i, language, probas in zip(indices, languages, probas_matrix):
+                analysis = self._format_analysis(probas)
+                analysis["language"] = language
+                analysis["model_language"] = bundle.language
+                analysis["model_version"] = bundle.version
+                analysis["fallback"] = language != bundle.language
+                if analysis["fallback"]:
+                    # Vocabulaire TF-IDF d'une autre langue : le score surestime la fiabilité
+                    analysis["confidence"] = round(analysis["confidence"] * FALLBACK_CONFIDENCE_FACTOR, 2)
+                    analysis["is_ambiguous"] = True
+                results[i] = analysis
+            # Rejoué en arrière-plan sur le candidat (si CANDIDATE est défini)
+            self.shadow.submit(group, languages, bundle.version,
+                               [LABEL_MAP.get(int(np.argmax(p)), "unknown") for p in probas_matrix], elapsed_ms)
+        return results
+
+    def _by_language(self, texts):
+        """Regroupe les textes par modèle servi : [(bundle, indices, langues détectées)]."""
+        self.models.refresh()  # Entre deux requêtes : bascule éventuelle vers la nouvelle version
+        groups = {}
+        for i, text in enumerate(texts):
+            language = detect_language(text)
+            indices, languages = groups.setdefault(self.models.resolve(language), ([], []))
+            indices.append(i)
+            languages.append(language)
+        return [(self.models.get(served), indices, languages) for served, (indices, languages) in groups.items()]
+
+    @staticmethod
+    def _format_analysis(probas):
         max_proba = np.max(probas)
         pred_index = np.argmax(probas)
         primary_emotion = LABEL_MAP.get(pred_index, "unknown")
@@ -105,6 +246,48 @@ class MindCareTools:
             "all_scores": all_scores
         }
 
+    def explain_emotion(self, text, top_n=EXPLAIN_TOP_N):
+        """Pourquoi cette émotion : n-grammes du message qui pèsent le plus pour chaque classe."""
+        return self.explain_emotions([text], top_n)[0]
+
+    def explain_emotions(self, texts, top_n=EXPLAIN_TOP_N):
+        """
+        Version par lot. Contribution d'un n-gramme à une classe = tfidf x coefficient :
+        un seul gather des colonnes de coef_ pour tous les éléments non nuls du lot,
+        puis un tri partiel sur les quelques n-grammes de chaque message.
+        """
+        if not self.classifier_ready: return [{"error": "Modèle non chargé"} for _ in texts]
+        if not texts: return []
+
+        explanations = [None] * len(texts)
+        for bundle, indices, _ in self._by_language(texts):
+            for i, explanation in zip(indices, self._explain_batch(bundle, [texts[i] for i in indices], top_n)):
+                explanations[i] = explanation
+        return explanations
+
+    @staticmethod
+    def _explain_batch(bundle, texts, top_n):
+        X = bundle.vectorizer.transform(texts).tocsr()
+        contributions = bundle.model.coef_[:, X.indices] * X.data  # (classes, nnz du lot)
+        explanations = []
+        for start, end in zip(X.indptr[:-1], X.indptr[1:]):
+            names = bundle.feature_names[X.indices[start:end]]
+            per_class = {}
+            for class_index, row in enumerate(contributions[:, start:end]):
+                k = min(top_n, len(row))
+                top = np.argpartition(-row, k - 1)[:k] if k else []
+                top = sorted(top, key=lambda i: -row[i])
+                per_class[LABEL_MAP.get(class_index, "unknown")] = [
+                    (names[i], round(float(row[i]), 4)) for i in top if row[i] > 0
+                ]
+            explanations.append(per_class)
+        return explanations
+
+    def text_features(self, text):
+        """Features de surface du notebook EDA (longueur, mots, majuscules, ! et ?), même code qu'à l'analyse."""
+        features = compute_features([text])
+        return {col: features[col].iloc[0].item() for col in FEATURE_COLUMNS}
+
     def get_advice(self, emotion):
         """TOOL B: Conseil CSV."""
         if emotion == "unknown": return "Demandez des précisions.", "Clarification"
@@ -132,8 +315,8 @@ class MindCareTools:
             return "Base de connaissances indisponible."
         
         try:
-            # Recherche des 2 passages les plus pertinents
-            results = self.vector_db.similarity_search(query, k=2)
+            # Recherche des RAG_TOP_K passages les plus pertinents
+            results = self.vector_db.similarity_search(query, k=RAG_TOP_K)
             knowledge = "\n\n".join([doc.page_content for doc in results])
             return f"INFO DU MANUEL CLINIQUE :\n{knowledge}"
         except Exception as e:
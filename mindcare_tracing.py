@@ -0,0 +1,259 @@
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- CONFIGURATION ---
+TRACE_PATH = os.getenv("MINDCARE_TRACE_PATH", "logs/mindcare_traces.jsonl")
+LATENCY_WINDOW = 1000  # Nombre de durées gardées par span pour les percentiles
+
+
+def percentile(values, q):
+    """Percentile par rang le plus proche (q entre 0 et 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class SpanStats:
+    """Agrégats d'un type de span (ex: 'tool:emotion_classifier')."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.iterations = 0
+
+    def add(self, span):
+        self.count += 1
+        self.errors += 1 if span.get("error") else 0
+        self.total_ms += span["wall_ms"]
+        self.latencies.append(span["wall_ms"])
+        self.prompt_tokens += span.get("prompt_tokens", 0)
+        self.completion_tokens += span.get("completion_tokens", 0)
+        self.cache_hits += span.get("cache_hits", 0)
+        self.iterations += span.get("iterations", 0)
+
+    def to_dict(self):
+        lat = list(self.latencies)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(percentile(lat, 50), 2),
+            "p95_ms": round(percentile(lat, 95), 2),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache_hits": self.cache_hits,
+            "iterations": self.iterations,
+        }
+
+
+class Tracer:
+    """Collecte les spans (tour, appels LLM, outils) : export JSON lines + résumé en mémoire."""
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self._stats = defaultdict(SpanStats)
+        self._lock = threading.Lock()
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def record(self, span):
+        line = json.dumps(span, ensure_ascii=False)
+        with self._lock:
+            self._stats[f"{span['kind']}:{span['name']}"].add(span)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def handler(self, session_id=None):
+        """Un handler par tour d'agent (à passer dans config={'callbacks': [...]})."""
+        return TracingCallbackHandler(self, session_id)
+
+    def summary(self):
+        with self._lock:
+            return {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Transforme les callbacks LangChain d'un tour en spans :
+    - turn : la chaîne racine (AgentExecutor), avec itérations, tokens et hits de cache cumulés
+    - llm  : chaque appel au modèle (tokens prompt / complétion, hit de cache)
+    - tool : chaque appel d'outil (emotion_classifier, advice_lookup, ...)
+    """
+
+    def __init__(self, tracer, session_id=None):
+        self.tracer = tracer
+        self.session_id = session_id
+        self.trace_id = uuid.uuid4().hex
+        self.turn = None  # Dernier span "turn" terminé (lisible par l'UI)
+        self._open = {}
+        self._root_run_id = None
+        self._totals = None
+
+    # --- OUTILS INTERNES ---
+    def _start(self, run_id, parent_run_id, kind, name):
+        self._open[run_id] = {
+            "trace_id": self.trace_id,
+            "span_id": str(run_id),
+            "parent_id": str(parent_run_id) if parent_run_id else None,
+            "session_id": self.session_id,
+            "kind": kind,
+            "name": name,
+            "start": time.time(),
+            "_t0": time.perf_counter(),
+        }
+
+    def _finish(self, run_id, error=None, **fields):
+        span = self._open.pop(run_id, None)
+        if span is None:
+            return None
+        span["wall_ms"] = round((time.perf_counter() - span.pop("_t0")) * 1000, 3)
+        if error is not None:
+            span["error"] = f"{type(error).__name__}: {error}"
+        span.update(fields)
+        self.tracer.record(span)
+        return span
+
+    # --- TOUR (chaîne racine) ---
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is None and self._root_run_id is None:
+            self._root_run_id = run_id
+            self._totals = {"iterations": 0, "llm_calls": 0, "tool_calls": 0,
+                            "prompt_tokens": 0, "completion_tokens": 0, "cache_hits": 0}
+            self._start(run_id, None, "turn", kwargs.get("name") or "agent_turn")
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id == self._root_run_id:
+            self.turn = self._finish(run_id, **self._totals)
+            self._root_run_id = None
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if run_id == self._root_run_id:
+            self.turn = self._finish(run_id, error=error, **self._totals)
+            self._root_run_id = None
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        if self._totals is not None:
+            self._totals["iterations"] += 1
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        if self._totals is not None:
+            self._totals["iterations"] += 1
+
+    # --- APPELS LLM ---
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", _model_name(serialized, kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", _model_name(serialized, kwargs))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens, cache_hit = _usage_from_result(response)
+        span = self._finish(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                            cache_hits=int(cache_hit))
+        if span is not None and self._totals is not None:
+            self._totals["llm_calls"] += 1
+            self._totals["prompt_tokens"] += prompt_tokens
+            self._totals["completion_tokens"] += completion_tokens
+            self._totals["cache_hits"] += int(cache_hit)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=error)
+
+    # --- OUTILS ---
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        self._start(run_id, parent_run_id, "tool", name)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._finish(run_id)
+        if span is not None and self._totals is not None:
+            self._totals["tool_calls"] += 1
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, error=error)
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Compteur léger (tokens + hits de cache) pour un appel ou un groupe d'appels LLM."""
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        prompt_tokens, completion_tokens, cache_hit = _usage_from_result(response)
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cache_hits += int(cache_hit)
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+
+def _model_name(serialized, kwargs):
+    params = kwargs.get("invocation_params") or {}
+    return params.get("model") or params.get("model_name") or (serialized or {}).get("name") or "llm"
+
+
+def _usage_from_result(response):
+    """Tokens (prompt, complétion) et hit de cache d'un LLMResult."""
+    prompt_tokens = completion_tokens = 0
+    cache_hit = False
+    for generations in response.generations:
+        for gen in generations:
+            message = getattr(gen, "message", None)
+            if message is None:
+                continue
+            usage = getattr(message, "usage_metadata", None) or {}
+            prompt_tokens += usage.get("input_tokens", 0)
+            completion_tokens += usage.get("output_tokens", 0)
+            cache_hit = cache_hit or bool(message.response_metadata.get("cache_hit"))
+
+    if not (prompt_tokens or completion_tokens):
+        # Ancien format : compteur global dans llm_output
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = token_usage.get("prompt_tokens", 0)
+        completion_tokens = token_usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens, cache_hit
+
+
+def summarize_file(path):
+    """Recalcule le résumé à partir d'un export JSON lines (analyse hors ligne)."""
+    tracer = Tracer(path=None)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                tracer.record(json.loads(line))
+    return tracer.summary()
+
+
+# Instance partagée par l'agent, l'UI et l'évaluation
+TRACER = Tracer()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else TRACE_PATH
+    print(f" Résumé des spans : {path}\n")
+    for name, stats in summarize_file(path).items():
+        print(f" {name:<35} n={stats['count']:<5} p50={stats['p50_ms']:>9.1f}ms "
+              f"p95={stats['p95_ms']:>9.1f}ms  tokens={stats['prompt_tokens']}+{stats['completion_tokens']} "
+              f"cache={stats['cache_hits']} err={stats['errors']}")
@@ -0,0 +1,212 @@
+import argparse
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
+
+from mindcare_events import EMOTIONS, emotion_code
+
+# Historique de conversation compact, une instance par session Streamlit. Au lieu d'une
+# liste de HumanMessage/AIMessage (un objet pydantic + son dict + la chaîne par message),
+# chaque tour tient dans des tableaux parallèles : rôle, émotion, score, position du texte
+# dans un tampon UTF-8 propre à la session. Les messages LangChain ne sont construits qu'à
+# l'appel de l'agent, et seulement pour la fenêtre envoyée au modèle.
+
+# --- CONFIGURATION ---
+ROLES = ("user", "assistant")
+USER, ASSISTANT = 0, 1
+NO_EMOTION = 255            # Tours de l'assistant (ou pas encore classifiés)
+HISTORY_WINDOW = 40         # Messages envoyés au modèle (20 échanges, comme la reprise de session)
+INTERN_MAX_CHARS = 16       # Messages courts ("merci", "ok"...) partagés entre sessions
+INTERN_MAX_ENTRIES = 10000  # Taille max de la table partagée (au-delà : tampon de la session)
+
+
+class TextPool:
+    """Table de chaînes partagée par toutes les sessions du processus (réponses types, messages courts)."""
+
+    def __init__(self, max_entries=INTERN_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._ids = {}
+        self._texts = []
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    def intern(self, text):
+        """Identifiant de la chaîne (None si la table est pleine)."""
+        text_id = self._ids.get(text)
+        if text_id is not None:
+            self.hits += 1
+            return text_id
+        with self._lock:
+            text_id = self._ids.get(text)
+            if text_id is None:
+                if len(self._texts) >= self.max_entries:
+                    return None
+                text_id = self._ids[text] = len(self._texts)
+                self._texts.append(sys.intern(text))
+            return text_id
+
+    def __getitem__(self, text_id):
+        return self._texts[text_id]
+
+    def __len__(self):
+        return len(self._texts)
+
+    def memory_bytes(self):
+        return (sys.getsizeof(self._ids) + sys.getsizeof(self._texts)
+                + sum(sys.getsizeof(t) for t in self._texts))
+
+
+TEXT_POOL = TextPool()
+
+
+class TurnBuffer:
+    """
+    Historique d'une session. Par message : rôle (uint8), émotion (uint8, code de
+    mindcare_events), score (float32), référence (int32 : position dans le tampon UTF-8 de
+    la session, ou -(id+1) dans TEXT_POOL) et longueur (uint32) ; soit 14 octets + le texte.
+    """
+
+    __slots__ = ("_role", "_emotion", "_score", "_ref", "_length", "_text", "pool")
+
+    def __init__(self, pool=TEXT_POOL):
+        self._role = array("B")
+        self._emotion = array("B")
+        self._score = array("f")
+        self._ref = array("i")
+        self._length = array("I")
+        self._text = bytearray()
+        self.pool = pool
+
+    # --- ÉCRITURE ---
+    def append(self, role, text, emotion=None, score=0.0, shared=False):
+        """
+        Ajoute un message (role : "user" ou "assistant"). shared=True force le partage du
+        texte entre sessions (réponses types, ex : ancrage du filtre de crise).
+        """
+        text_id = self.pool.intern(text) if shared or len(text) <= INTERN_MAX_CHARS else None
+        if text_id is None:
+            data = text.encode("utf-8")
+            self._ref.append(len(self._text))
+            self._length.append(len(data))
+            self._text += data
+        else:
+            self._ref.append(-(text_id + 1))
+            self._length.append(0)
+        self._role.append(ROLES.index(role))
+        self._emotion.append(NO_EMOTION if emotion is None else emotion_code(emotion))
+        self._score.append(score)
+        return len(self._role) - 1
+
+    def set_emotion(self, index, emotion, score):
+        """Émotion d'un message déjà ajouté (la classification arrive après l'affichage)."""
+        self._emotion[index] = emotion_code(emotion)
+        self._score[index] = score
+
+    def clear(self):
+        for column in (self._role, self._emotion, self._score, self._ref, self._length):
+            del column[:]
+        self._text = bytearray()
+
+    # --- LECTURE ---
+    def __len__(self):
+        return len(self._role)
+
+    def text(self, index):
+        ref = self._ref[index]
+        if ref < 0:
+            return self.pool[-ref - 1]
+        return self._text[ref:ref + self._length[index]].decode("utf-8")
+
+    def role(self, index):
+        return ROLES[self._role[index]]
+
+    def emotion(self, index):
+        """(émotion, score) du message, ou (None, 0.0) s'il n'a pas été classifié."""
+        code = self._emotion[index]
+        return (None, 0.0) if code == NO_EMOTION else (EMOTIONS[code], self._score[index])
+
+    def __iter__(self):
+        """(rôle, texte) de chaque message, dans l'ordre (affichage du chat)."""
+        for i in range(len(self._role)):
+            yield ROLES[self._role[i]], self.text(i)
+
+    def window_messages(self, size=HISTORY_WINDOW):
+        """Les `size` derniers messages, convertis en messages LangChain à la demande."""
+        start = max(0, len(self._role) - size)
+        return [(HumanMessage if self._role[i] == USER else AIMessage)(content=self.text(i))
+                for i in range(start, len(self._role))]
+
+    def window_text(self, size=HISTORY_WINDOW):
+        """Fenêtre au format 'Human: ...\\nAI: ...' attendu par le prompt ReAct."""
+        return get_buffer_string(self.window_messages(size))
+
+    # --- MESURE ---
+    def memory_bytes(self):
+        """Octets occupés par la session (hors textes partagés, comptés dans TEXT_POOL)."""
+        return (sys.getsizeof(self._text)
+                + sum(sys.getsizeof(c) for c in (self._role, self._emotion, self._score, self._ref, self._length)))
+
+    def stats(self):
+        shared = sum(1 for ref in self._ref if ref < 0)
+        return {
+            "messages": len(self._role),
+            "memory_bytes": self.memory_bytes(),
+            "text_bytes": len(self._text),
+            "shared_messages": shared,
+        }
+
+
+def pool_stats():
+    return {"texts": len(TEXT_POOL), "hits": TEXT_POOL.hits, "memory_bytes": TEXT_POOL.memory_bytes()}
+
+
+# --- TEST RAPIDE (mémoire par session : TurnBuffer vs liste de messages LangChain) ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mémoire de l'historique : TurnBuffer vs messages LangChain.")
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--turns", type=int, default=40, help="Échanges (question + réponse) par session")
+    args = parser.parse_args()
+
+    user_texts = ["I feel so anxious about my exams tomorrow, I can't sleep.", "thanks", "ok",
+                  "My sister didn't call me back and I feel ignored, like nobody cares about me anymore."]
+    ai_text = ("I'm sorry you're going through this. It sounds exhausting to carry that worry alone. "
+               "Would you like to try a short breathing exercise together, or talk about what worries you most?")
+
+    def user_text(s, t):
+        text = user_texts[t % 4]
+        return text if len(text) <= INTERN_MAX_CHARS else f"{text} ({s}.{t})"
+
+    def build_langchain():
+        return [[m for t in range(args.turns) for m in (HumanMessage(content=user_text(s, t)),
+                                                         AIMessage(content=ai_text + f" ({s}.{t})"))]
+                for s in range(args.sessions)]
+
+    def build_turns():
+        sessions = []
+        for s in range(args.sessions):
+            buffer = TurnBuffer()
+            for t in range(args.turns):
+                buffer.append("user", user_text(s, t), "Fear", -0.5)
+                buffer.append("assistant", ai_text + f" ({s}.{t})")
+            sessions.append(buffer)
+        return sessions
+
+    for label, build in [("LangChain", build_langchain), ("TurnBuffer", build_turns)]:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        sessions = build()
+        elapsed = time.perf_counter() - t0
+        used, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f" {label:<10} : {used / args.sessions / 1024:7.1f} Ko par session "
+              f"({args.turns * 2} messages), construit en {elapsed:.2f}s")
+
+    t0 = time.perf_counter()
+    for buffer in sessions[:100]:
+        buffer.window_text()
+    print(f" window_text({HISTORY_WINDOW}) : {(time.perf_counter() - t0) / 100 * 1e6:.0f} µs")
+    print(f" {sessions[0].stats()}  pool : {pool_stats()}")
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Profil de démarrage à froid des points d'entrée. Chaque entrée est lancée dans un
+# processus neuf avec `python -X importtime` : on obtient le temps d'import de chaque
+# module (stderr) et, via MINDCARE_STARTUP_PROFILE, la durée des phases d'initialisation
+# (mindcare_startup.phase). Le résultat est comparé à un budget versionné.
+# Sans --real-backend, la base vectorielle est reconstruite localement (embeddings hachés,
+# sans clé API) pour que son chargement (tools:vector_store) soit lui aussi mesuré.
+
+# --- CONFIGURATION ---
+BUDGET_PATH = "startup_budget.json"
+HEADROOM = 1.5              # --update-budget : budget = mesure x 1.5
+TOP_IMPORTS = 15
+GUIDE_PATH = "psychology_guide.txt"
+
+# Code exécuté dans le processus fils (le premier classify force le chargement paresseux du modèle)
+ENTRY_POINTS = {
+    "mindcare_tools": "from mindcare_tools import MindCareTools; MindCareTools().classify_emotion('I feel fine')",
+    "final_agent": "import final_agent; final_agent.MINDCARE_TOOLS.classify_emotion('I feel fine')",
+    "app": "from streamlit.testing.v1 import AppTest; AppTest.from_file('app.py', default_timeout=300).run()",
+}
+
+
+def parse_importtime(stderr):
+    """
+    Lignes 'import time: self [us] | cumulative | imported package' -> {module: (self_s, cumul_s)}.
+    Un paquet de premier niveau (ex: 'langchain_core') regroupe ses sous-modules.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return modules
+
+
+def top_level_imports(modules):
+    """Temps propre cumulé par paquet de premier niveau (somme des 'self' : pas de double compte)."""
+    packages = defaultdict(float)
+    for name, (self_s, _) in modules.items():
+        packages[name.split(".")[0]] += self_s
+    return dict(sorted(packages.items(), key=lambda kv: -kv[1]))
+
+
+def build_local_vectorstore(path, guide_path=GUIDE_PATH):
+    """Index FAISS du manuel avec les embeddings locaux (même découpage que build_rag.py)."""
+    from langchain_community.vectorstores import FAISS
+    from langchain_text_splitters import CharacterTextSplitter
+    from mindcare_tools import HashingEmbeddings
+
+    with open(guide_path, encoding="utf-8") as f:
+        chunks = CharacterTextSplitter(chunk_size=500, chunk_overlap=50).split_text(f.read())
+    FAISS.from_texts(chunks, HashingEmbeddings()).save_local(path)
+
+
+def profile_entry(name, code, real_backend=False):
+    """Lance l'entrée dans un processus neuf et retourne son profil."""
+    env = dict(os.environ)
+    if not real_backend:
+        # Faux LLM local : mesure le code de démarrage, pas le réseau
+        env.setdefault("MINDCARE_LLM_BACKEND", "fake")
+        env.setdefault("MINDCARE_LLM_CACHE", "0")
+    with tempfile.TemporaryDirectory(prefix="mindcare-startup-") as workdir:
+        phases_path = os.path.join(workdir, "phases.json")
+        env["MINDCARE_STARTUP_PROFILE"] = phases_path
+        env.setdefault("MINDCARE_SESSIONS_PATH", os.path.join(workdir, "sessions.sqlite"))
+        if not real_backend:
+            vectorstore_path = os.path.join(workdir, "vectorstore")
+            build_local_vectorstore(vectorstore_path)
+            env["MINDCARE_VECTORSTORE_PATH"] = vectorstore_path
+            env["MINDCARE_EMBEDDINGS"] = "hashing"
+
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        wall_s = time.perf_counter() - t0
+        if proc.returncode != 0:
+            tail = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-2000:]
+            raise RuntimeError(f"{name} a échoué (code {proc.returncode}) :\n{tail}")
+        with open(phases_path, encoding="utf-8") as f:
+            phases = json.load(f)["phases"]
+
+    modules = parse_importtime(proc.stderr)
+    durations = defaultdict(float)
+    for record in phases:
+        durations[record["phase"]] += record["duration_s"]
+
+    packages = top_level_imports(modules)
+    return {
+        "wall_s": round(wall_s, 3),
+        "imports_s": round(sum(self_s for self_s, _ in modules.values()), 3),
+        "modules_imported": len(modules),
+        "phases": {k: round(v, 3) for k, v in durations.items()},
+        "top_imports": {k: round(v, 3) for k, v in list(packages.items())[:TOP_IMPORTS]},
+    }
+
+
+def check_budget(report, budget):
+    """
+    Dépassements du budget (vide = OK). Seuls les postes présents dans le budget sont vérifiés ;
+    une phase budgétée qui n'a pas tourné est une erreur (sa régression passerait inaperçue).
+    """
+    failures = []
+    for entry, measured in report["entries"].items():
+        limits = budget.get("entries", {}).get(entry)
+        if limits is None:
+            continue
+        for key in ("wall_s", "imports_s"):
+            if key in limits and measured[key] > limits[key]:
+                failures.append(f"[{entry}] {key} = {measured[key]}s > budget {limits[key]}s")
+        for phase_name, limit in limits.get("phases", {}).items():
+            value = measured["phases"].get(phase_name)
+            if value is None:
+                failures.append(f"[{entry}] phase {phase_name} absente de la mesure (budget {limit}s)")
+            elif value > limit:
+                failures.append(f"[{entry}] phase {phase_name} = {value}s > budget {limit}s")
+    return failures
+
+
+def make_budget(report, headroom=HEADROOM):
+    """Budget à partir d'une mesure : marge multiplicative, plancher de 50 ms par poste."""
+    def limit(value):
+        return round(max(value * headroom, 0.05), 3)
+
+    return {
+        "headroom": headroom,
+        "python": sys.version.split()[0],
+        "entries": {
+            entry: {
+                "wall_s": limit(measured["wall_s"]),
+                "imports_s": limit(measured["imports_s"]),
+                "phases": {name: limit(v) for name, v in measured["phases"].items()},
+            }
+            for entry, measured in report["entries"].items()
+        },
+    }
+
+
+def print_report(report):
+    for entry, measured in report["entries"].items():
+        print(f"\n --- {entry} : {measured['wall_s']}s au total, dont {measured['imports_s']}s d'imports "
+              f"({measured['modules_imported']} modules) ---")
+        print(" Phases :")
+        for name, value in sorted(measured["phases"].items(), key=lambda kv: -kv[1]):
+            print(f"   {name:<24} {value:7.3f}s")
+        print(" Imports les plus coûteux (temps propre, par paquet) :")
+        for name, value in measured["top_imports"].items():
+            print(f"   {name:<24} {value:7.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profil de démarrage à froid (imports + phases) et budget.")
+    parser.add_argument("--entries", default=",".join(ENTRY_POINTS), help="Points d'entrée (ex: mindcare_tools,app)")
+    parser.add_argument("--runs", type=int, default=3, help="Lancements par entrée (la médiane est retenue)")
+    parser.add_argument("--real-backend", action="store_true", help="Vrai LLM Mistral (réseau) au lieu du faux local")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--update-budget", action="store_true", help="Enregistre cette mesure (avec marge) comme budget")
+    parser.add_argument("--headroom", type=float, default=HEADROOM)
+    parser.add_argument("--out", default=None, help="Rapport JSON de ce run (optionnel)")
+    args = parser.parse_args()
+    entries = args.entries.split(",")
+    unknown = [entry for entry in entries if entry not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"--entries : inconnu(s) {', '.join(unknown)} (choix : {', '.join(ENTRY_POINTS)})")
+
+    report = {"python": sys.version.split()[0], "runs": args.runs, "entries": {}}
+    for entry in entries:
+        runs = [profile_entry(entry, ENTRY_POINTS[entry], args.real_backend) for _ in range(args.runs)]
+        # Médiane sur la durée totale : un lancement perturbé (cache disque froid) ne fausse pas le budget
+        report["entries"][entry] = sorted(runs, key=lambda r: r["wall_s"])[len(runs) // 2]
+    print_report(report)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.update_budget:
+        with open(args.budget, "w", encoding="utf-8") as f:
+            json.dump(make_budget(report, args.headroom), f, indent=2, ensure_ascii=False)
+        print(f"\n Budget mis à jour : {args.budget}")
+        sys.exit(0)
+
+    if not os.path.exists(args.budget):
+        print(f"\n Pas de budget ({args.budget}) : relancez avec --update-budget.")
+        sys.exit(1)
+
+    with open(args.budget, encoding="utf-8") as f:
+        budget = json.load(f)
+    failures = check_budget(report, budget)
+    if failures:
+        print("\n BUDGET DE DÉMARRAGE DÉPASSÉ :")
+        for failure in failures:
+            print(f"   - {failure}")
+        sys.exit(1)
+    print("\n Démarrage dans le budget.")